@@ -0,0 +1,34 @@
+"""
+ASGI config for app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with any ASGI server, e.g.::
+
+    uvicorn app.asgi:application
+
+The event loop handles the connections while the Django application runs
+in a pool of ``ASGI_THREADS`` threads, see core.asgi.WsgiToAsgi. The change
+events of /api/recipe/events/ are streamed by the event loop itself, see
+recipe.events.EventStream.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+wsgi_application = get_wsgi_application()
+
+# imported once Django is set up
+from core.asgi import WsgiToAsgi  # noqa: E402
+from recipe.events import EventStream  # noqa: E402
+
+application = EventStream(
+    WsgiToAsgi(
+        wsgi_application,
+        max_workers=int(os.environ.get('ASGI_THREADS', 10)),
+    ),
+    reverse('recipe:events'),
+)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -30,8 +31,14 @@ ALLOWED_HOSTS = []
 
 # Application definition
 
+# Lean startup doesn't import the admin modules of the apps during setup.
+# They are loaded by the URLconf instead, which management commands and job
+# workers don't need. Enable with DJANGO_LEAN_STARTUP=1
+LEAN_STARTUP = os.environ.get('DJANGO_LEAN_STARTUP') == '1'
+
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig' if LEAN_STARTUP
+    else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -42,9 +49,12 @@ INSTALLED_APPS = [
     'core',
     'user',
     'recipe',
+    'job',
+    'batch',
 ]
 
 MIDDLEWARE = [
+    'core.sharding.ShardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.querylog.QueryLogMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -88,6 +99,41 @@ DATABASES = {
     }
 }
 
+# User sharding, see core.sharding. Users and their recipes are spread over
+# the databases in SHARDS, the directory of who lives where is kept in the
+# default one. DB_SHARDS names the databases besides the default one, on
+# the same server
+SHARDS = ['default'] + [
+    name for name in os.environ.get('DB_SHARDS', '').split(',') if name
+]
+for name in SHARDS[1:]:
+    DATABASES[name] = dict(DATABASES['default'], NAME=name)
+
+if len(SHARDS) > 1:
+    DATABASE_ROUTERS = ['core.sharding.ShardRouter']
+    AUTHENTICATION_BACKENDS = ['core.backends.ShardedModelBackend']
+
+# Seconds each process caches the shard of a user, which is also how long
+# moving a user has to wait for the other processes to see the move
+SHARD_DIRECTORY_TTL = 60
+# Number of users whose shard each process caches
+SHARD_DIRECTORY_SIZE = 100000
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# The token checks of core.authentication rely on a cache shared by all
+# processes, point CACHE_LOCATION at a memcached server for that. Without
+# it each process caches on its own, which only suits a single process
+if os.environ.get('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ['CACHE_LOCATION'],
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -127,4 +173,78 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Uploaded recipe images, see core.media
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+# Whether Django serves MEDIA_ROOT itself, to anyone. In production the web
+# server in front of it should
+SERVE_MEDIA = DEBUG or os.environ.get('SERVE_MEDIA') == '1'
+# Largest image that can be uploaded, in bytes
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+# Thumbnails made of each image, by the size of their longest side
+RECIPE_THUMBNAIL_SIZES = [128, 512]
+
 AUTH_USER_MODEL = 'core.User'
+
+# Request profiling, see core.profiling
+# Share of requests to profile, e.g. 0.01 for one in a hundred. Staff users
+# can also ask for a profile of any request with the X-Profile: 1 header
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+# Number of profiles kept, older ones are deleted
+PROFILER_MAX_PROFILES = 100
+# Queries taking longer than this many milliseconds are EXPLAINed
+PROFILER_SLOW_QUERY_MS = 100
+
+# Query statistics, see core.querylog
+# Apps whose requests are recorded, by URL namespace
+QUERY_LOG_APPS = ['recipe', 'user']
+# Queries taking longer than this many milliseconds are logged with their plan
+QUERY_LOG_SLOW_MS = float(os.environ.get('QUERY_LOG_SLOW_MS', 200))
+# How often each process writes its statistics to the database
+QUERY_LOG_FLUSH_SECONDS = 60
+
+# Expiring API tokens, see core.authentication
+# Tokens expire when they haven't been used for this long
+AUTH_TOKEN_TTL = timedelta(days=int(os.environ.get('AUTH_TOKEN_TTL_DAYS', 14)))
+# Expiry is pushed back at most this often, to save a write per request
+AUTH_TOKEN_REFRESH = timedelta(hours=1)
+
+# Lifetime of the signed tokens, see core.authentication
+ACCESS_TOKEN_TTL = timedelta(minutes=5)
+REFRESH_TOKEN_TTL = timedelta(days=30)
+# How long the token version of a user is cached for checking access
+# tokens. Used refresh tokens are remembered in the cache as well, so it
+# has to be shared by all processes, see CACHE_LOCATION
+TOKEN_VERSION_CACHE_TTL = timedelta(minutes=5)
+
+# Number of users whose recipe match index is kept in memory by each
+# process, see recipe.matching
+MATCH_INDEX_MAX_USERS = 100
+
+# Shopping lists, see recipe.shopping
+# Most recipes a list can be made of
+SHOPPING_LIST_MAX_RECIPES = 500
+# Lists are cached under the user's latest change, so they don't go stale
+# and only expire to free the cache
+SHOPPING_LIST_CACHE_SECONDS = 60 * 60
+
+# Change events, see recipe.events
+# Seconds between the keepalive comments of idle streams, and between the
+# checks that the credentials of a stream are still valid
+EVENTS_KEEPALIVE_SECONDS = 15
+# Without ASGI each stream polls the Change log this often and ends after
+# EVENTS_MAX_SECONDS, since it holds a thread
+EVENTS_POLL_SECONDS = 2
+EVENTS_MAX_SECONDS = 300
+
+# Background jobs, see core.tasks
+# Workers lease the job they run for JOB_LEASE and renew the lease every
+# JOB_HEARTBEAT for as long as it runs. Jobs whose lease ran out lost their
+# worker and are queued again, until they were attempted JOB_MAX_ATTEMPTS
+# times
+JOB_LEASE = timedelta(minutes=5)
+JOB_HEARTBEAT = timedelta(minutes=1)
+JOB_MAX_ATTEMPTS = 3
+
+# Most requests a client may send in one batch, see batch.views
+BATCH_MAX_REQUESTS = 20
@@ -0,0 +1,20 @@
+"""Settings that spread the users over three SQLite databases, for trying
+out user sharding locally. The rest of the test suite expects a single
+database, run the sharding tests with:
+
+    python manage.py test core.tests.test_sharding \
+        --settings=app.settings_shards
+"""
+from app.settings import *  # noqa: F401,F403
+from app.settings import BASE_DIR, os
+
+SHARDS = ['default', 'shard1', 'shard2']
+DATABASES = {
+    name: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, '{}.sqlite3'.format(name)),
+    }
+    for name in SHARDS
+}
+DATABASE_ROUTERS = ['core.sharding.ShardRouter']
+AUTHENTICATION_BACKENDS = ['core.backends.ShardedModelBackend']
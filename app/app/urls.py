@@ -13,11 +13,25 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from core import media
+
+if settings.LEAN_STARTUP:
+    # the admin modules weren't loaded during setup
+    admin.autodiscover()
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
-    path('api/recipe/', include('recipe.urls'))
+    path('api/recipe/', include('recipe.urls')),
+    path('api/job/', include('job.urls')),
+    path('api/batch/', include('batch.urls')),
 ]
+
+if settings.SERVE_MEDIA:
+    urlpatterns.append(
+        path(settings.MEDIA_URL.lstrip('/') + '<path:path>', media.serve)
+    )
@@ -0,0 +1,31 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Serializer for one request of a batch"""
+    method = serializers.ChoiceField(
+        choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+    )
+    # path of the API endpoint, optionally with a query string
+    path = serializers.RegexField(r'^/api/')
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a batch of API requests"""
+    requests = SubRequestSerializer(many=True)
+    # run all requests in one transaction, which is rolled back if any of
+    # them fails
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if not value:
+            raise serializers.ValidationError('No requests given')
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                'At most {} requests per batch'.format(
+                    settings.BATCH_MAX_REQUESTS
+                )
+            )
+        return value
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import AuthToken, Tag
+
+
+BATCH_URL = reverse('batch:batch')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+SYNC_URL = reverse('recipe:sync')
+
+
+def get(path):
+    return {'method': 'GET', 'path': path}
+
+
+class PublicBatchAPITests(TestCase):
+    """Test unauthenticated batch API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().post(BATCH_URL, {'requests': [get(ME_URL)]},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchAPITests(TestCase):
+    """Test running batches of requests"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass',
+            name='Test'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        key, _ = AuthToken.objects.rotate(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+
+    def batch(self, requests, **params):
+        return self.client.post(BATCH_URL, dict(params, requests=requests),
+                                format='json')
+
+    def test_startup_batch(self):
+        """Test the requests are run and answered in order"""
+        res = self.batch([get(ME_URL), get(TAGS_URL),
+                          get(INGREDIENTS_URL), get(RECIPES_URL)])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        responses = res.data['responses']
+        self.assertEqual([r['status'] for r in responses], [200] * 4)
+        self.assertEqual(responses[0]['body']['email'], 'test@test.com')
+        self.assertEqual(responses[1]['body'][0]['name'], 'Vegan')
+        self.assertEqual(responses[2]['body'], [])
+
+    def test_authenticated_once(self):
+        """Test the token is only looked up for the batch itself"""
+        with CaptureQueriesContext(connection) as queries:
+            self.batch([get(ME_URL), get(TAGS_URL), get(RECIPES_URL)])
+
+        lookups = [q for q in queries if 'core_authtoken' in q['sql']]
+        self.assertEqual(len(lookups), 1)
+
+    def test_query_string_and_body(self):
+        """Test query strings and bodies reach the views"""
+        res = self.batch([
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Keto'}},
+            get(SYNC_URL + '?since=v0.1000'),
+        ])
+
+        responses = res.data['responses']
+        self.assertEqual(responses[0]['status'], status.HTTP_201_CREATED)
+        self.assertTrue(Tag.objects.filter(user=self.user,
+                                           name='Keto').exists())
+        # a sync without the cursor would have been a full one
+        self.assertFalse(responses[1]['body']['full'])
+
+    def test_failures_isolated(self):
+        """Test failed requests don't affect the others"""
+        res = self.batch([
+            get('/api/nothing/'),
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': ''}},
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Keto'}},
+        ])
+
+        self.assertEqual([r['status'] for r in res.data['responses']],
+                         [404, 400, 201])
+        self.assertTrue(Tag.objects.filter(name='Keto').exists())
+
+    def test_atomic_batch_rolled_back(self):
+        """Test an atomic batch is undone when a request fails"""
+        res = self.batch([
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Keto'}},
+            {'method': 'POST', 'path': RECIPES_URL, 'body': {'title': ''}},
+            get(TAGS_URL),
+        ], atomic=True)
+
+        self.assertEqual([r['status'] for r in res.data['responses']],
+                         [201, 400, 424])
+        self.assertFalse(Tag.objects.filter(name='Keto').exists())
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_batch_size_limited(self):
+        """Test batches above the limit are rejected"""
+        res = self.batch([get(ME_URL)] * 3)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nested_batch_rejected(self):
+        """Test batches can't contain batches"""
+        res = self.batch([{'method': 'POST', 'path': BATCH_URL,
+                           'body': {'requests': [get(ME_URL)]}}])
+
+        self.assertEqual(res.data['responses'][0]['status'],
+                         status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from batch import views
+
+
+app_name = 'batch'
+
+urlpatterns = [
+    path('', views.BatchView.as_view(), name='batch'),
+]
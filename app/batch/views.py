@@ -0,0 +1,99 @@
+import io
+import json
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.urls import Resolver404, resolve
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from batch.serializers import BatchSerializer
+from core import sharding
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication
+
+
+class BatchView(APIView):
+    """Run several API requests in one round trip.
+
+    The batch is authenticated once and its requests go straight to their
+    views, without the middleware, on the connection of the batch. Each
+    request gets its own response, failed requests don't stop the others
+    unless the batch is atomic"""
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requests = serializer.validated_data['requests']
+
+        if not serializer.validated_data['atomic']:
+            return Response({
+                'responses': [self.run(request, sub) for sub in requests]
+            })
+
+        using = sharding.current() or DEFAULT_DB_ALIAS
+        responses = []
+        with transaction.atomic(using=using):
+            for sub in requests:
+                if responses and responses[-1]['status'] >= 400:
+                    responses.append(self.error(
+                        status.HTTP_424_FAILED_DEPENDENCY,
+                        _('Not run, an earlier request failed.'),
+                    ))
+                    continue
+
+                responses.append(self.run(request, sub))
+                if responses[-1]['status'] >= 400:
+                    transaction.set_rollback(True, using=using)
+
+        return Response({'responses': responses})
+
+    def run(self, request, sub):
+        """Run one request of the batch as the user of the batch"""
+        url = urlsplit(sub['path'])
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return self.error(status.HTTP_404_NOT_FOUND, _('Not found.'))
+        if getattr(match.func, 'view_class', None) is type(self):
+            return self.error(status.HTTP_400_BAD_REQUEST,
+                              _('Batches can not be nested.'))
+
+        body = b''
+        if 'body' in sub:
+            body = json.dumps(sub['body']).encode()
+        environ = dict(
+            request.META,
+            REQUEST_METHOD=sub['method'],
+            PATH_INFO=url.path,
+            QUERY_STRING=url.query,
+            CONTENT_TYPE='application/json',
+            CONTENT_LENGTH=str(len(body)),
+        )
+        environ['wsgi.input'] = io.BytesIO(body)
+        sub_request = WSGIRequest(environ)
+        sub_request.resolver_match = match
+        # DRF skips authentication for requests with a forced user
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if response.streaming:
+            return self.error(status.HTTP_400_BAD_REQUEST,
+                              _('Streams can not be batched.'))
+        if hasattr(response, 'data'):
+            data = response.data
+        else:
+            data = response.content.decode()
+        return {'status': response.status_code, 'body': data}
+
+    def error(self, status_code, detail):
+        return {'status': status_code, 'body': {'detail': detail}}
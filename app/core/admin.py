@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
 # importing the default django user admin and change class variables to
 # support custom user admin
@@ -9,7 +13,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 # languages
 from django.utils.translation import gettext as _
 
-from core import models
+from core import deletion, models
 
 
 class UserAdmin(BaseUserAdmin):
@@ -33,8 +37,145 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_deleted_objects(self, objs, request):
+        """Summarize what deleting the users removes with a count per model
+        instead of loading every related object to list it"""
+        model_count = {}
+        perms_needed = set()
+        for user in objs:
+            for model, count in deletion.count_owned(user).items():
+                opts = model._meta
+                model_count[opts.verbose_name_plural] = (
+                    model_count.get(opts.verbose_name_plural, 0) + count
+                )
+                codename = '{}.delete_{}'.format(opts.app_label,
+                                                 opts.model_name)
+                if not opts.auto_created and count and \
+                        not request.user.has_perm(codename):
+                    perms_needed.add(opts.verbose_name)
+
+        deleted_objects = [str(user) for user in objs]
+        model_count[self.opts.verbose_name_plural] = len(deleted_objects)
+
+        return deleted_objects, model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        """Delete the user using the chunked deletion path"""
+        deletion.delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        """Delete the selected users using the chunked deletion path"""
+        for user in queryset:
+            deletion.delete_user(user)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that counts unfiltered Postgres tables with the planner's
+    row estimate instead of a COUNT(*) that has to scan the whole table.
+    The rows of partitioned tables, see core.partitioning, are added up
+    from their partitions. Autovacuum keeps those estimates current, but
+    never analyzes the partitioned table itself"""
+
+    # tables estimated to be smaller than this are still counted exactly
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                # unknown estimates are -1 since PostgreSQL 14
+                # since PostgreSQL 14 a manual ANALYZE estimates the
+                # partitioned table as well, which would count twice
+                cursor.execute(
+                    "SELECT SUM(GREATEST(reltuples, 0)) FROM pg_class "
+                    "WHERE relkind <> 'p' AND (oid = %s::regclass OR oid IN ("
+                    "SELECT inhrelid FROM pg_inherits "
+                    "WHERE inhparent = %s::regclass))",
+                    [queryset.model._meta.db_table] * 2,
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.exact_count_threshold:
+                return int(row[0])
+
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Admin for tables that grow with the number of users"""
+    paginator = EstimatedCountPaginator
+    # don't count the whole table again when the changelist is filtered
+    show_full_result_count = False
+    list_select_related = ('user', )
+    raw_id_fields = ('user', )
+    # subclasses search by prefix ('^'), which the UPPER() indexes of
+    # migration 0022 serve. A substring search would read every row
+
+
+class TagAdmin(LargeTableAdmin):
+    list_display = ['name', 'user']
+    search_fields = ['^name']
+
+
+class IngredientAdmin(LargeTableAdmin):
+    list_display = ['name', 'user']
+    search_fields = ['^name']
+
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ['title', 'user', 'time_minutes', 'price']
+    search_fields = ['^title']
+    # select widgets would render every tag and ingredient in the database
+    autocomplete_fields = ['tags', 'ingredients']
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Read only view of the stored request profiles"""
+    list_display = ['created_at', 'method', 'path', 'status_code',
+                    'duration_ms', 'query_count', 'query_time_ms', 'user']
+    list_filter = ['method', 'status_code']
+    list_select_related = ('user', )
+    search_fields = ['path']
+    ordering = ['-id']
+    fields = ['created_at', 'user', 'method', 'path', 'status_code',
+              'duration_ms', 'query_count', 'query_time_ms',
+              'formatted_queries', 'formatted_stats']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def formatted_queries(self, obj):
+        return format_html('<pre>{}</pre>', obj.queries)
+    formatted_queries.short_description = _('Queries')
+
+    def formatted_stats(self, obj):
+        return format_html('<pre>{}</pre>', obj.stats)
+    formatted_stats.short_description = _('Profile')
+
+
+class QueryFingerprintAdmin(admin.ModelAdmin):
+    """Read only view of the recorded query statistics"""
+    list_display = ['query', 'app', 'count', 'total_ms', 'max_ms',
+                    'last_seen']
+    list_filter = ['app']
+    search_fields = ['query']
+    ordering = ['-total_ms']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.RequestProfile, RequestProfileAdmin)
+admin.site.register(models.QueryFingerprint, QueryFingerprintAdmin)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # connect the signal receivers that keep derived data up to date
+        from core import signals  # noqa: F401
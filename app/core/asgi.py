@@ -0,0 +1,216 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class ReceiveStream:
+    """wsgi.input of a request body too large to be read in advance. The
+    thread running the application reads it from the ASGI receive channel
+    as it goes, so no more than a message is held in memory"""
+
+    def __init__(self, loop, receive):
+        self.loop = loop
+        self.receive = receive
+        self.buffer = bytearray()
+        self.more_body = True
+
+    def _receive(self):
+        message = asyncio.run_coroutine_threadsafe(
+            self.receive(), self.loop
+        ).result()
+        if message['type'] == 'http.disconnect':
+            # Django turns this into an UnreadablePostError
+            raise IOError('Client disconnected')
+        self.buffer += message.get('body', b'')
+        self.more_body = message.get('more_body', False)
+
+    def read(self, size=-1):
+        while self.more_body and (size is None or size < 0 or
+                                  len(self.buffer) < size):
+            self._receive()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class WsgiToAsgi:
+    """Serve a WSGI application to an ASGI server.
+
+    Django 2.1 has no async views, but most of the time a request spends in
+    a sync worker is waiting for slow clients to send the request and read
+    the response. Here the event loop does all of the network I/O and only
+    hands the complete request to a bounded thread pool, so a single
+    process keeps thousands of connections open while at most
+    `max_workers` threads run views and talk to the database.
+
+    Only bodies up to DATA_UPLOAD_MAX_MEMORY_SIZE are read in advance.
+    Larger ones announced by their Content-Length, e.g. image uploads, are
+    streamed to the application by a ReceiveStream, and larger ones sent
+    without it are refused"""
+
+    def __init__(self, wsgi_application, max_workers=10):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported scope type {}'.format(scope['type']))
+
+    async def lifespan(self, receive, send):
+        """Acknowledge the server's startup and shutdown messages"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        """Read the request, run the WSGI application in the thread pool
+        and send its response"""
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        length = self.content_length(scope)
+        loop = asyncio.get_event_loop()
+        if limit is not None and length is not None and length > limit:
+            environ = self.environ(scope, ReceiveStream(loop, receive),
+                                   length)
+        else:
+            body = bytearray()
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body += message.get('body', b'')
+                more_body = message.get('more_body', False)
+                if limit is not None and len(body) > limit:
+                    await self.refuse(send)
+                    return
+            environ = self.environ(scope, io.BytesIO(body), len(body))
+
+        status, headers, chunks = await loop.run_in_executor(
+            self.executor, self.run, environ,
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+
+        if isinstance(chunks, list):
+            await send({'type': 'http.response.body',
+                        'body': b''.join(chunks)})
+            return
+
+        # streaming responses are produced chunk by chunk in the pool
+        try:
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, next, chunks, None
+                )
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+    async def refuse(self, send):
+        """Answer a request whose body is too large to be read in advance"""
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body',
+                    'body': b'Request body too large'})
+
+    def content_length(self, scope):
+        """Return the Content-Length of the request, None if it has none"""
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length':
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    def run(self, environ):
+        """Call the WSGI application. Regular responses are read and closed
+        in the same thread, which also closes its database connection"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ]
+
+        iterable = self.wsgi_application(environ, start_response)
+        if getattr(iterable, 'streaming', False):
+            return response['status'], response['headers'], iter(iterable)
+
+        try:
+            chunks = list(iterable)
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+        return response['status'], response['headers'], chunks
+
+    def environ(self, scope, stream, length):
+        """Build the WSGI environ for an ASGI http scope with its body read
+        from `stream`"""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(
+                scope.get('http_version', '1.1')
+            ),
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': stream,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = 'HTTP_' + name
+            if key in environ:
+                value = environ[key] + ',' + value
+            environ[key] = value
+
+        return environ
@@ -0,0 +1,167 @@
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, \
+                                          TokenAuthentication, \
+                                          get_authorization_header
+
+from core import sharding
+from core.models import AuthToken, hash_token, token_version_key
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication against the hashed, expiring AuthToken keys.
+
+    Clients send `Authorization: Token <key>` like before. Every use of a
+    token moves its expiry to AUTH_TOKEN_TTL from now, but at most once per
+    AUTH_TOKEN_REFRESH so that most requests only read the token row"""
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        if sharding.enabled():
+            # sharded keys start with the id of their user
+            user_id = key.partition('.')[0]
+            if not user_id.isdigit() or \
+                    not sharding.activate_user(int(user_id)):
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        try:
+            token = AuthToken.objects.select_related('user').get(
+                digest=hash_token(key)
+            )
+        except AuthToken.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        now = timezone.now()
+        if token.expires <= now:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        expires = now + settings.AUTH_TOKEN_TTL
+        if expires - token.expires >= settings.AUTH_TOKEN_REFRESH:
+            AuthToken.objects.filter(pk=token.pk).update(expires=expires)
+            token.expires = expires
+
+        return token.user, token
+
+
+ACCESS_SALT = 'core.authentication.access'
+REFRESH_SALT = 'core.authentication.refresh'
+
+
+def issue_signed_tokens(user):
+    """Return a short lived access token and a refresh token for the user.
+    Both are signed with SECRET_KEY and carry the user's token version, the
+    refresh token also an id that makes it single use"""
+    claims = {'u': user.pk, 'v': user.token_version}
+    return {
+        'access': signing.dumps(dict(claims, s=user.is_staff),
+                                salt=ACCESS_SALT, compress=True),
+        'refresh': signing.dumps(dict(claims, r=secrets.token_urlsafe(12)),
+                                 salt=REFRESH_SALT, compress=True),
+        'expires_in': int(settings.ACCESS_TOKEN_TTL.total_seconds()),
+    }
+
+
+def refresh_signed_tokens(refresh):
+    """Return new tokens for a refresh token that is still valid and wasn't
+    used before. A refresh token used twice was copied, so all of the
+    user's tokens are revoked then"""
+    try:
+        claims = signing.loads(refresh, salt=REFRESH_SALT,
+                               max_age=settings.REFRESH_TOKEN_TTL)
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed(_('Invalid refresh token.'))
+
+    if not sharding.activate_user(claims['u']) or 'r' not in claims:
+        raise exceptions.AuthenticationFailed(_('Refresh token revoked.'))
+    user = get_user_model().objects.filter(
+        pk=claims['u'], token_version=claims['v'], is_active=True
+    ).first()
+    if user is None:
+        raise exceptions.AuthenticationFailed(_('Refresh token revoked.'))
+
+    # the id is kept for as long as the token could be used
+    if not cache.add('refresh-token-used:{}'.format(claims['r']), True,
+                     settings.REFRESH_TOKEN_TTL.total_seconds()):
+        user.revoke_signed_tokens()
+        raise exceptions.AuthenticationFailed(_('Refresh token revoked.'))
+
+    return issue_signed_tokens(user)
+
+
+def token_version(user_id):
+    """Return the token version of the user, None when they are inactive or
+    deleted. The version is cached for TOKEN_VERSION_CACHE_TTL, and the
+    cached entry is dropped whenever the version is bumped or the user is
+    saved or deleted. The cache is shared by all processes, see
+    CACHE_LOCATION, so that they all see the drop"""
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = get_user_model().objects.filter(
+            pk=user_id, is_active=True
+        ).values_list('token_version', flat=True).first()
+        # -1 stands for users that can't authenticate
+        version = -1 if version is None else version
+        cache.set(key, version,
+                  settings.TOKEN_VERSION_CACHE_TTL.total_seconds())
+    return None if version < 0 else version
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authentication with the signed access tokens of issue_signed_tokens,
+    sent as `Authorization: Bearer <token>`.
+
+    The token is verified against the cached token version of its user, so
+    most requests don't touch the database. Revoking the tokens and
+    deactivating or deleting the user drop the cached version and take
+    effect right away. The user is a deferred instance holding the id and
+    staff flag of the token, the rest of its fields are loaded when
+    accessed"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header.')
+            )
+
+        try:
+            claims = signing.loads(auth[1].decode(), salt=ACCESS_SALT,
+                                   max_age=settings.ACCESS_TOKEN_TTL)
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not sharding.activate_user(claims['u']):
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        version = token_version(claims['u'])
+        if version is None:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        if version != claims['v']:
+            raise exceptions.AuthenticationFailed(_('Token revoked.'))
+        user = get_user_model().from_db(
+            sharding.current(),
+            ['id', 'is_active', 'is_staff', 'token_version'],
+            [claims['u'], True, claims['s'], claims['v']],
+        )
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
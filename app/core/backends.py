@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from core import sharding
+
+
+class ShardedModelBackend(ModelBackend):
+    """Authenticates against the shard of the user and activates it for
+    the rest of the request"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        alias = sharding.shard_for_email(username)
+        if alias is not None:
+            sharding.activate(alias)
+        return super().authenticate(request, username, password, **kwargs)
+
+    def get_user(self, user_id):
+        if not sharding.activate_user(user_id):
+            return None
+        return super().get_user(user_id)
@@ -0,0 +1,92 @@
+import random
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import counters
+from core.models import Tag, Ingredient, Recipe
+
+
+BATCH_SIZE = 5000
+
+
+def seed_user(recipes, tags=20, ingredients=100, per_recipe=5, seed=0):
+    """Create a throwaway user with the given number of recipes, each one
+    linked to `per_recipe` random tags and ingredients. Used by the
+    benchmark commands to build realistic recipe books quickly"""
+    rng = random.Random(seed)
+    user = get_user_model().objects.create_user(
+        'bench-{}@example.com'.format(uuid.uuid4().hex), 'benchpass'
+    )
+
+    with transaction.atomic(using=Recipe.objects.db):
+        Tag.objects.bulk_create(
+            [Tag(user=user, name='tag {}'.format(i)) for i in range(tags)]
+        )
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name='ingredient {}'.format(i))
+            for i in range(ingredients)
+        ])
+        tag_ids = list(
+            Tag.objects.filter(user=user).values_list('id', flat=True)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.filter(user=user).values_list('id', flat=True)
+        )
+
+        for start in range(0, recipes, BATCH_SIZE):
+            count = min(BATCH_SIZE, recipes - start)
+            Recipe.objects.bulk_create([
+                Recipe(
+                    user=user,
+                    title='recipe {}'.format(start + i),
+                    time_minutes=rng.randint(1, 240),
+                    price='{:.2f}'.format(rng.uniform(1, 100)),
+                )
+                for i in range(count)
+            ])
+
+        recipe_ids = list(
+            Recipe.objects.filter(user=user).values_list('id', flat=True)
+        )
+        _link(Recipe.tags.through, 'tag_id', recipe_ids, tag_ids,
+              per_recipe, rng)
+        _link(Recipe.ingredients.through, 'ingredient_id', recipe_ids,
+              ingredient_ids, per_recipe, rng)
+        # the links were inserted without signals
+        counters.reconcile(Tag.objects.filter(user=user))
+        counters.reconcile(Ingredient.objects.filter(user=user))
+
+    return user
+
+
+def _link(through, column, recipe_ids, target_ids, per_recipe, rng):
+    """Bulk insert M2M rows linking each recipe to random targets"""
+    per_recipe = min(per_recipe, len(target_ids))
+    rows = []
+    for recipe_id in recipe_ids:
+        for target_id in rng.sample(target_ids, per_recipe):
+            rows.append(through(recipe_id=recipe_id, **{column: target_id}))
+        if len(rows) >= BATCH_SIZE:
+            through.objects.bulk_create(rows)
+            rows = []
+    through.objects.bulk_create(rows)
+
+
+@contextmanager
+def measure():
+    """Measure wall time and peak Python memory of the enclosed block.
+    Yields a dict that holds `seconds` and `peak_mb` once the block exits"""
+    stats = {}
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['seconds'] = time.perf_counter() - started
+        stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
@@ -0,0 +1,52 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Tag, Ingredient, Recipe
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def linked(model):
+    """Return the M2M table linking recipes to the tags or ingredients and
+    its column for them"""
+    field = {Tag: 'tags', Ingredient: 'ingredients'}[model]
+    return getattr(Recipe, field).through, model._meta.model_name
+
+
+def actual_count(through, column):
+    """Return an expression counting the rows of the M2M table that link
+    the tag or ingredient of the outer query to a recipe"""
+    return Coalesce(Subquery(
+        through.objects.filter(
+            **{column: OuterRef('pk')}
+        ).order_by().values(column).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def reconcile(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Correct the recipe_count of the tags or ingredients in the queryset
+    that drifted from the M2M table, e.g. because links were written in
+    bulk. Works in chunks so no long running statement locks them all.
+    Returns the number of objects corrected"""
+    model = queryset.model
+    actual = actual_count(*linked(model))
+    manager = model._base_manager.using(queryset.db)
+    last_id = 0
+    corrected = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id')
+                   .values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return corrected
+
+        wrong = list(manager.filter(id__in=ids).annotate(
+            actual=actual
+        ).exclude(recipe_count=F('actual')).values_list('id', flat=True))
+        if wrong:
+            corrected += manager.filter(id__in=wrong).update(
+                recipe_count=actual
+            )
+        last_id = ids[-1]
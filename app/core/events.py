@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel carrying the id of each user whose data changed
+CHANNEL = 'recipe_changes'
+# seconds before a lost LISTEN connection is opened again
+RECONNECT_SECONDS = 5
+
+
+class Hub:
+    """Wakes the event streams of a user in this process. Each stream
+    owns a queue holding at most one pending wake up, since a stream only
+    tells its client to sync and one sync picks up any number of changes"""
+
+    def __init__(self):
+        self.loop = None
+        self.queues = {}
+
+    def subscribe(self, user_id):
+        """Return a queue that receives a value when the user's data
+        changes. Called from the event loop"""
+        self.loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=1)
+        self.queues.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.queues.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.queues.pop(user_id, None)
+
+    def publish(self, user_id):
+        """Wake the streams of the user, from any thread"""
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.wake, user_id)
+
+    def publish_all(self):
+        """Wake every stream, when notifications may have been missed"""
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.wake_all)
+
+    def wake(self, user_id):
+        for queue in self.queues.get(user_id, ()):
+            if queue.empty():
+                queue.put_nowait(True)
+
+    def wake_all(self):
+        for user_id in list(self.queues):
+            self.wake(user_id)
+
+
+hub = Hub()
+
+
+def notify(user_id, using):
+    """Announce a change to the user's data once the current transaction
+    of `using` commits. Postgres delivers the notification to the listeners
+    of every process, other databases only reach this process"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        # NOTIFY is transactional and sent on commit
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [CHANNEL, str(user_id)])
+    else:
+        transaction.on_commit(partial(hub.publish, user_id), using=using)
+
+
+def _listen(alias):
+    """Open a connection that LISTENs on the channel"""
+    wrapper = connections[alias]
+    connection = wrapper.get_new_connection(wrapper.get_connection_params())
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute('LISTEN {}'.format(CHANNEL))
+    return connection
+
+
+async def listen(hub, alias):
+    """Pass the notifications of a Postgres database on to the hub for
+    as long as the event loop runs. Streams are woken whenever the
+    connection had to be opened again, as notifications sent in between
+    are lost"""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            connection = await loop.run_in_executor(None, _listen, alias)
+        except DatabaseError:
+            logger.exception('LISTEN on %s failed', alias)
+            await asyncio.sleep(RECONNECT_SECONDS)
+            continue
+
+        hub.publish_all()
+        lost = loop.create_future()
+
+        def receive():
+            try:
+                connection.poll()
+            except DatabaseError as exc:
+                if not lost.done():
+                    lost.set_exception(exc)
+                return
+            while connection.notifies:
+                payload = connection.notifies.pop(0).payload
+                if payload.isdigit():
+                    hub.wake(int(payload))
+
+        loop.add_reader(connection.fileno(), receive)
+        try:
+            await lost
+        except DatabaseError:
+            logger.exception('LISTEN connection to %s lost', alias)
+        finally:
+            loop.remove_reader(connection.fileno())
+            connection.close()
+        await asyncio.sleep(RECONNECT_SECONDS)
+
+
+def start_listeners(hub):
+    """Start listening on each Postgres shard, returns the tasks"""
+    return [
+        asyncio.ensure_future(listen(hub, alias))
+        for alias in settings.SHARDS
+        if connections[alias].vendor == 'postgresql'
+    ]
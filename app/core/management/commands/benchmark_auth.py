@@ -0,0 +1,50 @@
+from django.db import connection
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+
+from core import benchmark
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication, \
+                                issue_signed_tokens
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """Django command comparing the cost of authenticating a request with
+    a stored token and with a signed token. Creates a throwaway user in the
+    configured database, so never run it against production"""
+    help = 'Benchmark the authentication overhead per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        user = benchmark.seed_user(0, tags=0, ingredients=0)
+        key, _ = AuthToken.objects.rotate(user)
+        signed = issue_signed_tokens(user)['access']
+        runs = [
+            ('token', ExpiringTokenAuthentication(), 'Token ' + key),
+            ('signed', SignedTokenAuthentication(), 'Bearer ' + signed),
+        ]
+
+        factory = APIRequestFactory()
+        for name, authentication, header in runs:
+            requests = [
+                Request(factory.get('/', HTTP_AUTHORIZATION=header))
+                for _ in range(options['requests'])
+            ]
+            with CaptureQueriesContext(connection) as queries, \
+                    benchmark.measure() as stats:
+                for request in requests:
+                    authentication.authenticate(request)
+
+            self.stdout.write(self.style.SUCCESS(
+                '{}: {:.1f}us and {:.2f} queries per request'.format(
+                    name, stats['seconds'] / len(requests) * 10 ** 6,
+                    len(queries) / len(requests),
+                )
+            ))
+
+        user.delete()
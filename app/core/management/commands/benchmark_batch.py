@@ -0,0 +1,85 @@
+import json
+import time
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import benchmark
+from core.models import AuthToken
+
+
+# the calls clients make when they start
+STARTUP = ('user:me', 'recipe:tag-list', 'recipe:ingredient-list',
+           'recipe:recipe-list')
+
+
+class Command(BaseCommand):
+    """Django command comparing the app startup calls made one by one with
+    the same calls made as one batch. Runs through the whole Django stack
+    in process by default, with a throwaway user in the configured
+    database, so never run it against production. Pass --url and --token
+    to measure over the network against a running server instead"""
+    help = 'Benchmark batched against sequential API calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=50)
+        parser.add_argument('--url', help='e.g. http://localhost:8000')
+        parser.add_argument('--token', help='Auth token to send')
+
+    def handle(self, *args, **options):
+        paths = [reverse(name) for name in STARTUP]
+        batch = {'requests': [{'method': 'GET', 'path': path}
+                              for path in paths]}
+
+        user = None
+        if options['url']:
+            send = self.http_sender(options['url'], options['token'])
+        else:
+            user = benchmark.seed_user(options['recipes'])
+            key, _ = AuthToken.objects.rotate(user)
+            client = APIClient(HTTP_HOST='localhost')
+            client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+
+            def send(method, path, data=None):
+                res = getattr(client, method)(path, data, format='json')
+                assert res.status_code == 200, res.status_code
+
+        runs = [
+            ('sequential', lambda: [send('get', path) for path in paths]),
+            ('batch', lambda: send('post', reverse('batch:batch'), batch)),
+        ]
+        for name, run in runs:
+            run()
+            latencies = []
+            for _ in range(options['rounds']):
+                started = time.perf_counter()
+                run()
+                latencies.append(time.perf_counter() - started)
+
+            latencies.sort()
+            self.stdout.write(self.style.SUCCESS(
+                '{}: {:.2f}ms mean, {:.2f}ms p95 for {} calls'.format(
+                    name, sum(latencies) / len(latencies) * 1000,
+                    latencies[int(len(latencies) * 0.95)] * 1000, len(paths),
+                )
+            ))
+
+        if user is not None:
+            user.delete()
+
+    def http_sender(self, base_url, token):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Token ' + token
+
+        def send(method, path, data=None):
+            body = json.dumps(data).encode() if data is not None else None
+            request = Request(base_url.rstrip('/') + path, data=body,
+                              headers=headers, method=method.upper())
+            with urlopen(request) as response:
+                response.read()
+
+        return send
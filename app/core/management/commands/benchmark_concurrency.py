@@ -0,0 +1,90 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Django command that loads an endpoint with many concurrent
+    connections. Run it against the sync server (runserver or a WSGI
+    server) and against the ASGI entry point (uvicorn app.asgi:application)
+    to compare how both cope with slow clients"""
+    help = 'Measure throughput and latency under concurrent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://localhost:8000/api/'
+                                        'recipe/recipes/')
+        parser.add_argument('--token', help='Auth token to send')
+        parser.add_argument('--connections', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--read-delay',
+            type=float,
+            default=0.0,
+            help='Seconds each client waits before reading the response, '
+                 'to simulate slow clients',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// urls are supported')
+
+        request = [
+            'GET {} HTTP/1.1'.format(url.path + (
+                '?' + url.query if url.query else ''
+            )),
+            'Host: {}'.format(url.netloc),
+            'Connection: close',
+        ]
+        if options['token']:
+            request.append('Authorization: Token {}'.format(options['token']))
+        request = ('\r\n'.join(request) + '\r\n\r\n').encode('latin1')
+
+        started = time.perf_counter()
+        results = asyncio.get_event_loop().run_until_complete(self.load(
+            url.hostname, url.port or 80, request, options
+        ))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError('All {} requests failed'.format(errors))
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1,
+                                 int(len(latencies) * p / 100))] * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            '{} requests, {} errors in {:.2f}s: {:.1f} req/s, '
+            'p50 {:.1f}ms, p99 {:.1f}ms'.format(
+                len(results), errors, elapsed, len(results) / elapsed,
+                percentile(50), percentile(99),
+            )
+        ))
+
+    async def load(self, host, port, request, options):
+        """Send the requests over at most `connections` at a time"""
+        semaphore = asyncio.Semaphore(options['connections'])
+
+        async def fetch():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(request)
+                    await writer.drain()
+                    if options['read_delay']:
+                        await asyncio.sleep(options['read_delay'])
+                    response = await reader.read()
+                    writer.close()
+                    ok = response.split(b' ', 2)[1].startswith(b'2')
+                except (OSError, IndexError):
+                    ok = False
+                return ok, time.perf_counter() - started
+
+        return await asyncio.gather(
+            *[fetch() for _ in range(options['requests'])]
+        )
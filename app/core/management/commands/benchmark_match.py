@@ -0,0 +1,54 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from core import benchmark
+from core.models import Ingredient
+from recipe import matching
+
+
+class Command(BaseCommand):
+    """Django command comparing recipe matching with the in memory index
+    against the GROUP BY query. Creates a throwaway user in the configured
+    database, so never run it against production"""
+    help = 'Benchmark matching recipes against a list of ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--pantry', type=int, default=100)
+        parser.add_argument('--missing', type=int, default=1)
+        parser.add_argument('--queries', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write('Seeding {} recipes...'.format(options['recipes']))
+        user = benchmark.seed_user(
+            options['recipes'], ingredients=options['ingredients'],
+            per_recipe=options['per_recipe'],
+        )
+        ingredient_ids = list(Ingredient.objects.filter(user=user)
+                              .values_list('id', flat=True))
+        rng = random.Random(0)
+        pantries = [rng.sample(ingredient_ids, options['pantry'])
+                    for _ in range(options['queries'])]
+
+        with benchmark.measure() as stats:
+            matching.match(user, pantries[0], options['missing'])
+        self.stdout.write('index build: {:.2f}s, peak memory {:.1f}MB'.format(
+            stats['seconds'], stats['peak_mb']
+        ))
+
+        runs = [('index', matching.match), ('sql', matching.match_sql)]
+        for name, match in runs:
+            with benchmark.measure() as stats:
+                for pantry in pantries:
+                    match(user, pantry, options['missing'])
+
+            self.stdout.write(self.style.SUCCESS(
+                '{}: {:.1f}ms per query'.format(
+                    name, stats['seconds'] / len(pantries) * 1000
+                )
+            ))
+
+        user.delete()
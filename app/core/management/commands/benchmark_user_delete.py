@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from core import benchmark, deletion
+
+
+class Command(BaseCommand):
+    """Django command comparing the chunked user deletion with Django's
+    default cascading delete. Creates and deletes throwaway users in the
+    configured database, so never run it against production"""
+    help = 'Benchmark deleting a user with a large recipe book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--per-recipe', type=int, default=5)
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=deletion.DEFAULT_CHUNK_SIZE,
+        )
+        parser.add_argument(
+            '--skip-default',
+            action='store_true',
+            help="Don't benchmark Django's default delete",
+        )
+
+    def handle(self, *args, **options):
+        runs = [('chunked', lambda user: deletion.delete_user(
+            user, options['chunk_size']
+        ))]
+        if not options['skip_default']:
+            runs.append(('default', lambda user: user.delete()))
+
+        for name, delete in runs:
+            self.stdout.write('Seeding {} recipes...'.format(
+                options['recipes']
+            ))
+            user = benchmark.seed_user(
+                options['recipes'], per_recipe=options['per_recipe']
+            )
+
+            with benchmark.measure() as stats:
+                delete(user)
+
+            self.stdout.write(self.style.SUCCESS(
+                '{}: {:.2f}s, peak memory {:.1f}MB'.format(
+                    name, stats['seconds'], stats['peak_mb']
+                )
+            ))
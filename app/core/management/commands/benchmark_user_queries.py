@@ -0,0 +1,62 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import benchmark
+from core.models import Recipe, Tag
+from recipe.stats import recipe_stats
+
+
+class Command(BaseCommand):
+    """Django command timing the per user queries of the recipe API over a
+    database holding many users. Run it before and after partition_tables
+    to compare. Creates throwaway users in the configured database, so
+    never run it against production"""
+    help = 'Benchmark user scoped recipe queries with many users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Recipes per user')
+        parser.add_argument('--queries', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write('Seeding {} users with {} recipes...'.format(
+            options['users'], options['recipes']
+        ))
+        users = [
+            benchmark.seed_user(options['recipes'], seed=i)
+            for i in range(options['users'])
+        ]
+
+        rng = random.Random(0)
+        sample = [rng.choice(users) for _ in range(options['queries'])]
+        runs = [
+            ('recipe list', lambda user: list(
+                Recipe.objects.filter(user=user).prefetch_related(
+                    'tags', 'ingredients'
+                ).order_by('-id')[:100]
+            )),
+            ('tag list', lambda user: list(
+                Tag.objects.filter(user=user).order_by('-name')
+            )),
+            ('stats', lambda user: recipe_stats(user, limit=10)),
+        ]
+        for name, run in runs:
+            with benchmark.measure() as stats:
+                for user in sample:
+                    run(user)
+
+            self.stdout.write(self.style.SUCCESS(
+                '{}: {:.1f}ms per query'.format(
+                    name, stats['seconds'] / len(sample) * 1000
+                )
+            ))
+
+        if connection.vendor == 'postgresql':
+            plan = Recipe.objects.filter(user=users[0]).explain()
+            self.stdout.write('\nPlan of a user scoped query:\n' + plan)
+
+        for user in users:
+            user.delete()
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import deletion, sharding
+
+
+class Command(BaseCommand):
+    """Django command to delete users and all of their recipe data"""
+    help = 'Delete users by email together with everything they own'
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='+')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=deletion.DEFAULT_CHUNK_SIZE,
+            help='Number of rows removed by each DELETE statement',
+        )
+
+    def handle(self, *args, **options):
+        users = []
+        for email in options['emails']:
+            # with sharding each user is looked up on their own shard
+            with sharding.use_shard(sharding.shard_for_email(email)):
+                users.extend(get_user_model().objects.filter(email=email))
+        missing = set(options['emails']) - {user.email for user in users}
+        if missing:
+            raise CommandError(
+                'Unknown users: {}'.format(', '.join(sorted(missing)))
+            )
+
+        for user in users:
+            with sharding.use_shard(user._state.db):
+                counts = deletion.delete_user(user, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS('Deleted {}: {}'.format(
+                user.email,
+                ', '.join('{} {}'.format(count, label)
+                          for label, count in sorted(counts.items())),
+            )))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+from core.models import UserShard
+
+
+class Command(BaseCommand):
+    """Django command that rebalances the shards by moving users with their
+    recipe data to another shard. The users can't sign in during the move"""
+    help = 'Move users by email to another shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shard', choices=settings.SHARDS)
+        parser.add_argument('emails', nargs='+')
+        parser.add_argument(
+            '--drain',
+            type=float,
+            default=(settings.ACCESS_TOKEN_TTL.total_seconds() +
+                     settings.SHARD_DIRECTORY_TTL),
+            help='Seconds to wait after locking a user out before copying '
+                 'their data, long enough for their access tokens and the '
+                 'cached directory entries to expire',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is off, set DB_SHARDS')
+
+        entries = dict(UserShard.objects.filter(
+            email__in=options['emails']
+        ).values_list('email', 'pk'))
+        missing = set(options['emails']) - set(entries)
+        if missing:
+            raise CommandError(
+                'Unknown users: {}'.format(', '.join(sorted(missing)))
+            )
+
+        for email in options['emails']:
+            try:
+                counts = sharding.move_user(entries[email], options['shard'],
+                                            options['drain'])
+            except sharding.ShardingError as exc:
+                raise CommandError(exc)
+
+            self.stdout.write(self.style.SUCCESS('Moved {}: {}'.format(
+                email,
+                ', '.join('{} {}'.format(count, label)
+                          for label, count in sorted(counts.items())),
+            )))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    """Django command that hash partitions the recipe tables of a migrated
+    database, see core.partitioning. Needs PostgreSQL 11. The tables are
+    copied while locked, so run it in a maintenance window"""
+    help = 'Hash partition the recipe, tag and ingredient tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=16,
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                tables = partitioning.partition_tables(options['partitions'])
+        except partitioning.PartitioningError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Partitioned {}'.format(', '.join(tables) or 'nothing')
+        ))
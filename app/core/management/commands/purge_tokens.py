@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import deletion, sharding
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    """Django command that deletes the expired auth tokens of every shard.
+    Run it periodically, e.g. daily from cron"""
+    help = 'Delete expired auth tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=deletion.DEFAULT_CHUNK_SIZE,
+            help='Number of rows removed by each DELETE statement',
+        )
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with sharding.use_shard(alias):
+                deleted = deletion.delete_in_chunks(
+                    AuthToken.objects.expired(), options['chunk_size']
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Deleted {} expired tokens on {}'.format(deleted, alias)
+            ))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import sharding
+from core.models import Recipe
+from recipe import similarity
+
+
+class Command(BaseCommand):
+    """Django command that recomputes the similarity signatures of all
+    recipes on every shard, e.g. after the hashing parameters changed"""
+    help = 'Rebuild the MinHash signatures and LSH buckets of all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with sharding.use_shard(alias):
+                rebuilt = self.rebuild(options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                'Rebuilt the signatures of {} recipes on {}'.format(
+                    rebuilt, alias
+                )
+            ))
+
+    def rebuild(self, chunk_size):
+        last_id = 0
+        rebuilt = 0
+        while True:
+            users = dict(Recipe.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', 'user_id')[:chunk_size])
+            if not users:
+                return rebuilt
+
+            similarity.update_recipes(users, users)
+            rebuilt += len(users)
+            last_id = max(users)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import counters, sharding
+from core.models import Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """Django command that corrects the recipe counts of tags and
+    ingredients from the M2M tables, e.g. after links were written in bulk
+    or a migration. Safe to run while the API is serving requests"""
+    help = 'Correct the recipe_count of tags and ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=counters.DEFAULT_CHUNK_SIZE,
+            help='Number of tags or ingredients checked by each query',
+        )
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with sharding.use_shard(alias):
+                for model in (Tag, Ingredient):
+                    corrected = counters.reconcile(
+                        model.objects.all(), options['chunk_size']
+                    )
+                    self.stdout.write(self.style.SUCCESS(
+                        'Corrected {} {} counts on {}'.format(
+                            corrected, model._meta.verbose_name, alias
+                        )
+                    ))
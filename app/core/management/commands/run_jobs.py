@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    """Django command that runs queued background jobs.
+    Start as many of these as needed, each one claims jobs independently"""
+    help = 'Run queued background jobs'
+    # workers don't serve requests, so skip loading the URLconf for the
+    # system checks to boot faster
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for jobs',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before polling an empty queue again',
+        )
+
+    def handle(self, *args, **options):
+        tasks.autodiscover()
+        self.stdout.write('Waiting for jobs...')
+
+        processed = 0
+        started = time.monotonic()
+        try:
+            while True:
+                job = tasks.run_next_job()
+                if job is not None:
+                    processed += 1
+                    self.stdout.write('Job {} {} {}'.format(
+                        job.id, job.name, job.status
+                    ))
+                    continue
+
+                # an idle worker picks up the jobs of dead ones
+                if any(tasks.requeue_all_stale_jobs()):
+                    continue
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Processed {} jobs in {:.2f}s'.format(processed, elapsed)
+        ))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    """Django command that prepares migrated databases for sharding. Adds
+    the existing users to the directory and, on PostgreSQL, interleaves the
+    id sequences of the shards so that users can be moved between them"""
+    help = 'Register existing users and interleave the ids of the shards'
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is off, set DB_SHARDS')
+
+        for alias in settings.SHARDS:
+            registered = sharding.register_users(alias)
+            try:
+                sharding.interleave_sequences(alias)
+                interleaved = 'interleaved ids'
+            except sharding.ShardingError as exc:
+                interleaved = str(exc)
+            self.stdout.write(self.style.SUCCESS(
+                '{}: registered {} users, {}'.format(
+                    alias, registered, interleaved
+                )
+            ))
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(output):
+    """Parse the output of `python -X importtime` into (module, self,
+    cumulative, depth) tuples with times in microseconds"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append(
+            (name.strip(), int(self_us), int(cumulative_us), depth)
+        )
+
+    return imports
+
+
+class Command(BaseCommand):
+    """Django command that reports where process startup time goes. Setup
+    runs in a fresh interpreter with `python -X importtime` and the import
+    times are grouped by the installed app that triggered them"""
+    help = 'Report import time per installed app and for the URLconf'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lean',
+            action='store_true',
+            help='Profile with DJANGO_LEAN_STARTUP=1',
+        )
+        parser.add_argument(
+            '--no-urls',
+            action='store_true',
+            help="Don't import the URLconf, like a management command",
+        )
+        parser.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        code = 'import django; django.setup()'
+        if not options['no_urls']:
+            code += '; import {}'.format(settings.ROOT_URLCONF)
+
+        env = dict(os.environ)
+        env['DJANGO_LEAN_STARTUP'] = '1' if options['lean'] else '0'
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        elapsed = time.perf_counter() - started
+        if process.returncode:
+            raise CommandError(process.stderr)
+
+        imports = parse_importtime(process.stderr)
+        groups = [settings.ROOT_URLCONF] + sorted(
+            (config.name for config in apps.get_app_configs()),
+            key=len,
+            reverse=True,
+        )
+        totals = {}
+        for name, _, cumulative, depth in imports:
+            if depth:
+                continue
+            # imports outside of the apps are grouped by top level package
+            group = next(
+                (group for group in groups
+                 if name == group or name.startswith(group + '.')),
+                name.split('.')[0],
+            )
+            totals[group] = totals.get(group, 0) + cumulative
+
+        self.stdout.write('Startup took {:.0f}ms, {:.0f}ms in imports'.format(
+            elapsed * 1000, sum(totals.values()) / 1000
+        ))
+        self.stdout.write('\nImport time by app:')
+        for group, total in sorted(totals.items(), key=lambda x: -x[1]):
+            self.stdout.write('  {:>8.1f}ms  {}'.format(total / 1000, group))
+
+        self.stdout.write('\nSlowest modules (self time):')
+        slowest = sorted(imports, key=lambda x: -x[1])[:options['top']]
+        for name, self_us, _, _ in slowest:
+            self.stdout.write('  {:>8.1f}ms  {}'.format(self_us / 1000, name))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.models import QueryFingerprint
+
+
+class Command(BaseCommand):
+    """Django command that lists the query fingerprints recorded by
+    core.querylog, most expensive first"""
+    help = 'Show the top query fingerprints of the recipe and user apps'
+
+    ORDERINGS = {
+        'total': F('total_ms').desc(),
+        'avg': (F('total_ms') / F('count')).desc(),
+        'max': F('max_ms').desc(),
+        'count': F('count').desc(),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--app', help='Only show queries of this app')
+        parser.add_argument(
+            '--sort',
+            choices=sorted(self.ORDERINGS),
+            default='total',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Delete the recorded statistics afterwards',
+        )
+
+    def handle(self, *args, **options):
+        queryset = QueryFingerprint.objects.all()
+        if options['app']:
+            queryset = queryset.filter(app=options['app'])
+
+        self.stdout.write('{:>10} {:>12} {:>10} {:>10}  {:<8} {}'.format(
+            'count', 'total ms', 'avg ms', 'max ms', 'app', 'query'
+        ))
+        ordering = self.ORDERINGS[options['sort']]
+        for query in queryset.order_by(ordering)[:options['limit']]:
+            self.stdout.write(
+                '{:>10} {:>12.1f} {:>10.2f} {:>10.2f}  {:<8} {}'.format(
+                    query.count, query.total_ms, query.avg_ms, query.max_ms,
+                    query.app, query.query,
+                )
+            )
+
+        if options['reset']:
+            queryset.delete()
@@ -13,6 +13,10 @@ from django.core.management.base import BaseCommand
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
+    # the system checks load the whole URLconf, which only slows down
+    # starting the containers
+    requires_system_checks = False
+
     # this is the function that is called whenever we run the wait_for_db
     # command
     def handle(self, *args, **options):
@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.cache import patch_cache_control
+from django.views.static import serve as serve_static
+from PIL import Image
+
+
+ORIGINALS = 'recipes/originals'
+THUMBNAILS = 'recipes/thumbnails'
+
+# file extension of the image formats that can be uploaded, by the name
+# Pillow detects them as
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# stored files never change, their names change with their content
+MAX_AGE = 365 * 24 * 60 * 60
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Writes uploads to a temporary file chunk by chunk, so they are never
+    held in memory, and computes the sha256 of their content on the way"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.sha256.hexdigest()
+        return upload
+
+
+def original_name(digest, extension):
+    # two levels keep directories small
+    return '{}/{}/{}.{}'.format(ORIGINALS, digest[:2], digest, extension)
+
+
+def thumbnail_name(image, size):
+    """Return the name of the thumbnail of a stored image, which fits in
+    a square of `size` pixels"""
+    digest = os.path.splitext(os.path.basename(image))[0]
+    return '{}/{}/{}_{}.jpg'.format(THUMBNAILS, digest[:2], digest, size)
+
+
+def store_image(upload):
+    """Store an image validated by an ImageField under the hash of its
+    content, which HashingUploadHandler computed already for uploads it
+    received. Returns its name.
+    Uploading an image that is stored already doesn't store it again, and
+    storing moves the temporary file instead of copying it"""
+    digest = getattr(upload, 'sha256', None)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in upload.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+    name = original_name(digest, FORMATS[upload.image.format])
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, upload)
+
+
+def make_thumbnails(image, sizes):
+    """Make the missing thumbnails of a stored image. Returns the names of
+    the thumbnails by size"""
+    names = {size: thumbnail_name(image, size) for size in sizes}
+    missing = [size for size, name in names.items()
+               if not default_storage.exists(name)]
+    if not missing:
+        return names
+
+    with default_storage.open(image) as f, Image.open(f) as original:
+        # JPEGs are decoded at a fraction of their size when that is
+        # still larger than the largest thumbnail
+        original.draft('RGB', (max(missing), max(missing)))
+        original = original.convert('RGB')
+        for size in missing:
+            thumbnail = original.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            content = io.BytesIO()
+            thumbnail.save(content, 'JPEG', quality=85, optimize=True)
+            default_storage.save(names[size], ContentFile(content.getvalue()))
+
+    return names
+
+
+def thumbnail_urls(image):
+    """Return the URLs of the thumbnails of a stored image by size. They
+    exist once the thumbnail job of the image has run"""
+    return {
+        str(size): default_storage.url(thumbnail_name(image, size))
+        for size in settings.RECIPE_THUMBNAIL_SIZES
+    }
+
+
+def serve(request, path):
+    """Serve stored images when SERVE_MEDIA is on. Their names change with
+    their content, so clients and proxies can keep them for good. In
+    production the web server in front of Django should serve MEDIA_ROOT
+    the same way"""
+    response = serve_static(request, path,
+                            document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, public=True, max_age=MAX_AGE,
+                        immutable=True)
+    return response
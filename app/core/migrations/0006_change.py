@@ -0,0 +1,33 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('tag', 'Tag'), ('ingredient', 'Ingredient'), ('recipe', 'Recipe')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'id'], name='core_change_user_id_dfd788_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='change',
+            unique_together={('kind', 'object_id')},
+        ),
+    ]
@@ -0,0 +1,95 @@
+from django.db import migrations
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+
+# (model, recipe field, column of the recipe M2M table, change kind)
+RECIPE_ATTRS = (
+    ('Tag', 'tags', 'tag_id', 'tag'),
+    ('Ingredient', 'ingredients', 'ingredient_id', 'ingredient'),
+)
+
+
+def record_changes(Change, user_id, kind, object_ids, deleted):
+    """Replace the sync change rows of the objects"""
+    Change.objects.filter(kind=kind, object_id__in=object_ids).delete()
+    Change.objects.bulk_create([
+        Change(user_id=user_id, kind=kind, object_id=object_id,
+               deleted=deleted)
+        for object_id in object_ids
+    ])
+
+
+def merge_duplicates(apps, schema_editor):
+    """Merge the tags and ingredients of a user that only differ in case
+    into the oldest one, moving their recipes over to it"""
+    Recipe = apps.get_model('core', 'Recipe')
+    Change = apps.get_model('core', 'Change')
+
+    for model_name, field, column, kind in RECIPE_ATTRS:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        groups = model.objects.annotate(
+            name_lower=Lower('name'),
+        ).values('user_id', 'name_lower').annotate(
+            count=Count('id'),
+            keep=Min('id'),
+        ).filter(count__gt=1)
+
+        for group in groups:
+            keep = group['keep']
+            duplicates = list(model.objects.annotate(
+                name_lower=Lower('name'),
+            ).filter(
+                user_id=group['user_id'],
+                name_lower=group['name_lower'],
+            ).exclude(id=keep).values_list('id', flat=True))
+
+            linked = set(through.objects.filter(
+                **{column: keep}
+            ).values_list('recipe_id', flat=True))
+            move, drop, recipe_ids = [], [], set()
+            for row_id, recipe_id in through.objects.filter(
+                **{column + '__in': duplicates}
+            ).values_list('id', 'recipe_id'):
+                recipe_ids.add(recipe_id)
+                if recipe_id in linked:
+                    drop.append(row_id)
+                else:
+                    linked.add(recipe_id)
+                    move.append(row_id)
+
+            through.objects.filter(id__in=drop).delete()
+            through.objects.filter(id__in=move).update(**{column: keep})
+            model.objects.filter(id__in=duplicates).delete()
+
+            record_changes(Change, group['user_id'], kind, duplicates, True)
+            recipes = Recipe.objects.filter(
+                id__in=recipe_ids
+            ).values_list('user_id', 'id')
+            for user_id, recipe_id in recipes:
+                record_changes(Change, user_id, 'recipe', [recipe_id], False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        # statements are passed as lists so they don't need to be split
+        migrations.RunSQL(
+            [
+                'CREATE UNIQUE INDEX core_tag_user_id_name_lower_uniq '
+                'ON core_tag (user_id, LOWER(name))',
+                'CREATE UNIQUE INDEX core_ingredient_user_id_name_lower_uniq '
+                'ON core_ingredient (user_id, LOWER(name))',
+            ],
+            [
+                'DROP INDEX core_tag_user_id_name_lower_uniq',
+                'DROP INDEX core_ingredient_user_id_name_lower_uniq',
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app', models.CharField(max_length=100)),
+                ('digest', models.CharField(max_length=40)),
+                ('query', models.TextField()),
+                ('count', models.BigIntegerField()),
+                ('total_ms', models.FloatField()),
+                ('max_ms', models.FloatField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='queryfingerprint',
+            unique_together={('app', 'digest')},
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:14
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def hash_existing_tokens(apps, schema_editor):
+    """Move the never expiring tokens into the new table, so that signed
+    in clients stay signed in. The keys are hashed the way
+    core.models.hash_token did when this was written, so later changes to
+    the app don't change what the migration does"""
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+    db_alias = schema_editor.connection.alias
+    expires = timezone.now() + settings.AUTH_TOKEN_TTL
+    AuthToken.objects.using(db_alias).bulk_create([
+        AuthToken(digest=hashlib.sha256(key.encode()).hexdigest(),
+                  user_id=user_id, expires=expires)
+        for key, user_id in Token.objects.using(db_alias).values_list(
+            'key', 'user_id'
+        )
+    ])
+    Token.objects.using(db_alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_queryfingerprint'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(hash_existing_tokens,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_usershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    """Fill in the counts of the existing tags and ingredients with the
+    number of rows linking each of them to a recipe"""
+    Recipe = apps.get_model('core', 'Recipe')
+    db_alias = schema_editor.connection.alias
+    for field in ('tags', 'ingredients'):
+        relation = Recipe._meta.get_field(field)
+        through = relation.remote_field.through
+        column = relation.related_model._meta.model_name
+        relation.related_model.objects.using(db_alias).update(
+            recipe_count=Coalesce(Subquery(
+                through.objects.filter(
+                    **{column: OuterRef('pk')}
+                ).order_by().values(column).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_ingred_user_id_de1121_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_tag_user_id_699afc_idx'),
+        ),
+        # SQLite adds columns by copying the table, which loses the indexes
+        # created with SQL by 0007
+        migrations.RunSQL(
+            [
+                'CREATE UNIQUE INDEX IF NOT EXISTS '
+                'core_tag_user_id_name_lower_uniq '
+                'ON core_tag (user_id, LOWER(name))',
+                'CREATE UNIQUE INDEX IF NOT EXISTS '
+                'core_ingredient_user_id_name_lower_uniq '
+                'ON core_ingredient (user_id, LOWER(name))',
+            ],
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='change',
+            name='core_change_user_id_dfd788_idx',
+        ),
+        # the rows recorded so far get version 0. Cursors handed out before
+        # were Change ids, which sync() answers with everything
+        migrations.AddField(
+            model_name='change',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'version'], name='core_change_user_id_30df15_idx'),
+        ),
+    ]
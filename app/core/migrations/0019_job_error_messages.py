@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def hide_tracebacks(apps, schema_editor):
+    """Replace the tracebacks that failed jobs recorded so far with the
+    message run_job records now"""
+    Job = apps.get_model('core', 'Job')
+    Job.objects.using(schema_editor.connection.alias).filter(
+        error__startswith='Traceback',
+    ).update(error='Internal error')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_change_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(hide_tracebacks, migrations.RunPython.noop),
+    ]
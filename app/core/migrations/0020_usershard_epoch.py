@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_job_error_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usershard',
+            name='epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.1.15 on 2026-10-19 10:53
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def lease_running_jobs(apps, schema_editor):
+    """Give the jobs running so far the 30 minutes they had before leases,
+    their workers don't renew them"""
+    Job = apps.get_model('core', 'Job')
+    Job.objects.using(schema_editor.connection.alias).filter(
+        status='running',
+    ).update(lease_expires=F('started_at') + timedelta(minutes=30))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_usershard_epoch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(lease_running_jobs, migrations.RunPython.noop),
+    ]
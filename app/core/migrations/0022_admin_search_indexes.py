@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+# (table, column) searched by prefix in the admin, see core.admin
+SEARCHED_COLUMNS = (
+    ('core_tag', 'name'),
+    ('core_ingredient', 'name'),
+    ('core_recipe', 'title'),
+)
+
+
+def index_name(table, column):
+    return '{}_{}_upper_idx'.format(table, column)
+
+
+def create_indexes(apps, schema_editor):
+    """Index the uppercased columns, which the admin's case insensitive
+    lookups compare. Postgres only uses an index for LIKE 'prefix%' with
+    the pattern operator class unless the database uses the C collation"""
+    opclass = ''
+    if schema_editor.connection.vendor == 'postgresql':
+        opclass = ' text_pattern_ops'
+    for table, column in SEARCHED_COLUMNS:
+        schema_editor.execute('CREATE INDEX {} ON {} (UPPER({}){})'.format(
+            index_name(table, column), table, column, opclass,
+        ))
+
+
+def drop_indexes(apps, schema_editor):
+    for table, column in SEARCHED_COLUMNS:
+        schema_editor.execute('DROP INDEX {}'.format(
+            index_name(table, column)
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_job_lease_expires'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
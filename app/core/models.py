@@ -1,9 +1,19 @@
-from django.db import models
+import hashlib
+import secrets
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, Lower
+from django.db.models.signals import m2m_changed
 
 # for extending and customizing user models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core import events, sharding
 
 
 class UserManager(BaseUserManager):
@@ -24,21 +34,21 @@ class UserManager(BaseUserManager):
         # using the built in django password method
         user.set_password(password)
 
-        # using=self._db used for supporting multiple databases. Not
-        # using here but it is good practice to use it anyway.
-        user.save(using=self._db)
+        if sharding.enabled():
+            # the directory entry is rolled back if the user can't be saved
+            with transaction.atomic(using=sharding.DIRECTORY_DB):
+                user.save(using=sharding.assign(user), force_insert=True)
+        else:
+            # using=self._db used for supporting multiple databases
+            user.save(using=self._db)
 
         # return user model object
         return user
 
     def create_superuser(self, email, password):
         """Creates and saves a new superuser"""
-        user = self.create_user(email, password)
-        user.is_staff = True
-        user.is_superuser = True
-        user.save(using=self._db)
-
-        return user
+        return self.create_user(email, password, is_staff=True,
+                                is_superuser=True)
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -53,6 +63,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # embedded in signed tokens, bumping it revokes all of them
+    token_version = models.PositiveIntegerField(default=0)
 
     # overriding the objects attribute and setting it to the UserManager
     objects = UserManager()
@@ -62,6 +74,90 @@ class User(AbstractBaseUser, PermissionsMixin):
     # the top
     USERNAME_FIELD = 'email'
 
+    def revoke_signed_tokens(self):
+        """Invalidate the signed tokens issued so far"""
+        type(self).objects.filter(pk=self.pk).update(
+            token_version=models.F('token_version') + 1
+        )
+        self.token_version += 1
+        forget_token_version(self.pk)
+
+
+def token_version_key(user_id):
+    return 'token-version:{}'.format(user_id)
+
+
+def forget_token_version(user_id):
+    """Drop the token version that core.authentication cached for the
+    user, so their access tokens are checked against the database again"""
+    cache.delete(token_version_key(user_id))
+
+
+class RecipeAttrManager(models.Manager):
+    """Manager for the tags and ingredients that users attach to recipes.
+    Names are unique per user regardless of case, enforced by a unique
+    index on (user_id, LOWER(name)) created in migration 0007. Users are
+    passed by id, so callers that only hold the id don't load the user"""
+
+    def filter_names(self, user_id, names):
+        """Return the user's objects matching any of the names. Filtering
+        on LOWER(name) lets the database use the unique index. The names
+        are lowercased by the database as well, which folds some characters
+        differently than Python, e.g. SQLite only folds ASCII"""
+        return self.annotate(name_lower=Lower('name')).filter(
+            user_id=user_id,
+            name_lower__in=[Lower(models.Value(name)) for name in names],
+        )
+
+    def get_or_create_by_name(self, user_id, name):
+        """Return the user's object with the name and whether it was
+        created. A concurrent insert of the same name is caught by the
+        unique index, in which case the winner's row is returned"""
+        existing = self.filter_names(user_id, [name]).first()
+        if existing is not None:
+            return existing, False
+
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(user_id=user_id, name=name), True
+        except IntegrityError:
+            return self.filter_names(user_id, [name]).get(), False
+
+    def get_or_create_names(self, user_id, names):
+        """Return the user's objects for all of the names, creating the
+        missing ones in bulk. Uses the same few queries however many names
+        are given"""
+        unique = {}
+        for name in names:
+            unique.setdefault(name.lower(), name)
+        if not unique:
+            return []
+
+        found = {
+            obj.name.lower(): obj
+            for obj in self.filter_names(user_id, unique.values())
+        }
+        missing = [name for key, name in unique.items() if key not in found]
+        if missing:
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create(
+                        [self.model(user_id=user_id, name=name)
+                         for name in missing]
+                    )
+            except IntegrityError:
+                # another request created some of the names meanwhile
+                for name in missing:
+                    self.get_or_create_by_name(user_id, name)
+            created = list(self.filter_names(user_id, missing))
+            found.update((obj.name.lower(), obj) for obj in created)
+            # bulk_create doesn't send post_save, so record the new objects
+            # for syncing clients here
+            Change.objects.record(user_id, self.model._meta.model_name,
+                                  [obj.pk for obj in created])
+
+        return [found[key] for key in unique]
+
 
 class Tag(models.Model):
     """Tag to be used for a recipe"""
@@ -73,6 +169,15 @@ class Tag(models.Model):
         # this will automatically delete the tag if the user was also deleted
         on_delete=models.CASCADE,
     )
+    # number of recipes using the tag, kept up to date by core.signals and
+    # corrected by the reconcile_counts command
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        # lists the user's tags by popularity
+        indexes = [models.Index(fields=['user', 'recipe_count'])]
 
     def __str__(self):
         return self.name
@@ -85,6 +190,13 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # number of recipes using the ingredient, see Tag.recipe_count
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'recipe_count'])]
 
     def __str__(self):
         return self.name
@@ -102,6 +214,450 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
+    # stored under the hash of its content by core.media, the thumbnails
+    # are made by the recipe.thumbnails job
+    image = models.ImageField(null=True, blank=True, max_length=255)
+
+    class Meta:
+        # the recipe list sorts and filters by time and price, the id keeps
+        # the order of equal values for keyset pagination
+        indexes = [
+            models.Index(fields=['user', 'time_minutes', 'id']),
+            models.Index(fields=['user', 'price', 'id']),
+        ]
 
     def __str__(self):
         return self.title
+
+    # The methods below change the tags or ingredients of a saved recipe
+    # with fewer queries than the related managers, which read the whole
+    # current set before every add and remove. They send m2m_changed like
+    # the related managers do, so receivers see the same actions
+
+    def _relation(self, field):
+        """Return the M2M table, its column for the related objects and the
+        related model of the tags or ingredients field"""
+        relation = self._meta.get_field(field)
+        through = relation.remote_field.through
+        column = through._meta.get_field(
+            relation.m2m_reverse_field_name()
+        ).attname
+        return through, column, relation.related_model
+
+    def _prefetched_ids(self, field):
+        """Return the ids of the tags or ingredients that were prefetched
+        with the recipe, or None if they weren't"""
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if field not in prefetched:
+            return None
+        return {obj.pk for obj in prefetched[field]}
+
+    def _send_m2m_changed(self, field, action, pk_set):
+        """Send m2m_changed for a change of the tags or ingredients"""
+        through, _, model = self._relation(field)
+        if action.startswith('post_'):
+            # drop the prefetched objects, like the related managers do
+            getattr(self, '_prefetched_objects_cache', {}).pop(field, None)
+        m2m_changed.send(
+            sender=through, instance=self, action=action, reverse=False,
+            model=model, pk_set=pk_set, using=self._state.db,
+        )
+
+    def add_related(self, field, ids, current=None):
+        """Link the recipe to the tags or ingredients with the ids. Takes
+        the ids that are already linked if the caller knows them"""
+        through, column, _ = self._relation(field)
+        ids = set(ids)
+        if current is None:
+            current = self._prefetched_ids(field)
+        if current is None:
+            current = set(through.objects.filter(
+                recipe=self, **{column + '__in': ids}
+            ).values_list(column, flat=True))
+        new = ids - set(current)
+        if not new:
+            return
+
+        # receivers keep counters, which must change with the rows
+        with transaction.atomic(using=self._state.db, savepoint=False):
+            self._send_m2m_changed(field, 'pre_add', new)
+            through.objects.bulk_create([
+                through(recipe=self, **{column: pk}) for pk in new
+            ])
+            self._send_m2m_changed(field, 'post_add', new)
+
+    def remove_related(self, field, ids):
+        """Unlink the recipe from the tags or ingredients with the ids"""
+        through, column, _ = self._relation(field)
+        ids = set(ids)
+        if not ids:
+            return
+
+        with transaction.atomic(using=self._state.db, savepoint=False):
+            self._send_m2m_changed(field, 'pre_remove', ids)
+            # delete() would collect the rows first, since the M2M table has
+            # m2m_changed receivers, although nothing cascades from them
+            through.objects.filter(
+                recipe=self, **{column + '__in': ids}
+            )._raw_delete(self._state.db)
+            self._send_m2m_changed(field, 'post_remove', ids)
+
+    def replace_related(self, field, ids):
+        """Make the tags or ingredients with the ids the only ones of the
+        recipe, with at most one read, one DELETE and one bulk INSERT"""
+        through, column, _ = self._relation(field)
+        ids = set(ids)
+        with transaction.atomic(using=self._state.db, savepoint=False):
+            current = self._prefetched_ids(field)
+            if current is None:
+                current = set(through.objects.filter(
+                    recipe=self
+                ).values_list(column, flat=True))
+            self.remove_related(field, current - ids)
+            self.add_related(field, ids, current=current)
+
+
+class Job(models.Model):
+    """Background job that is run by a worker outside of the request"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    # name of the task registered in core.tasks that will run this job
+    name = models.CharField(max_length=255)
+    # JSON encoded keyword arguments for the task and its JSON encoded return
+    # value. Stored as text so the queue works on every database backend
+    payload = models.TextField(default='{}')
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    # the user that requested the job. Jobs are kept when the user is deleted
+    # so that a user deletion job can still record its own result
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # the worker running the job keeps pushing this back, see core.tasks
+    lease_expires = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # workers always look for the oldest queued job
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return '{} ({})'.format(self.name, self.status)
+
+
+class ChangeManager(models.Manager):
+    """Records changes to the objects that clients keep in sync.
+
+    Each change gets a version, the id of the writing transaction on
+    Postgres. Ids are handed out when transactions start rather than when
+    they commit, so a change can become visible after others with higher
+    versions. Readers therefore don't continue after the highest version
+    they saw but from the horizon: the lowest version a change that isn't
+    visible yet can still get. Changes from the horizon on are read again
+    by the next reader, which has to tell apart the ones it already saw"""
+
+    # rows written by each statement of record()
+    BATCH_SIZE = 500
+
+    def _is_postgresql(self):
+        return connections[self.db].vendor == 'postgresql'
+
+    def horizon(self, user_id):
+        """Return an expression for the horizon of the user's changes.
+        Every transaction older than the oldest one still running on
+        Postgres has finished. Other databases commit one write at a time,
+        so the next version is the horizon there"""
+        if self._is_postgresql():
+            return RawSQL('SELECT txid_snapshot_xmin(txid_current_snapshot())',
+                          [], output_field=models.BigIntegerField())
+        return RawSQL(
+            'SELECT COALESCE(MAX(version), 0) + 1 FROM {} '
+            'WHERE user_id = %s'.format(self.model._meta.db_table),
+            [user_id], output_field=models.BigIntegerField(),
+        )
+
+    def current_horizon(self, user_id):
+        sql, params = self.horizon(user_id).as_sql(None, None)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute('SELECT ' + sql, params)
+            return cursor.fetchone()[0]
+
+    def since(self, user_id, horizon, kind=None):
+        """Return the user's changes from the horizon on, oldest first, and
+        the horizon to read from next time, in one query"""
+        changes = self.filter(user_id=user_id, version__gte=horizon)
+        if kind is not None:
+            changes = changes.filter(kind=kind)
+        changes = list(changes.annotate(
+            horizon=self.horizon(user_id)
+        ).order_by('version', 'id'))
+        # without changes the horizon stays where it is, which is safe
+        return changes, changes[0].horizon if changes else horizon
+
+    def record(self, user_id, kind, object_ids, deleted=False):
+        """Record that the objects of the given kind were saved or deleted.
+        The row of each object is updated in place, so the table holds one
+        row per object that carries the version of its latest change"""
+        object_ids = list(object_ids)
+        if not object_ids:
+            return
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        if self._is_postgresql():
+            version, version_params = 'txid_current()', []
+        else:
+            version = '(SELECT COALESCE(MAX(version), 0) + 1 FROM {} ' \
+                      'WHERE user_id = %s)'.format(
+                          quote(self.model._meta.db_table))
+            version_params = [user_id]
+
+        with connection.cursor() as cursor:
+            for start in range(0, len(object_ids), self.BATCH_SIZE):
+                batch = object_ids[start:start + self.BATCH_SIZE]
+                params = []
+                for object_id in batch:
+                    params += [user_id, kind, object_id, deleted]
+                    params += version_params
+                cursor.execute(
+                    'INSERT INTO {table} ({user}, {kind}, {object}, '
+                    '{deleted}, {version}) VALUES {rows} '
+                    'ON CONFLICT ({kind}, {object}) DO UPDATE SET '
+                    '{user} = EXCLUDED.{user}, '
+                    '{deleted} = EXCLUDED.{deleted}, '
+                    '{version} = EXCLUDED.{version}'.format(
+                        table=quote(self.model._meta.db_table),
+                        user=quote('user_id'), kind=quote('kind'),
+                        object=quote('object_id'), deleted=quote('deleted'),
+                        version=quote('version'),
+                        rows=', '.join(
+                            ['(%s, %s, %s, %s, {})'.format(version)] *
+                            len(batch)
+                        ),
+                    ),
+                    params,
+                )
+
+        # wakes the event streams of the user, see recipe.events
+        events.notify(user_id, self.db)
+
+
+class Change(models.Model):
+    """Latest change to a tag, ingredient or recipe. Rows of deleted objects
+    are kept as tombstones. Clients pass back the horizon of their last
+    sync to only receive what changed since, see ChangeManager"""
+    # kinds are the model names of the synced models
+    KIND_TAG = 'tag'
+    KIND_INGREDIENT = 'ingredient'
+    KIND_RECIPE = 'recipe'
+    KIND_CHOICES = (
+        (KIND_TAG, 'Tag'),
+        (KIND_INGREDIENT, 'Ingredient'),
+        (KIND_RECIPE, 'Recipe'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # changes are recorded from signals while a user and their recipes are
+    # being deleted, so there is no database constraint on the user. The
+    # rows of deleted users are removed by core.deletion.delete_user()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    version = models.BigIntegerField(default=0)
+
+    objects = ChangeManager()
+
+    class Meta:
+        unique_together = (('kind', 'object_id'), )
+        # a sync without changes is a single probe of this index
+        indexes = [models.Index(fields=['user', 'version'])]
+
+
+class RequestProfile(models.Model):
+    """Profile of a single API request, see core.profiling"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    method = models.CharField(max_length=16)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_time_ms = models.FloatField()
+    # cProfile statistics as printed by pstats
+    stats = models.TextField()
+    # JSON list of the executed SQL with timings and EXPLAIN of slow queries
+    queries = models.TextField()
+
+    def __str__(self):
+        return '{} {}'.format(self.method, self.path)
+
+
+class QueryFingerprintManager(models.Manager):
+    """Accumulates statistics of normalized queries"""
+
+    def record(self, app, query, digest, count, total_ms, max_ms):
+        """Add the statistics of `count` executions of a query"""
+        values = {
+            'count': models.F('count') + count,
+            'total_ms': models.F('total_ms') + total_ms,
+            'max_ms': Greatest('max_ms', models.Value(max_ms)),
+            'last_seen': timezone.now(),
+        }
+        queryset = self.filter(app=app, digest=digest)
+        if queryset.update(**values):
+            return
+
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(app=app, digest=digest, query=query, count=count,
+                            total_ms=total_ms, max_ms=max_ms,
+                            last_seen=values['last_seen'])
+        except IntegrityError:
+            # another process created the row first
+            queryset.update(**values)
+
+
+class QueryFingerprint(models.Model):
+    """Statistics of a normalized query issued by an app, see
+    core.querylog"""
+    app = models.CharField(max_length=100)
+    # sha1 of the normalized query
+    digest = models.CharField(max_length=40)
+    query = models.TextField()
+    count = models.BigIntegerField()
+    total_ms = models.FloatField()
+    max_ms = models.FloatField()
+    last_seen = models.DateTimeField()
+
+    objects = QueryFingerprintManager()
+
+    class Meta:
+        unique_together = ('app', 'digest')
+
+    def __str__(self):
+        return self.query
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count
+
+
+def hash_token(key):
+    """Return the digest under which a token key is stored"""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class AuthTokenManager(models.Manager):
+    """Issues and looks up expiring auth tokens"""
+
+    def rotate(self, user):
+        """Replace the user's token with a new one and return the new key
+        with its token. Only the hash of the key is stored"""
+        key = secrets.token_hex(20)
+        if sharding.enabled():
+            # tells which user, and so which shard, to look the token up in
+            key = '{}.{}'.format(user.pk, key)
+        with transaction.atomic(using=self.db):
+            self.filter(user=user).delete()
+            token = self.create(
+                digest=hash_token(key),
+                user=user,
+                expires=timezone.now() + settings.AUTH_TOKEN_TTL,
+            )
+        return key, token
+
+    def expired(self):
+        return self.filter(expires__lte=timezone.now())
+
+
+class AuthToken(models.Model):
+    """Expiring API token, see core.authentication. Lookups go by the
+    fixed width hash of the key, so a leaked table doesn't leak tokens"""
+    digest = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='auth_tokens',
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    # pushed back while the token is used, see AUTH_TOKEN_REFRESH
+    expires = models.DateTimeField(db_index=True)
+
+    objects = AuthTokenManager()
+
+    def __str__(self):
+        return self.digest
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of the tags and ingredients of a recipe, see
+    recipe.similarity"""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+    )
+    # array of uint32 minimums, one per hash function
+    signature = models.BinaryField()
+
+
+class RecipeBucket(models.Model):
+    """LSH bucket of one band of a recipe's signature. Recipes sharing a
+    bucket are candidates for being similar"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    bucket = models.BigIntegerField()
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='buckets',
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'bucket'])]
+
+
+class UserShard(models.Model):
+    """Directory entry telling which database a user lives on, see
+    core.sharding. Kept in the default database, the ids of the entries
+    are the ids of the users"""
+    email = models.EmailField(max_length=255, unique=True)
+    shard = models.CharField(max_length=100)
+    # number of times the user moved to another shard
+    epoch = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '{} ({})'.format(self.email, self.shard)
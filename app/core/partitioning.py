@@ -0,0 +1,172 @@
+from django.db import connection as default_connection
+
+
+# table, partition key. The M2M tables have no user column, so they are
+# partitioned by recipe which keeps the tags and ingredients of a recipe in
+# one partition
+TABLES = [
+    ('core_recipe_tags', 'recipe_id'),
+    ('core_recipe_ingredients', 'recipe_id'),
+    ('core_recipe', 'user_id'),
+    ('core_tag', 'user_id'),
+    ('core_ingredient', 'user_id'),
+]
+
+# hash partitioning needs PostgreSQL 11
+MIN_VERSION = 110000
+
+# Foreign keys can't point at a partitioned table whose primary key the
+# referencing table can't match, so the ones pointing at the partitioned
+# tables are replaced by deferred constraint triggers calling this. Like
+# the NO ACTION keys Django creates, it fails the commit when rows point
+# at a row that isn't there. The arguments are the row the trigger fires
+# for, NEW for the referencing table and OLD for the referenced one, then
+# the referencing table and column and the referenced table and column
+CHECK_REFERENCE = """
+CREATE OR REPLACE FUNCTION core_check_reference() RETURNS trigger AS $$
+DECLARE
+    value text;
+    broken boolean;
+BEGIN
+    IF TG_ARGV[0] = 'NEW' THEN
+        value := to_jsonb(NEW) ->> TG_ARGV[2];
+    ELSE
+        value := to_jsonb(OLD) ->> TG_ARGV[4];
+        IF TG_OP = 'UPDATE' AND to_jsonb(NEW) ->> TG_ARGV[4] = value THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    IF value IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- the check runs at commit, the rows may have changed again by then
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I = $1) '
+                   'AND NOT EXISTS (SELECT 1 FROM %I WHERE %I = $1)',
+                   TG_ARGV[1], TG_ARGV[2], TG_ARGV[3], TG_ARGV[4])
+        INTO broken USING value::bigint;
+    IF broken THEN
+        RAISE foreign_key_violation USING MESSAGE = format(
+            '%s.%s = %s is not present in table %s',
+            TG_ARGV[1], TG_ARGV[2], value, TG_ARGV[3]
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def check_supported(connection):
+    if connection.vendor != 'postgresql':
+        raise PartitioningError('Partitioning needs PostgreSQL')
+    if connection.pg_version < MIN_VERSION:
+        raise PartitioningError('Hash partitioning needs PostgreSQL 11')
+
+
+def is_partitioned(cursor, table):
+    """Return whether the table the name resolves to on the search path is
+    partitioned. Tables of the same name in other schemas don't count"""
+    cursor.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)",
+        [table]
+    )
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def partition_table(cursor, table, key, partitions):
+    """Replace a table with a copy hash partitioned by `key`.
+
+    The copy keeps the columns, defaults, checks, indexes and foreign keys
+    of the table. Its primary key becomes (id, key) since unique
+    constraints of partitioned tables have to include the partition key.
+    For the same reason foreign keys pointing at the table can't be kept.
+    They are dropped with the old table and replaced by constraint
+    triggers of the same name, see CHECK_REFERENCE"""
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = %s::regclass AND NOT indisprimary", [table]
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'", [table]
+    )
+    foreign_keys = cursor.fetchall()
+    # the keys of partitions are copies of their table's, which carry over
+    # to the partitions of the trigger as well
+    cursor.execute(
+        "SELECT c.conname, r.relname, a.attname, ra.attname "
+        "FROM pg_constraint c "
+        "JOIN pg_class r ON r.oid = c.conrelid "
+        "JOIN pg_attribute a ON a.attrelid = c.conrelid "
+        "AND a.attnum = c.conkey[1] "
+        "JOIN pg_attribute ra ON ra.attrelid = c.confrelid "
+        "AND ra.attnum = c.confkey[1] "
+        "WHERE c.confrelid = %s::regclass AND c.contype = 'f' "
+        "AND c.conparentid = 0", [table]
+    )
+    references = cursor.fetchall()
+
+    old = table + '_unpartitioned'
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, old))
+    cursor.execute(
+        'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        'PARTITION BY HASH ({})'.format(table, old, key)
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            'CREATE TABLE {0}_p{1} PARTITION OF {0} '
+            'FOR VALUES WITH (MODULUS {2}, REMAINDER {1})'.format(
+                table, remainder, partitions
+            )
+        )
+    cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(table, old))
+    # keep the id sequence, it would be dropped with the old table
+    cursor.execute('ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id'.format(table))
+    cursor.execute('DROP TABLE {} CASCADE'.format(old))
+
+    cursor.execute(
+        'ALTER TABLE {0} ADD CONSTRAINT {0}_pkey PRIMARY KEY (id, {1})'
+        .format(table, key)
+    )
+    for index in indexes:
+        cursor.execute(index)
+    for name, definition in foreign_keys:
+        cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(
+            table, name, definition
+        ))
+
+    cursor.execute(CHECK_REFERENCE)
+    for name, referencing, column, referenced in references:
+        for side, events, on in (('NEW', 'INSERT OR UPDATE', referencing),
+                                 ('OLD', 'UPDATE OR DELETE', table)):
+            cursor.execute(
+                'CREATE CONSTRAINT TRIGGER {} AFTER {} ON {} '
+                'DEFERRABLE INITIALLY DEFERRED FOR EACH ROW '
+                "EXECUTE PROCEDURE core_check_reference("
+                "'{}', '{}', '{}', '{}', '{}')".format(
+                    name, events, on,
+                    side, referencing, column, table, referenced,
+                )
+            )
+
+
+def partition_tables(partitions, connection=default_connection):
+    """Hash partition the recipe tables into `partitions` partitions each.
+    Tables that are already partitioned are left alone. Returns the names
+    of the tables that were partitioned"""
+    check_supported(connection)
+    partitioned = []
+    with connection.cursor() as cursor:
+        for table, key in TABLES:
+            if not is_partitioned(cursor, table):
+                partition_table(cursor, table, key, partitions)
+                partitioned.append(table)
+
+    return partitioned
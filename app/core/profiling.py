@@ -0,0 +1,125 @@
+import cProfile
+import io
+import json
+import pstats
+import random
+import time
+
+from django.conf import settings
+
+from core.models import RequestProfile
+from core.querylog import QueryRecorder, explain, fingerprint, is_select, \
+                          recording
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+class RequestProfiler:
+    """Collects cProfile statistics and the executed SQL while active"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.recorder = QueryRecorder()
+        self.duration = 0
+
+    @property
+    def queries(self):
+        return self.recorder.queries
+
+    def __enter__(self):
+        self._wrapper = recording(self.recorder)
+        self._wrapper.__enter__()
+        self._started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self._started
+        self._wrapper.__exit__(*exc_info)
+
+    def explain_slow_queries(self):
+        """Return the query plan of every SELECT slower than the threshold
+        by the index of the query"""
+        return {
+            index: explain(query['sql'], query['params'], query['using'])
+            for index, query in enumerate(self.queries)
+            if query['time_ms'] >= settings.PROFILER_SLOW_QUERY_MS and
+            is_select(query['sql'])
+        }
+
+    def stored_queries(self):
+        """Return the queries as stored with the profile. Parameters and
+        literals are left out, as they hold emails, password hashes and
+        token digests that admin users have no business reading"""
+        plans = self.explain_slow_queries()
+        queries = []
+        for index, query in enumerate(self.queries):
+            stored = {'sql': fingerprint(query['sql']),
+                      'time_ms': query['time_ms']}
+            if index in plans:
+                stored['explain'] = plans[index]
+            queries.append(stored)
+        return queries
+
+    def save(self, request, response, user):
+        """Store the profile, keeping only the latest ones"""
+        queries = self.stored_queries()
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(
+            'cumulative'
+        ).print_stats(40)
+
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:255],
+            status_code=response.status_code,
+            duration_ms=self.duration * 1000,
+            query_count=len(queries),
+            query_time_ms=sum(query['time_ms'] for query in queries),
+            stats=stream.getvalue(),
+            queries=json.dumps(queries, indent=2),
+        )
+
+        oldest_kept = RequestProfile.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[settings.PROFILER_MAX_PROFILES - 1:settings.PROFILER_MAX_PROFILES]
+        RequestProfile.objects.filter(id__lt=oldest_kept).delete()
+
+        return profile
+
+
+class ProfiledViewMixin:
+    """Profile requests to a DRF view. A request is profiled when it is
+    sampled by PROFILER_SAMPLE_RATE or when a staff user sends the
+    X-Profile: 1 header. Profiles can be browsed in the admin"""
+
+    def dispatch(self, request, *args, **kwargs):
+        self.profiler = None
+        if random.random() < settings.PROFILER_SAMPLE_RATE:
+            self.profiler = RequestProfiler().__enter__()
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.profiler is not None:
+                self.profiler.__exit__(None, None, None)
+
+        if self.profiler is not None:
+            user = getattr(self.request, '_user', None)
+            if user is not None and not user.is_authenticated:
+                user = None
+            self.profiler.save(request, response, user)
+
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # the header is only honoured once the request is authenticated as
+        # staff, so other clients can't make the server profile for them
+        if self.profiler is None and \
+                request.META.get(PROFILE_HEADER) == '1' and \
+                request.user.is_staff:
+            self.profiler = RequestProfiler().__enter__()
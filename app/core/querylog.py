@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, \
+                      connections
+from django.urls import Resolver404, resolve
+
+from core.models import QueryFingerprint
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+# string and number literals and the placeholders of query parameters
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+# IN lists and VALUES rows of any length
+_LISTS = re.compile(r'\((?:\s*\?\s*,)*\s*\?\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+# string literals in query plans, which show the values queries filter by
+_PLAN_STRINGS = re.compile(r"'(?:[^']|'')*'")
+
+
+def fingerprint(sql):
+    """Normalize a query so that executions with different parameters,
+    IN lists or number of inserted rows share the same fingerprint"""
+    sql = _WHITESPACE.sub(' ', sql.strip())
+    sql = _LITERALS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return _ROWS.sub('(...)', sql)
+
+
+def explain(sql, params, using=DEFAULT_DB_ALIAS):
+    """Return the query plan of a SELECT query on the database `using`.
+    String literals are replaced, as plans show the parameters the query
+    filters by, e.g. emails and token digests"""
+    database = connections[using]
+    try:
+        with database.cursor() as cursor:
+            cursor.execute(
+                database.ops.explain_query_prefix() + ' ' + sql, params
+            )
+            plan = '\n'.join(
+                ' '.join(str(col) for col in row)
+                for row in cursor.fetchall()
+            )
+    except DatabaseError as exc:
+        # the message can quote a parameter as well
+        return 'EXPLAIN failed: {}'.format(type(exc).__name__)
+    return _PLAN_STRINGS.sub("'?'", plan)
+
+
+def is_select(sql):
+    return sql.lstrip().upper().startswith('SELECT')
+
+
+class QueryRecorder:
+    """Database execute wrapper that times every query"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': None if many else params,
+                'using': context['connection'].alias,
+                'time_ms': (time.perf_counter() - started) * 1000,
+            })
+
+
+@contextmanager
+def recording(recorder):
+    """Pass the queries of the block to the recorder, on every database
+    including the shards"""
+    with ExitStack() as stack:
+        for database in connections.all():
+            stack.enter_context(database.execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryStats:
+    """Query statistics of this process by app and fingerprint. They are
+    written to the QueryFingerprint table at most every
+    QUERY_LOG_FLUSH_SECONDS to keep the overhead off the requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def add(self, app, queries):
+        fingerprints = [(fingerprint(query['sql']), query['time_ms'])
+                        for query in queries]
+        with self.lock:
+            for sql, time_ms in fingerprints:
+                count, total_ms, max_ms = self.pending.get(
+                    (app, sql), (0, 0.0, 0.0)
+                )
+                self.pending[(app, sql)] = (
+                    count + 1, total_ms + time_ms, max(max_ms, time_ms)
+                )
+
+    def flush_due(self):
+        return self.pending and time.monotonic() - self.last_flush >= \
+            settings.QUERY_LOG_FLUSH_SECONDS
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+
+        for (app, sql), (count, total_ms, max_ms) in pending.items():
+            QueryFingerprint.objects.record(
+                app, sql, hashlib.sha1(sql.encode()).hexdigest(),
+                count, total_ms, max_ms,
+            )
+
+
+stats = QueryStats()
+
+
+class QueryLogMiddleware:
+    """Collect query statistics for requests to the apps in QUERY_LOG_APPS
+    and log their queries slower than QUERY_LOG_SLOW_MS with the plan"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        app = self.logged_app(request)
+        if app is None:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with recording(recorder):
+            response = self.get_response(request)
+
+        stats.add(app, recorder.queries)
+        for query in recorder.queries:
+            if query['time_ms'] >= settings.QUERY_LOG_SLOW_MS:
+                self.log_slow_query(request, query)
+
+        # stats are only written outside of transactions, so that they
+        # are not rolled back with the request and don't hold its locks
+        if stats.flush_due() and not connection.in_atomic_block:
+            stats.flush()
+
+        return response
+
+    def logged_app(self, request):
+        """Return the app of the request if it is in QUERY_LOG_APPS. The
+        path is resolved before the view runs, so that the queries of other
+        requests aren't kept at all"""
+        try:
+            match = resolve(request.path_info,
+                            getattr(request, 'urlconf', None))
+        except Resolver404:
+            return None
+        if match.app_name in settings.QUERY_LOG_APPS:
+            return match.app_name
+        return None
+
+    def log_slow_query(self, request, query):
+        plan = explain(query['sql'], query['params'], query['using']) \
+            if is_select(query['sql']) else ''
+        logger.warning(
+            'Slow query (%.1fms) during %s %s: %s\n%s',
+            query['time_ms'], request.method, request.path, query['sql'],
+            plan,
+        )
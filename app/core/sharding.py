@@ -0,0 +1,398 @@
+import itertools
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import F, Max
+
+
+# holds the directory of which user lives on which shard, and the models
+# that aren't owned by a user
+DIRECTORY_DB = 'default'
+GLOBAL_MODELS = {'core.usershard', 'core.queryfingerprint'}
+# apps whose models are spread over the shards, the rest stays on the
+# default database
+SHARDED_APPS = {'core'}
+
+# rows copied per INSERT when moving a user
+MOVE_BATCH_SIZE = 1000
+
+
+class ShardingError(Exception):
+    pass
+
+
+def enabled():
+    return len(settings.SHARDS) > 1
+
+
+# the shard of the user the current request or job is working for
+_state = threading.local()
+
+
+def current():
+    return getattr(_state, 'alias', None)
+
+
+def activate(alias):
+    _state.alias = alias
+
+
+def deactivate():
+    _state.alias = None
+
+
+@contextmanager
+def use_shard(alias):
+    """Send the queries of the block to the shard `alias`"""
+    previous = current()
+    activate(alias)
+    try:
+        yield
+    finally:
+        activate(previous)
+
+
+class ShardRouter:
+    """Routes the user owned models to the active shard and everything
+    else to the default database. Objects loaded from a shard are saved
+    back to it. Every database gets the full schema, so that any of them
+    can be a shard"""
+
+    def _sharded(self, model):
+        return (model._meta.app_label in SHARDED_APPS and
+                model._meta.label_lower not in GLOBAL_MODELS)
+
+    def _db(self, model, instance=None):
+        if not self._sharded(model):
+            return DIRECTORY_DB
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return current() or DIRECTORY_DB
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # user data can't point at another shard, the shared models like
+        # content types exist on every database
+        if self._sharded(type(obj1)) and self._sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if '{}.{}'.format(app_label, model_name) in GLOBAL_MODELS:
+            return db == DIRECTORY_DB
+        return None
+
+
+class ShardMiddleware:
+    """Makes sure no request inherits the shard of the previous request
+    served by its thread"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        deactivate()
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate()
+
+
+# user id to (shard, move epoch, time of the lookup) of the recently seen
+# users
+_directory = OrderedDict()
+_directory_lock = threading.Lock()
+
+
+def _remember(user_id, alias, epoch):
+    with _directory_lock:
+        _directory[user_id] = (alias, epoch, time.monotonic())
+        _directory.move_to_end(user_id)
+        while len(_directory) > settings.SHARD_DIRECTORY_SIZE:
+            _directory.popitem(last=False)
+
+
+def clear_directory():
+    with _directory_lock:
+        _directory.clear()
+
+
+def _lookup(user_id):
+    """Return the shard and move epoch of a user, (None, None) for unknown
+    users. Lookups are cached by each process for SHARD_DIRECTORY_TTL
+    seconds"""
+    with _directory_lock:
+        alias, epoch, looked_up = _directory.get(user_id, (None, None, 0))
+    if time.monotonic() - looked_up < settings.SHARD_DIRECTORY_TTL:
+        return alias, epoch
+
+    from core.models import UserShard
+    alias, epoch = UserShard.objects.filter(pk=user_id).values_list(
+        'shard', 'epoch'
+    ).first() or (None, None)
+    if alias is not None:
+        _remember(user_id, alias, epoch)
+    return alias, epoch
+
+
+def shard_for_user(user_id):
+    """Return the shard of a user or None for unknown users"""
+    if not enabled():
+        return DIRECTORY_DB
+    return _lookup(user_id)[0]
+
+
+def epoch_for_user(user_id):
+    """Return the number of times a user moved to another shard, which
+    tells apart data like Change versions that only compare within one
+    stay on a shard"""
+    if not enabled():
+        return 0
+    return _lookup(user_id)[1] or 0
+
+
+def shard_for_email(email):
+    """Return the shard of the user with the email or None"""
+    if not enabled():
+        return DIRECTORY_DB
+
+    from core.models import UserShard
+    return UserShard.objects.filter(email=email).values_list(
+        'shard', flat=True
+    ).first()
+
+
+def activate_user(user_id):
+    """Make the shard of the user the active one. Returns False for users
+    missing from the directory"""
+    alias = shard_for_user(user_id)
+    if alias is None:
+        return False
+    if enabled():
+        activate(alias)
+    return True
+
+
+def pick_shard(email):
+    """Return the shard new users with the email are placed on"""
+    return settings.SHARDS[
+        zlib.crc32(email.lower().encode()) % len(settings.SHARDS)
+    ]
+
+
+def assign(user):
+    """Add a new user to the directory and return the shard to save them
+    to. The directory hands out the ids, so they are unique across shards.
+    Staff stays on the default database, where the admin site works"""
+    from core.models import UserShard
+    alias = DIRECTORY_DB if user.is_staff else pick_shard(user.email)
+
+    entry = UserShard.objects.create(email=user.email, shard=alias)
+    user.pk = entry.pk
+    _remember(entry.pk, alias, entry.epoch)
+    return alias
+
+
+def rename(user):
+    """Follow a change of the user's email in the directory"""
+    if enabled():
+        from core.models import UserShard
+        UserShard.objects.filter(pk=user.pk).update(email=user.email)
+
+
+def forget(user):
+    """Remove a deleted user from the directory, unless the entry already
+    points at another shard than the one the user was deleted from"""
+    if enabled():
+        from core.models import UserShard
+        UserShard.objects.filter(pk=user.pk, shard=user._state.db).delete()
+        with _directory_lock:
+            _directory.pop(user.pk, None)
+
+
+_rotation = itertools.count()
+
+
+def rotated():
+    """Return the shards starting with a different one on each call, so
+    that polling them in this order treats all of them alike"""
+    start = next(_rotation) % len(settings.SHARDS)
+    return settings.SHARDS[start:] + settings.SHARDS[:start]
+
+
+def register_users(alias):
+    """Add the users of a database to the directory, for switching an
+    existing database to sharding. Returns the number of users added"""
+    from core.models import UserShard
+    with use_shard(alias):
+        users = list(get_user_model().objects.exclude(
+            pk__in=list(UserShard.objects.values_list('pk', flat=True))
+        ).values_list('pk', 'email'))
+    UserShard.objects.bulk_create([
+        UserShard(pk=pk, email=email, shard=alias) for pk, email in users
+    ])
+
+    connection = connections[DIRECTORY_DB]
+    if users and connection.vendor == 'postgresql':
+        # ids handed out from now on have to follow the registered ones
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('core_usershard', "
+                "'id'), %s)",
+                [UserShard.objects.aggregate(last=Max('pk'))['last']]
+            )
+    return len(users)
+
+
+def interleave_sequences(alias):
+    """Make the id sequences of a PostgreSQL shard hand out the ids that
+    are equal to its position in SHARDS modulo the number of shards, so
+    that rows keep their ids when users move between shards"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        raise ShardingError('Interleaving ids needs PostgreSQL')
+
+    count = len(settings.SHARDS)
+    offset = settings.SHARDS.index(alias) + 1
+    with connection.cursor() as cursor:
+        for table in _sharded_tables():
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+            if sequence is None:
+                continue
+            cursor.execute(
+                'SELECT GREATEST(last_value, (SELECT COALESCE(MAX(id), 0) '
+                'FROM {})) FROM {}'.format(table, sequence)
+            )
+            last = cursor.fetchone()[0]
+            # the first id above everything handed out so far that belongs
+            # to this shard
+            start = last + 1 + (offset - last - 1) % count
+            cursor.execute('ALTER SEQUENCE {} INCREMENT BY {}'.format(
+                sequence, count
+            ))
+            cursor.execute('SELECT setval(%s, %s, false)', [sequence, start])
+
+
+def _sharded_tables():
+    from django.apps import apps
+    for app_label in SHARDED_APPS:
+        for model in apps.get_app_config(app_label).get_models(
+            include_auto_created=True
+        ):
+            if model._meta.label_lower not in GLOBAL_MODELS:
+                yield model._meta.db_table
+
+
+def _user_querysets(user):
+    """Return everything that moves with the user, rows referenced by
+    other rows in the list first. Jobs and request profiles are history
+    and stay behind"""
+    from core.models import AuthToken, Change, Ingredient, Recipe, \
+        RecipeBucket, RecipeSignature, Tag
+    return [
+        get_user_model()._base_manager.filter(pk=user.pk),
+        AuthToken.objects.filter(user=user),
+        Tag.objects.filter(user=user),
+        Ingredient.objects.filter(user=user),
+        Recipe.objects.filter(user=user),
+        Recipe.tags.through.objects.filter(recipe__user=user),
+        Recipe.ingredients.through.objects.filter(recipe__user=user),
+        RecipeSignature.objects.filter(recipe__user=user),
+        RecipeBucket.objects.filter(user=user),
+        Change.objects.filter(user=user),
+    ]
+
+
+def _copy(queryset, target):
+    """Copy the rows of the queryset to the target database as they are.
+    Returns the number of rows copied"""
+    manager = queryset.model._base_manager.db_manager(target)
+    copied = 0
+    rows = queryset.iterator(chunk_size=MOVE_BATCH_SIZE)
+    while True:
+        batch = list(itertools.islice(rows, MOVE_BATCH_SIZE))
+        if not batch:
+            return copied
+        if manager.filter(pk__in=[row.pk for row in batch]).exists():
+            raise ShardingError(
+                '{} ids are taken on {}, interleave the id sequences with '
+                'the setup_shards command'.format(
+                    queryset.model._meta.label, target
+                )
+            )
+        manager.bulk_create(batch)
+        copied += len(batch)
+
+
+def move_user(user_id, target, drain=0):
+    """Move a user with their recipe data to the shard `target`.
+
+    The user is deactivated and their signed tokens are revoked first, then
+    the move waits `drain` seconds for requests that still use the old
+    shard to finish and the other processes to drop the cached directory
+    entry. The data is copied in one transaction
+    on the target, the directory is switched and the originals are deleted.
+    Returns the number of rows copied by model"""
+    from core import deletion
+    from core.models import UserShard, forget_token_version
+
+    if target not in settings.SHARDS:
+        raise ShardingError('Unknown shard {}'.format(target))
+    source, epoch = UserShard.objects.filter(pk=user_id).values_list(
+        'shard', 'epoch'
+    ).first() or (None, None)
+    if source is None:
+        raise ShardingError('Unknown user {}'.format(user_id))
+    if source == target:
+        raise ShardingError('User {} is on {} already'.format(
+            user_id, target
+        ))
+
+    User = get_user_model()
+    with use_shard(source):
+        user = User.objects.get(pk=user_id)
+        User.objects.filter(pk=user_id).update(
+            is_active=False, token_version=F('token_version') + 1
+        )
+    forget_token_version(user_id)
+    time.sleep(drain)
+
+    counts = {}
+    try:
+        with use_shard(source), transaction.atomic(using=target):
+            for queryset in _user_querysets(user):
+                label = queryset.model._meta.label
+                counts[label] = counts.get(label, 0) + _copy(queryset,
+                                                             target)
+            with use_shard(target):
+                User.objects.filter(pk=user_id).update(
+                    is_active=user.is_active
+                )
+    except Exception:
+        with use_shard(source):
+            User.objects.filter(pk=user_id).update(is_active=user.is_active)
+        forget_token_version(user_id)
+        raise
+
+    # the versions of the user's changes on the target don't continue the
+    # ones on the source, the new epoch makes sync clients start over
+    UserShard.objects.filter(pk=user_id).update(shard=target,
+                                                epoch=epoch + 1)
+    _remember(user_id, target, epoch + 1)
+    forget_token_version(user_id)
+    with use_shard(source):
+        deletion.delete_user(user)
+
+    return counts
@@ -0,0 +1,130 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+                                     pre_delete
+from django.dispatch import receiver
+
+from core.models import Change, Tag, Ingredient, Recipe, User, \
+                        forget_token_version
+
+
+KINDS = {
+    Tag: Change.KIND_TAG,
+    Ingredient: Change.KIND_INGREDIENT,
+    Recipe: Change.KIND_RECIPE,
+}
+
+
+def record_recipes(recipe_ids):
+    """Record a change to each of the recipes, grouped by their owner"""
+    by_user = {}
+    for recipe_id, user_id in Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('id', 'user_id'):
+        by_user.setdefault(user_id, []).append(recipe_id)
+
+    for user_id, ids in by_user.items():
+        Change.objects.record(user_id, Change.KIND_RECIPE, ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def record_save(sender, instance, **kwargs):
+    """Record that a synced object was created or updated"""
+    Change.objects.record(instance.user_id, KINDS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def record_delete(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted object"""
+    Change.objects.record(instance.user_id, KINDS[sender], [instance.pk],
+                          deleted=True)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def record_unlinked_recipes(sender, instance, **kwargs):
+    """Record the recipes that lose a tag or ingredient being deleted"""
+    record_recipes(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def record_relation_change(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Record the recipes whose tags or ingredients changed"""
+    if reverse and action == 'pre_clear':
+        # clearing from the tag or ingredient side doesn't tell which
+        # recipes lose it, so collect them before the rows are gone
+        record_recipes(instance.recipe_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            Change.objects.record(instance.user_id, Change.KIND_RECIPE,
+                                  [instance.pk])
+        elif pk_set:
+            record_recipes(pk_set)
+
+
+def _adjust_counts(model, using, ids, delta):
+    """Add delta to the recipe_count of the tags or ingredients with the
+    ids, which can be a queryset of them to run as a subquery. The database
+    does the arithmetic, so concurrent changes add up"""
+    if not delta or (isinstance(ids, (list, set)) and not ids):
+        return
+    model.objects.using(using).filter(pk__in=ids).update(
+        recipe_count=Greatest(F('recipe_count') + delta, 0)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_relation_change(sender, instance, action, reverse, model, pk_set,
+                          using, **kwargs):
+    """Keep the recipe_count of tags and ingredients in step with the M2M
+    table. The rows to remove are matched against the table first, as
+    removing objects that aren't linked sends them in pk_set as well"""
+    # the column of the M2M table for the tag or ingredient
+    column = (type(instance) if reverse else model)._meta.model_name
+    links = sender.objects.using(using)
+
+    if not reverse:
+        if action == 'post_add':
+            _adjust_counts(model, using, pk_set, 1)
+        elif action in ('pre_remove', 'pre_clear'):
+            links = links.filter(recipe=instance)
+            if action == 'pre_remove':
+                links = links.filter(**{column + '__in': pk_set})
+            # a subquery of the same UPDATE, rather than a read of its own
+            _adjust_counts(model, using,
+                           links.values_list(column, flat=True), -1)
+    elif action == 'post_add':
+        _adjust_counts(type(instance), using, [instance.pk], len(pk_set))
+    elif action == 'pre_remove':
+        removed = links.filter(recipe__in=pk_set, **{column: instance}) \
+            .count()
+        _adjust_counts(type(instance), using, [instance.pk], -removed)
+    elif action == 'post_clear':
+        type(instance).objects.using(using).filter(pk=instance.pk).update(
+            recipe_count=0
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, using, **kwargs):
+    """Take a recipe being deleted out of the counts of its tags and
+    ingredients. Its M2M rows are deleted without sending m2m_changed"""
+    for model in (Tag, Ingredient):
+        model.objects.using(using).filter(recipe=instance).update(
+            recipe_count=Greatest(F('recipe_count') - 1, 0)
+        )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_token_version(sender, instance, **kwargs):
+    """Check the signed tokens of a user that was deactivated or deleted
+    against the database again"""
+    forget_token_version(instance.pk)
@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from rest_framework.exceptions import ValidationError
+
+from core import sharding
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# maps a task name to the function that runs it. Apps register their tasks
+# in a tasks.py module which is imported by autodiscover()
+_registry = {}
+
+
+def task(name):
+    """Register the decorated function as the task with the given name.
+    The function is called with the job and the keyword arguments it was
+    enqueued with and must return something JSON serializable"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import the tasks module of every installed app"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(name, user=None, **payload):
+    """Queue a job for the named task and return it"""
+    if name not in _registry:
+        autodiscover()
+    if name not in _registry:
+        raise ValueError('Unknown task {}'.format(name))
+
+    return Job.objects.create(
+        name=name,
+        user=user,
+        payload=json.dumps(payload),
+    )
+
+
+def claim_next_job():
+    """Lock the oldest queued job, mark it as running and return it.
+    Workers skip rows that another worker has already locked so they never
+    block on each other or run the same job twice"""
+    with transaction.atomic(using=Job.objects.db):
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.STATUS_QUEUED,
+        ).order_by('id').first()
+
+        if job is None:
+            return None
+
+        job.status = Job.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.lease_expires = job.started_at + settings.JOB_LEASE
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'lease_expires',
+                                'attempts'])
+
+    return job
+
+
+def _attempt(job):
+    """Return the job's row as long as it is on the attempt of `job`. Once
+    it was queued again and claimed by another worker it's theirs"""
+    return Job.objects.using(job._state.db).filter(pk=job.pk,
+                                                   attempts=job.attempts)
+
+
+def renew_lease(job):
+    """Push back the lease of a running job. Returns False when the job
+    isn't running on this attempt anymore"""
+    return bool(_attempt(job).filter(status=Job.STATUS_RUNNING).update(
+        lease_expires=timezone.now() + settings.JOB_LEASE,
+    ))
+
+
+@contextmanager
+def lease(job):
+    """Renew the lease of the job every JOB_HEARTBEAT from another thread
+    while the block runs, so that long jobs aren't taken for ones whose
+    worker died"""
+    done = threading.Event()
+
+    def heartbeat():
+        try:
+            while not done.wait(settings.JOB_HEARTBEAT.total_seconds()):
+                if not renew_lease(job):
+                    logger.warning('Job %s %s lost its lease',
+                                   job.pk, job.name)
+                    return
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record its result or error. The result of an
+    attempt that lost its lease to another one is dropped"""
+    try:
+        func = _registry[job.name]
+        with lease(job):
+            result = func(job, **json.loads(job.payload))
+    except ValidationError as exc:
+        # the user sent something invalid, which they are told about
+        job.status = Job.STATUS_FAILED
+        job.error = 'Invalid payload: {}'.format(json.dumps(exc.detail))
+    except Exception:
+        # other details stay in the server log
+        logger.exception('Job %s %s failed', job.pk, job.name)
+        job.status = Job.STATUS_FAILED
+        job.error = 'Internal error'
+    else:
+        job.status = Job.STATUS_DONE
+        job.result = json.dumps(result)
+
+    job.finished_at = timezone.now()
+    if not _attempt(job).update(status=job.status, result=job.result,
+                                error=job.error,
+                                finished_at=job.finished_at):
+        logger.warning('Job %s %s was taken over, dropped its result',
+                       job.pk, job.name)
+
+    return job
+
+
+def requeue_stale_jobs():
+    """Queue the running jobs again whose lease ran out, as their worker
+    stopped renewing it. Jobs that were attempted JOB_MAX_ATTEMPTS times
+    fail instead. Returns the number of jobs requeued and failed"""
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        lease_expires__lt=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=settings.JOB_MAX_ATTEMPTS).update(
+        status=Job.STATUS_QUEUED,
+    )
+    failed = stale.update(
+        status=Job.STATUS_FAILED,
+        error='Timed out',
+        finished_at=timezone.now(),
+    )
+    return requeued, failed
+
+
+def run_next_job():
+    """Claim and run one job. Returns the job or None if the queue is empty.
+    With sharding, jobs are queued on the shard of their user and each
+    shard is polled in turn, the job runs with its shard active"""
+    if not sharding.enabled():
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+        return job
+
+    for alias in sharding.rotated():
+        with sharding.use_shard(alias):
+            job = claim_next_job()
+            if job is not None:
+                run_job(job)
+                return job
+
+    return None
+
+
+def requeue_all_stale_jobs():
+    """Run requeue_stale_jobs on every shard. Returns the total number of
+    jobs requeued and failed"""
+    if not sharding.enabled():
+        return requeue_stale_jobs()
+
+    requeued = failed = 0
+    for alias in sharding.rotated():
+        with sharding.use_shard(alias):
+            shard_requeued, shard_failed = requeue_stale_jobs()
+        requeued += shard_requeued
+        failed += shard_failed
+    return requeued, failed
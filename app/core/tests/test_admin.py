@@ -1,11 +1,21 @@
+from io import StringIO
+from unittest import skipUnless
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 
 # allows us to generate urls for admin page
 from django.urls import reverse
 
 # test client that allows us to make test requests to our application
 from django.test import Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.admin import EstimatedCountPaginator
+from core.models import Tag, Ingredient, Recipe
+from core.tests.test_partitioning import supported as partitioning_supported
 
 
 class AdminSiteTests(TestCase):
@@ -58,3 +68,177 @@ class AdminSiteTests(TestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, 200)
+
+    def test_delete_user_page(self):
+        """Test that the delete page summarizes and deletes the user"""
+        Recipe.objects.create(user=self.user, title='Toast', time_minutes=2,
+                              price=1.00)
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Recipes: 1')
+
+        response = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.id).exists()
+        )
+
+
+class LargeTableAdminTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@test.com',
+            password='password123'
+        )
+        self.client.force_login(self.admin_user)
+
+    def create_recipes(self, count):
+        """Create recipes owned by different users, each with its own tag
+        and ingredient"""
+        for _ in range(count):
+            user = get_user_model().objects.create_user(
+                email='user{}@test.com'.format(
+                    get_user_model().objects.count()
+                ),
+                password='password',
+            )
+            recipe = Recipe.objects.create(user=user, title='Toast',
+                                           time_minutes=2, price=1.00)
+            recipe.tags.add(Tag.objects.create(user=user, name='Quick'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=user, name='Bread')
+            )
+
+    def count_queries(self, url):
+        """Return the number of queries needed to render the url"""
+        # the first request fills caches such as the content types
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelist_queries_bounded(self):
+        """Test that the changelists use the same number of queries no
+        matter how many rows are shown"""
+        for name in ('tag', 'ingredient', 'recipe'):
+            url = reverse('admin:core_{}_changelist'.format(name))
+            self.create_recipes(2)
+            small = self.count_queries(url)
+            self.create_recipes(10)
+            large = self.count_queries(url)
+
+            self.assertEqual(small, large, name)
+
+    def test_recipe_change_page_skips_unrelated_choices(self):
+        """Test that the recipe form doesn't render every user, tag and
+        ingredient in the database as a choice"""
+        self.create_recipes(1)
+        other = get_user_model().objects.create_user(
+            email='other@test.com',
+            password='password',
+        )
+        Tag.objects.create(user=other, name='Unrelated tag')
+        Ingredient.objects.create(user=other, name='Unrelated ingredient')
+        url = reverse('admin:core_recipe_change',
+                      args=[Recipe.objects.get().id])
+
+        response = self.client.get(url)
+
+        self.assertContains(response, 'Quick')
+        self.assertNotContains(response, 'Unrelated')
+        self.assertNotContains(response, other.email)
+
+    def test_search_by_prefix(self):
+        """Test that the changelists search names by their start"""
+        self.create_recipes(1)
+        for name, prefix, infix, shown in (
+            ('tag', 'qui', 'uick', 'Quick'),
+            ('ingredient', 'BRE', 'read', 'Bread'),
+            ('recipe', 'toa', 'oast', 'Toast'),
+        ):
+            url = reverse('admin:core_{}_changelist'.format(name))
+
+            self.assertContains(self.client.get(url, {'q': prefix}), shown)
+            self.assertNotContains(self.client.get(url, {'q': infix}),
+                                   shown)
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+    def test_search_uses_index(self):
+        """Test that the prefix search can use the index of the column"""
+        with connection.cursor() as cursor:
+            # the tables are too small for the planner to prefer the index
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Ingredient.objects.filter(name__istartswith='bre').explain()
+
+        self.assertIn('core_ingredient_name_upper_idx', plan)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@test.com',
+                                                         'testpass')
+
+    def paginator(self, queryset):
+        paginator = EstimatedCountPaginator(queryset.order_by('id'), 10)
+        paginator.exact_count_threshold = 1
+        return paginator
+
+    def create_tags(self, count):
+        Tag.objects.bulk_create([
+            Tag(user=self.user, name='tag {}'.format(Tag.objects.count() + i))
+            for i in range(count)
+        ])
+
+    def analyze(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {}'.format(table))
+
+    def test_estimate_counted(self):
+        """Test that an unfiltered table is counted with its estimate,
+        which only changes when the table is analyzed again"""
+        self.create_tags(30)
+        self.analyze('core_tag')
+        self.create_tags(5)
+
+        with CaptureQueriesContext(connection) as context:
+            count = self.paginator(Tag.objects.all()).count
+
+        self.assertEqual(count, 30)
+        self.assertNotIn('COUNT(', context[0]['sql'])
+
+    def test_filtered_counted_exactly(self):
+        """Test that filtered querysets and small tables are counted"""
+        self.create_tags(30)
+        self.analyze('core_tag')
+        self.create_tags(5)
+
+        filtered = self.paginator(Tag.objects.filter(user=self.user))
+        small = EstimatedCountPaginator(Tag.objects.order_by('id'), 10)
+
+        self.assertEqual(filtered.count, 35)
+        self.assertEqual(small.count, 35)
+
+    @skipUnless(partitioning_supported(), 'needs PostgreSQL 11')
+    def test_partitioned_table_estimated(self):
+        """Test that a partitioned table is estimated once, from its
+        partitions, after the partitioned table was analyzed as well"""
+        call_command('partition_tables', '--partitions', '4',
+                     stdout=StringIO())
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title='Soup', time_minutes=5, price=1)
+            for _ in range(40)
+        ])
+        self.analyze('core_recipe')
+
+        self.assertEqual(self.paginator(Recipe.objects.all()).count, 40)
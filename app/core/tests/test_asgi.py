@@ -0,0 +1,113 @@
+import asyncio
+
+from django.core.wsgi import get_wsgi_application
+from django.test import SimpleTestCase, override_settings
+
+from core.asgi import WsgiToAsgi
+
+
+def echo_application(environ, start_response):
+    """WSGI application that echoes the request"""
+    start_response('201 Created', [('Content-Type', 'text/plain'),
+                                   ('X-Path', environ['PATH_INFO'])])
+    return [
+        environ['QUERY_STRING'].encode(),
+        b'|',
+        environ['wsgi.input'].read(),
+        b'|',
+        environ.get('HTTP_X_TEST', '').encode(),
+    ]
+
+
+def run(application, scope, body_chunks=(b'', )):
+    """Run an ASGI application and return the messages it sent"""
+    received = [
+        {'type': 'http.request', 'body': chunk,
+         'more_body': i < len(body_chunks) - 1}
+        for i, chunk in enumerate(body_chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.get_event_loop().run_until_complete(
+        application(scope, receive, send)
+    )
+    return sent
+
+
+def http_scope(path, method='GET', headers=(), query_string=b''):
+    """Return an ASGI http scope"""
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': list(headers),
+    }
+
+
+class WsgiToAsgiTests(SimpleTestCase):
+
+    def test_request_and_response(self):
+        """Test that the request is passed on and the response returned"""
+        application = WsgiToAsgi(echo_application, max_workers=2)
+        scope = http_scope('/echo/', method='POST',
+                           headers=[(b'x-test', b'yes')],
+                           query_string=b'a=1')
+
+        sent = run(application, scope, body_chunks=(b'hello ', b'world'))
+
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'x-path', b'/echo/'), sent[0]['headers'])
+        self.assertEqual(sent[1]['body'], b'a=1|hello world|yes')
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=8)
+    def test_large_body_streamed(self):
+        """Test that a body over the limit with a Content-Length is read by
+        the application as it arrives"""
+        chunks = (b'hello ', b'big ', b'world')
+        read = []
+
+        def application(environ, start_response):
+            stream = environ['wsgi.input']
+            while True:
+                read.append(stream.read(3))
+                if not read[-1]:
+                    break
+            return echo_application(environ, start_response)
+
+        scope = http_scope('/echo/', method='POST',
+                           headers=[(b'content-length', b'15')])
+
+        sent = run(WsgiToAsgi(application, max_workers=2), scope,
+                   body_chunks=chunks)
+
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertEqual(b''.join(read), b'hello big world')
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=8)
+    def test_large_body_without_length_refused(self):
+        """Test that a body over the limit without a Content-Length is
+        refused instead of being held in memory"""
+        scope = http_scope('/echo/', method='POST')
+
+        sent = run(WsgiToAsgi(echo_application, max_workers=2), scope,
+                   body_chunks=(b'hello ', b'big ', b'world'))
+
+        self.assertEqual(sent[0]['status'], 413)
+
+    def test_django_application(self):
+        """Test that the Django application is served"""
+        application = WsgiToAsgi(get_wsgi_application(), max_workers=2)
+
+        scope = http_scope('/api/recipe/tags/',
+                           headers=[(b'host', b'testserver')])
+
+        sent = run(application, scope)
+
+        self.assertEqual(sent[0]['status'], 401)
@@ -0,0 +1,203 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.authentication import issue_signed_tokens
+from core.models import AuthToken, hash_token
+
+
+ME_URL = reverse('user:me')
+REFRESH_URL = reverse('user:token-refresh')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ExpiringTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.key, self.token = AuthToken.objects.rotate(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.key)
+
+    def set_expires(self, expires):
+        AuthToken.objects.filter(pk=self.token.pk).update(expires=expires)
+
+    def test_only_hash_stored(self):
+        """Test the token key itself is not stored"""
+        self.assertEqual(self.token.digest, hash_token(self.key))
+        self.assertFalse(AuthToken.objects.filter(digest=self.key).exists())
+
+    def test_valid_token(self):
+        """Test a valid token authenticates the user"""
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_expired_token_rejected(self):
+        """Test an expired token is rejected"""
+        self.set_expires(timezone.now() - timedelta(seconds=1))
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_inactive_user_rejected(self):
+        """Test tokens of deactivated users are rejected"""
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_used_token_refreshed(self):
+        """Test using a token pushes its expiry back"""
+        expires = timezone.now() + timedelta(hours=1)
+        self.set_expires(expires)
+
+        self.client.get(ME_URL)
+
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.expires, expires + timedelta(days=1))
+
+    def test_recently_refreshed_token_not_written(self):
+        """Test the expiry isn't written on every request"""
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    def test_purge_tokens(self):
+        """Test the purge command deletes expired tokens only"""
+        other = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        AuthToken.objects.rotate(other)
+        self.set_expires(timezone.now() - timedelta(days=1))
+
+        call_command('purge_tokens', '--chunk-size', '1', stdout=StringIO())
+
+        self.assertEqual(
+            list(AuthToken.objects.values_list('user', flat=True)),
+            [other.id]
+        )
+
+
+class SignedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.tokens = issue_signed_tokens(self.user)
+        self.client = APIClient()
+
+    def authenticate(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access)
+
+    def test_valid_token_without_queries(self):
+        """Test a signed token authenticates without database access once
+        the token version of its user is cached"""
+        self.authenticate(self.tokens['access'])
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(1):
+            # the only query lists the user's tags
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_user_loaded_for_profile(self):
+        """Test the rest of the user is loaded when it is needed"""
+        self.authenticate(self.tokens['access'])
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_tampered_token_rejected(self):
+        """Test a token with a wrong signature is rejected"""
+        self.authenticate(self.tokens['access'][:-1] + 'x')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    @override_settings(ACCESS_TOKEN_TTL=timedelta(seconds=-1))
+    def test_expired_token_rejected(self):
+        """Test an expired access token is rejected"""
+        self.authenticate(self.tokens['access'])
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_refresh(self):
+        """Test a refresh token gives new tokens"""
+        res = self.client.post(REFRESH_URL,
+                               {'refresh': self.tokens['refresh']})
+
+        self.assertEqual(res.status_code, 200)
+        self.authenticate(res.data['access'])
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+    def test_revoked_access_rejected(self):
+        """Test access tokens stop working as soon as they are revoked"""
+        self.authenticate(self.tokens['access'])
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        self.user.revoke_signed_tokens()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_deactivated_user_rejected(self):
+        """Test access tokens of deactivated users stop working"""
+        self.authenticate(self.tokens['access'])
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_refresh_single_use(self):
+        """Test a refresh token used twice revokes the user's tokens"""
+        res = self.client.post(REFRESH_URL,
+                               {'refresh': self.tokens['refresh']})
+        self.assertEqual(res.status_code, 200)
+        tokens = res.data
+
+        res = self.client.post(REFRESH_URL,
+                               {'refresh': self.tokens['refresh']})
+
+        self.assertEqual(res.status_code, 401)
+        res = self.client.post(REFRESH_URL, {'refresh': tokens['refresh']})
+        self.assertEqual(res.status_code, 401)
+
+    def test_revoked_refresh_rejected(self):
+        """Test refresh tokens stop working once revoked"""
+        self.user.revoke_signed_tokens()
+
+        res = self.client.post(REFRESH_URL,
+                               {'refresh': self.tokens['refresh']})
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_password_change_revokes(self):
+        """Test changing the password revokes the signed tokens"""
+        self.authenticate(self.tokens['access'])
+        self.client.patch(ME_URL, {'password': 'newpass'})
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
@@ -1,3 +1,5 @@
+from io import StringIO
+
 # with this we can reliably simulate situations where the database is available
 # for queries and when it is NOT available for queries. We will mock the
 # get_database function in django here
@@ -12,6 +14,10 @@ from django.core.management import call_command
 from django.db.utils import OperationalError
 
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from core import tasks
+from core.models import Job
 
 # Addding a management command to the core app of django project
 # wait_for_db is going to be a helper command that will tell django to wait
@@ -96,3 +102,15 @@ class CommandTests(TestCase):
             # Here it will be mocked to raise the errors previously
             # described
             self.assertEqual(gi.call_count, 6)
+
+    def test_run_jobs_burst(self):
+        """Test that the worker runs every queued job and then exits"""
+        user = get_user_model().objects.create_user('test@test.com', 'pass')
+        tasks.enqueue('recipe.export', user=user)
+        tasks.enqueue('recipe.export', user=user)
+
+        call_command('run_jobs', burst=True, stdout=StringIO())
+
+        self.assertEqual(
+            Job.objects.filter(status=Job.STATUS_DONE).count(), 2
+        )
@@ -0,0 +1,94 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Tag, Ingredient, Recipe
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe counts of tags and ingredients follow their links"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@test.com',
+                                                         'testpass')
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+        self.salad = self.recipe('Salad')
+
+    def recipe(self, title):
+        return Recipe.objects.create(user=self.user, title=title,
+                                     time_minutes=5, price='1.00')
+
+    def counts(self, *objects):
+        return [type(obj).objects.get(pk=obj.pk).recipe_count
+                for obj in objects]
+
+    def test_add_and_remove(self):
+        """Test linking and unlinking recipes changes the counts"""
+        soup = self.recipe('Soup')
+        self.salad.tags.add(self.vegan, self.quick)
+        soup.add_related('tags', [self.vegan.pk])
+        soup.ingredients.add(self.kale)
+        self.assertEqual(self.counts(self.vegan, self.quick, self.kale),
+                         [2, 1, 1])
+
+        # removing something that isn't linked changes nothing
+        soup.remove_related('tags', [self.vegan.pk, self.quick.pk])
+        self.salad.tags.clear()
+        self.assertEqual(self.counts(self.vegan, self.quick), [0, 0])
+
+    def test_replace_related(self):
+        """Test replacing the tags of a recipe moves the counts"""
+        self.salad.tags.add(self.vegan)
+
+        self.salad.replace_related('tags', [self.quick.pk])
+
+        self.assertEqual(self.counts(self.vegan, self.quick), [0, 1])
+
+    def test_replace_prefetched(self):
+        """Test replacing the prefetched tags of a recipe takes the current
+        ones from the prefetch and drops it afterwards"""
+        self.salad.tags.add(self.vegan)
+        salad = Recipe.objects.prefetch_related('tags').get(pk=self.salad.pk)
+
+        salad.replace_related('tags', [self.vegan.pk, self.quick.pk])
+        salad.replace_related('tags', [self.quick.pk])
+
+        self.assertEqual(self.counts(self.vegan, self.quick), [0, 1])
+        self.assertEqual(list(salad.tags.all()), [self.quick])
+
+    def test_reverse_relation(self):
+        """Test changes from the tag's side are counted"""
+        soup = self.recipe('Soup')
+        self.vegan.recipe_set.add(self.salad, soup)
+        self.assertEqual(self.counts(self.vegan), [2])
+
+        self.vegan.recipe_set.remove(soup)
+        self.assertEqual(self.counts(self.vegan), [1])
+
+        self.vegan.recipe_set.clear()
+        self.assertEqual(self.counts(self.vegan), [0])
+
+    def test_recipe_deleted(self):
+        """Test deleting a recipe takes it out of the counts"""
+        self.salad.tags.add(self.vegan)
+        self.salad.ingredients.add(self.kale)
+
+        self.salad.delete()
+
+        self.assertEqual(self.counts(self.vegan, self.kale), [0, 0])
+
+    def test_reconcile_counts(self):
+        """Test the command corrects counts that drifted"""
+        self.salad.tags.add(self.vegan)
+        Tag.objects.filter(pk=self.vegan.pk).update(recipe_count=5)
+        Tag.objects.filter(pk=self.quick.pk).update(recipe_count=1)
+
+        out = StringIO()
+        call_command('reconcile_counts', stdout=out)
+
+        self.assertIn('Corrected 2 tag counts', out.getvalue())
+        self.assertEqual(self.counts(self.vegan, self.quick), [1, 0])
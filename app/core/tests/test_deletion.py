@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core import deletion
+from core.models import Tag, Ingredient, Recipe
+
+
+def sample_recipe(user, **params):
+    """Create a sample recipe with one tag and one ingredient"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.tags.add(Tag.objects.get_or_create_by_name(user.pk, 'Vegan')[0])
+    recipe.ingredients.add(
+        Ingredient.objects.get_or_create_by_name(user.pk, 'Kale')[0]
+    )
+    return recipe
+
+
+class DeleteUserTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+
+    def test_delete_user_removes_owned_data(self):
+        """Test that the user and all of their recipe data are deleted"""
+        for _ in range(3):
+            sample_recipe(self.user)
+        sample_recipe(self.other)
+
+        counts = deletion.delete_user(self.user, chunk_size=2)
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(counts['core.Recipe'], 3)
+        self.assertEqual(counts['core.Recipe_tags'], 3)
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 1)
+
+    def test_delete_user_unlinks_tags_from_other_recipes(self):
+        """Test that the user's tags are removed from other users' recipes"""
+        recipe = sample_recipe(self.other)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+
+        deletion.delete_user(self.user)
+
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)),
+                         ['Vegan'])
+
+    def test_delete_user_command(self):
+        """Test that the command deletes the given users"""
+        sample_recipe(self.user)
+
+        call_command('delete_user', self.user.email, stdout=StringIO())
+
+        self.assertFalse(Recipe.objects.exists())
+        self.assertTrue(
+            get_user_model().objects.filter(pk=self.other.pk).exists()
+        )
@@ -1,3 +1,4 @@
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -54,6 +55,50 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        """Test that a user can't have two tags differing only in case"""
+        user = sample_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=sample_user('other@test.com'),
+                                  name='vegan')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='VEGAN')
+
+    def test_get_or_create_by_name(self):
+        """Test that existing names are matched regardless of case"""
+        user = sample_user()
+        salt, created = models.Ingredient.objects.get_or_create_by_name(
+            user.pk, 'Salt'
+        )
+        self.assertTrue(created)
+
+        existing, created = models.Ingredient.objects.get_or_create_by_name(
+            user.pk, 'salt'
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(existing, salt)
+
+    def test_get_or_create_non_ascii_names(self):
+        """Test that names are lowercased the same way as by the index,
+        which on SQLite leaves non-ASCII letters as they are"""
+        user = sample_user()
+        apples, _ = models.Ingredient.objects.get_or_create_by_name(
+            user.pk, 'Äpfel'
+        )
+
+        existing, created = models.Ingredient.objects.get_or_create_by_name(
+            user.pk, 'Äpfel'
+        )
+        found = models.Ingredient.objects.get_or_create_names(
+            user.pk, ['Äpfel', 'ÄPFEL']
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(existing, apples)
+        self.assertEqual(found, [apples])
+
     def test_ingredient_str(self):
         """Test the ingredient string representation"""
         ingredient = models.Ingredient.objects.create(
@@ -0,0 +1,89 @@
+import re
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+from core import partitioning
+from core.models import Tag, Ingredient, Recipe
+
+
+def supported():
+    try:
+        partitioning.check_supported(connection)
+    except partitioning.PartitioningError:
+        return False
+    return True
+
+
+class PartitioningTests(TestCase):
+
+    def partition(self):
+        # DDL is rolled back with the test's transaction
+        call_command('partition_tables', '--partitions', '4',
+                     stdout=StringIO())
+        user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        recipe = Recipe.objects.create(user=user, title='Soup',
+                                       time_minutes=5, price=1)
+        recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=user, name='Kale')
+        )
+        return user, recipe
+
+    def assertViolates(self, sql, params):
+        """Assert the statement breaks one of the replaced foreign keys"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                # the triggers are deferred to the commit by default
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    @skipUnless(supported(), 'needs PostgreSQL 11')
+    def test_partitioned_tables_prune_by_user(self):
+        """Test the partitioned tables work and user queries use one
+        partition"""
+        user, recipe = self.partition()
+
+        self.assertEqual(
+            list(Recipe.objects.filter(user=user, tags__name='Vegan')),
+            [recipe]
+        )
+        plan = Recipe.objects.filter(user=user).explain()
+        # the index names of a partition start with its name as well
+        scanned = set(re.findall(r' on (core_recipe_p\d+)', plan))
+        self.assertEqual(len(scanned), 1)
+
+    @skipUnless(supported(), 'needs PostgreSQL 11')
+    def test_references_checked(self):
+        """Test the foreign keys into the partitioned tables are still
+        enforced"""
+        user, recipe = self.partition()
+        tag = recipe.tags.get()
+
+        self.assertViolates(
+            'INSERT INTO core_recipe_tags (recipe_id, tag_id) '
+            'VALUES (%s, %s)', [recipe.id + 1000, tag.id]
+        )
+        self.assertViolates('DELETE FROM core_tag WHERE id = %s', [tag.id])
+        self.assertViolates('UPDATE core_recipe SET id = %s WHERE id = %s',
+                            [recipe.id + 1000, recipe.id])
+
+        # Django deletes the rows pointing at an object first
+        recipe.delete()
+        tag.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    @skipUnless(connection.vendor != 'postgresql', 'needs another database')
+    def test_unsupported_database(self):
+        """Test partitioning is refused on other databases"""
+        with self.assertRaises(CommandError):
+            call_command('partition_tables', stdout=StringIO())
@@ -0,0 +1,114 @@
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import RequestProfile, Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class RequestProfileTests(TestCase):
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            'staff@test.com',
+            'testpass',
+            is_staff=True,
+        )
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        Tag.objects.create(user=self.staff, name='Vegan')
+        self.client = APIClient()
+
+    def test_staff_header_stores_profile(self):
+        """Test a staff user can profile a request with the header"""
+        self.client.force_authenticate(self.staff)
+        res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.method, 'GET')
+        self.assertEqual(profile.path, TAGS_URL)
+        self.assertEqual(profile.status_code, 200)
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('function calls', profile.stats)
+        queries = json.loads(profile.queries)
+        self.assertTrue(any('core_tag' in q['sql'] for q in queries))
+
+    def test_header_ignored_for_regular_users(self):
+        """Test the header doesn't store profiles for non staff users"""
+        self.client.force_authenticate(self.user)
+        self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_header_needs_authentication(self):
+        """Test anonymous requests with the header aren't profiled"""
+        with patch('core.profiling.RequestProfiler') as profiler:
+            res = self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 401)
+        profiler.assert_not_called()
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_parameters_not_stored(self):
+        """Test profiles don't keep the values queries were run with"""
+        self.client.post(reverse('user:create'), {
+            'email': 'new@test.com', 'password': 'secretpass',
+            'name': 'New',
+        })
+
+        profile = RequestProfile.objects.get()
+        password = get_user_model().objects.get(
+            email='new@test.com'
+        ).password
+        self.assertNotIn('new@test.com', profile.queries)
+        self.assertNotIn(password, profile.queries)
+        for query in json.loads(profile.queries):
+            self.assertNotIn('params', query)
+
+    def test_not_profiled_by_default(self):
+        """Test requests aren't profiled without the header"""
+        self.client.force_authenticate(self.staff)
+        self.client.get(TAGS_URL)
+
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_sampled_requests_stored(self):
+        """Test sampled requests are stored for any user"""
+        self.client.force_authenticate(self.user)
+        self.client.get(TAGS_URL)
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.user, self.user)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0, PROFILER_MAX_PROFILES=3)
+    def test_only_latest_profiles_kept(self):
+        """Test older profiles are dropped past the limit"""
+        self.client.force_authenticate(self.user)
+        for _ in range(5):
+            self.client.get(TAGS_URL)
+
+        self.assertEqual(RequestProfile.objects.count(), 3)
+
+    @override_settings(PROFILER_SLOW_QUERY_MS=0)
+    def test_slow_queries_explained(self):
+        """Test slow SELECT queries get their query plan attached"""
+        self.client.force_authenticate(self.staff)
+        self.client.get(TAGS_URL, HTTP_X_PROFILE='1')
+
+        queries = json.loads(RequestProfile.objects.get().queries)
+        selects = [q for q in queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for query in selects:
+            self.assertIn('explain', query)
@@ -0,0 +1,235 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+from rest_framework.test import APIClient
+
+from core.authentication import issue_signed_tokens
+from core.benchmark import seed_user
+from core.models import Tag, Ingredient, Recipe
+from batch import urls as batch_urls
+from recipe import matching, urls as recipe_urls
+from user import urls as user_urls
+
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+# set to record the measured query counts as the new budgets
+UPDATE_ENV = 'UPDATE_QUERY_BUDGETS'
+
+SMALL = 2
+LARGE = 6
+
+HTTP_METHODS = ['get', 'post', 'put', 'patch', 'delete']
+
+
+def discover_routes():
+    """Return (url name, method) of every route of the recipe, user and
+    batch URLconfs"""
+    routes = set()
+    for pattern in recipe_urls.router.urls:
+        if pattern.name == 'api-root':
+            continue
+        for method in pattern.callback.actions:
+            routes.add(('recipe:' + pattern.name, method))
+
+    for app_name, patterns in (('recipe', recipe_urls.urlpatterns),
+                               ('user', user_urls.urlpatterns),
+                               ('batch', batch_urls.urlpatterns)):
+        for pattern in patterns:
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if view_class is None:
+                # the router include(), covered above
+                continue
+            for method in HTTP_METHODS:
+                if hasattr(view_class, method):
+                    routes.add(('{}:{}'.format(app_name, pattern.name),
+                                method))
+
+    return sorted(routes)
+
+
+def recipe_data(user, size):
+    return {
+        'title': 'Chocolate cheesecake',
+        'time_minutes': 30,
+        'price': '5.00',
+        'tags': _ids(Tag, user)[:size],
+        'ingredients': _ids(Ingredient, user)[:size],
+    }
+
+
+def _ids(model, user):
+    return list(model.objects.filter(user=user).order_by('id')
+                .values_list('id', flat=True))
+
+
+def _detail(name, user):
+    return reverse(name, args=[Recipe.objects.filter(user=user).first().id])
+
+
+def _image():
+    image = io.BytesIO()
+    Image.new('RGB', (64, 48)).save(image, 'PNG')
+    image.name = 'image.png'
+    image.seek(0)
+    return image
+
+
+# builds the url and request data of a route for a user seeded with `size`
+# recipes, tags and ingredients, and optionally the format to send the data
+# in, JSON by default. Every route needs an entry here
+CASES = {
+    ('recipe:tag-list', 'get'): lambda user, size: (
+        reverse('recipe:tag-list'), None),
+    ('recipe:tag-list', 'post'): lambda user, size: (
+        reverse('recipe:tag-list'), {'name': 'Dessert'}),
+    ('recipe:ingredient-list', 'get'): lambda user, size: (
+        reverse('recipe:ingredient-list'), None),
+    ('recipe:ingredient-list', 'post'): lambda user, size: (
+        reverse('recipe:ingredient-list'), {'name': 'Cocoa'}),
+    ('recipe:recipe-list', 'get'): lambda user, size: (
+        reverse('recipe:recipe-list'), None),
+    ('recipe:recipe-list', 'post'): lambda user, size: (
+        reverse('recipe:recipe-list'), recipe_data(user, size)),
+    ('recipe:recipe-detail', 'get'): lambda user, size: (
+        _detail('recipe:recipe-detail', user), None),
+    ('recipe:recipe-detail', 'put'): lambda user, size: (
+        _detail('recipe:recipe-detail', user), recipe_data(user, size)),
+    ('recipe:recipe-detail', 'patch'): lambda user, size: (
+        _detail('recipe:recipe-detail', user),
+        {'ingredients': _ids(Ingredient, user)}),
+    ('recipe:recipe-detail', 'delete'): lambda user, size: (
+        _detail('recipe:recipe-detail', user), None),
+    ('recipe:recipe-tags', 'post'): lambda user, size: (
+        _detail('recipe:recipe-tags', user), {'tags': _ids(Tag, user)}),
+    ('recipe:recipe-tags', 'delete'): lambda user, size: (
+        _detail('recipe:recipe-tags', user), {'tags': _ids(Tag, user)}),
+    ('recipe:recipe-ingredients', 'post'): lambda user, size: (
+        _detail('recipe:recipe-ingredients', user),
+        {'ingredients': _ids(Ingredient, user)}),
+    ('recipe:recipe-ingredients', 'delete'): lambda user, size: (
+        _detail('recipe:recipe-ingredients', user),
+        {'ingredients': _ids(Ingredient, user)}),
+    ('recipe:recipe-similar', 'get'): lambda user, size: (
+        _detail('recipe:recipe-similar', user), None),
+    ('recipe:recipe-match', 'get'): lambda user, size: (
+        reverse('recipe:recipe-match'),
+        {'ingredients': ','.join(map(str, _ids(Ingredient, user))),
+         'missing': 1}),
+    ('recipe:recipe-upload-image', 'post'): lambda user, size: (
+        _detail('recipe:recipe-upload-image', user), {'image': _image()},
+        'multipart'),
+    ('recipe:recipe-export', 'post'): lambda user, size: (
+        reverse('recipe:recipe-export'), None),
+    ('recipe:recipe-import-recipes', 'post'): lambda user, size: (
+        reverse('recipe:recipe-import-recipes'),
+        [{'title': 'Recipe', 'time_minutes': 5, 'price': '1.00'}] * size),
+    ('recipe:stats', 'get'): lambda user, size: (
+        reverse('recipe:stats'), None),
+    ('recipe:shopping-list', 'get'): lambda user, size: (
+        reverse('recipe:shopping-list'),
+        {'recipes': ','.join(map(str, _ids(Recipe, user)))}),
+    ('recipe:sync', 'get'): lambda user, size: (
+        reverse('recipe:sync'), None),
+    ('recipe:events', 'get'): lambda user, size: (
+        reverse('recipe:events'), None),
+    ('user:create', 'post'): lambda user, size: (
+        reverse('user:create'),
+        {'email': 'new{}@test.com'.format(size), 'password': 'testpass',
+         'name': 'New'}),
+    ('user:token', 'post'): lambda user, size: (
+        reverse('user:token'),
+        {'email': user.email, 'password': 'benchpass'}),
+    ('user:token-refresh', 'post'): lambda user, size: (
+        reverse('user:token-refresh'),
+        {'refresh': issue_signed_tokens(user)['refresh']}),
+    ('user:me', 'get'): lambda user, size: (reverse('user:me'), None),
+    ('user:me', 'put'): lambda user, size: (
+        reverse('user:me'),
+        {'email': user.email, 'password': 'newpass', 'name': 'Renamed'}),
+    ('user:me', 'patch'): lambda user, size: (
+        reverse('user:me'), {'name': 'Renamed'}),
+    ('user:me', 'delete'): lambda user, size: (reverse('user:me'), None),
+    ('batch:batch', 'post'): lambda user, size: (
+        reverse('batch:batch'),
+        {'requests': [{'method': 'GET', 'path': reverse(name)} for name in (
+            'user:me', 'recipe:tag-list', 'recipe:ingredient-list',
+            'recipe:recipe-list',
+        )]}),
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Every API route must issue the same number of queries for small and
+    large recipe books, and no more than its budget in query_budgets.json.
+    Budgets are kept per database vendor, since Postgres runs queries the
+    others don't, like the pg_notify of every recorded change. Run with
+    UPDATE_QUERY_BUDGETS=1 to record the current counts of the vendor"""
+
+    def setUp(self):
+        matching.clear_indexes()
+        media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media_root)
+
+    def count_queries(self, route, size):
+        # recipes are linked to half of the tags and ingredients, so that
+        # adding all of them to a recipe has something to do
+        user = seed_user(recipes=size, tags=size * 2, ingredients=size * 2,
+                         per_recipe=size)
+        url, data, request_format = (CASES[route](user, size) + ('json', ))[:3]
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = getattr(client, route[1])(url, data, format=request_format)
+            if res.streaming:
+                # count the queries up to the first chunk of a stream
+                next(iter(res.streaming_content))
+
+        self.assertLess(res.status_code, 300, getattr(res, 'data', None))
+        return len(queries)
+
+    def test_query_budgets(self):
+        """Test the query count of every route is constant and in budget"""
+        with open(BUDGETS_FILE) as f:
+            all_budgets = json.load(f)
+        budgets = all_budgets.get(connection.vendor, {})
+        measured = {}
+
+        for route in discover_routes():
+            key = '{} {}'.format(route[0], route[1].upper())
+            with self.subTest(route=key):
+                self.assertTrue(route in CASES, 'Add a case for the route')
+                small = self.count_queries(route, SMALL)
+                large = self.count_queries(route, LARGE)
+                measured[key] = large
+
+                self.assertEqual(
+                    small, large,
+                    'Query count grows with the amount of data'
+                )
+                if os.environ.get(UPDATE_ENV):
+                    continue
+                self.assertIn(key, budgets, 'No {} query budget recorded, '
+                                            'run with {}=1'.format(
+                                                connection.vendor,
+                                                UPDATE_ENV))
+                self.assertLessEqual(large, budgets[key],
+                                     'Query budget exceeded')
+
+        if os.environ.get(UPDATE_ENV):
+            all_budgets[connection.vendor] = measured
+            with open(BUDGETS_FILE, 'w') as f:
+                json.dump(all_budgets, f, indent=2, sort_keys=True)
+                f.write('\n')
@@ -0,0 +1,133 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import querylog
+from core.models import QueryFingerprint, Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class FingerprintTests(TestCase):
+
+    def test_parameters_normalized(self):
+        """Test literals and parameters are replaced"""
+        self.assertEqual(
+            querylog.fingerprint(
+                "SELECT *  FROM core_tag\n WHERE id = 5 AND name = 'it''s'"
+                " AND user_id = %s"
+            ),
+            'SELECT * FROM core_tag WHERE id = ? AND name = ? '
+            'AND user_id = ?'
+        )
+
+    def test_plan_literals_scrubbed(self):
+        """Test plans and EXPLAIN errors don't show the parameters"""
+        plan = querylog.explain(
+            'SELECT id FROM core_user WHERE email = %s', ['secret@test.com']
+        )
+        failed = querylog.explain(
+            'SELECT id FROM core_user WHERE id = %s LIMIT %s',
+            [1, 'secret'],
+        )
+
+        self.assertNotIn('EXPLAIN failed', plan)
+        self.assertNotIn('secret', plan)
+        self.assertNotIn('secret', failed)
+
+    def test_lists_normalized(self):
+        """Test IN lists and inserted rows of any length match"""
+        self.assertEqual(
+            querylog.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            querylog.fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+        self.assertEqual(
+            querylog.fingerprint('INSERT INTO t1 (a, b) VALUES (%s, %s), '
+                                 '(%s, %s)'),
+            'INSERT INTO t1 (a, b) VALUES (...)'
+        )
+
+
+class QueryLogMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        stats = patch.object(querylog, 'stats', querylog.QueryStats())
+        self.stats = stats.start()
+        self.addCleanup(stats.stop)
+
+    def test_recipe_queries_recorded(self):
+        """Test queries of recipe requests are counted by fingerprint"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        self.stats.flush()
+
+        query = QueryFingerprint.objects.get(
+            app='recipe', query__contains='"core_tag"'
+        )
+        self.assertEqual(query.count, 2)
+        self.assertIn('"user_id" = ?', query.query)
+        self.assertGreaterEqual(query.max_ms, query.avg_ms)
+
+    def test_flush_accumulates(self):
+        """Test flushing adds to the stored statistics"""
+        self.client.get(TAGS_URL)
+        self.stats.flush()
+        self.client.get(TAGS_URL)
+        self.stats.flush()
+
+        query = QueryFingerprint.objects.get(
+            app='recipe', query__contains='"core_tag"'
+        )
+        self.assertEqual(query.count, 2)
+
+    def test_other_apps_ignored(self):
+        """Test requests to other apps are not recorded"""
+        self.client.get(reverse('job:job-list'))
+        self.stats.flush()
+
+        self.assertFalse(QueryFingerprint.objects.exists())
+
+    def test_other_requests_not_recorded(self):
+        """Test the queries of requests that aren't logged are not kept
+        while they run"""
+        with patch.object(querylog, 'recording') as recording:
+            self.client.get(reverse('job:job-list'))
+            self.client.get('/not-found/')
+
+        recording.assert_not_called()
+
+    @override_settings(QUERY_LOG_SLOW_MS=0)
+    def test_slow_queries_logged_with_plan(self):
+        """Test slow queries are logged with their EXPLAIN plan"""
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(TAGS_URL)
+
+        message = next(line for line in logs.output if 'core_tag' in line)
+        self.assertIn('GET {}'.format(TAGS_URL), message)
+        self.assertNotIn('EXPLAIN failed', message)
+
+    def test_top_queries_command(self):
+        """Test the command lists the recorded queries"""
+        self.client.get(TAGS_URL)
+        self.stats.flush()
+
+        out = StringIO()
+        call_command('top_queries', '--app', 'recipe', '--reset', stdout=out)
+
+        self.assertIn('core_tag', out.getvalue())
+        self.assertFalse(QueryFingerprint.objects.exists())
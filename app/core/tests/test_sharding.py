@@ -0,0 +1,277 @@
+import itertools
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import querylog, sharding, tasks
+from core.models import AuthToken, Job, Recipe, RecipeSignature, Tag, \
+                        UserShard
+
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+SYNC_URL = reverse('recipe:sync')
+
+SHARDED = len(settings.SHARDS) > 1
+
+
+def email_on(alias):
+    """Return an email that places a new user on the shard"""
+    for i in itertools.count():
+        email = 'user{}@test.com'.format(i)
+        if sharding.pick_shard(email) == alias:
+            return email
+
+
+class ShardRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = sharding.ShardRouter()
+
+    def test_user_data_follows_active_shard(self):
+        """Test user owned models go to the active shard"""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        with sharding.use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(Recipe), 'shard1')
+            self.assertEqual(self.router.db_for_write(Tag), 'shard1')
+        self.assertIsNone(sharding.current())
+
+    def test_instances_saved_where_loaded(self):
+        """Test objects are written back to the database they came from"""
+        tag = Tag(name='Vegan')
+        tag._state.db = 'shard2'
+
+        with sharding.use_shard('shard1'):
+            self.assertEqual(
+                self.router.db_for_write(Tag, instance=tag), 'shard2'
+            )
+
+    def test_directory_stays_on_default(self):
+        """Test the directory is kept in the default database only"""
+        with sharding.use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(UserShard), 'default')
+        self.assertFalse(
+            self.router.allow_migrate('shard1', 'core', 'usershard')
+        )
+        self.assertIsNone(
+            self.router.allow_migrate('shard1', 'core', 'recipe')
+        )
+
+
+@skipUnless(SHARDED, 'Run with --settings=app.settings_shards')
+class ShardingTests(TestCase):
+    """Test users and their data live on the shard of the directory"""
+    multi_db = True
+
+    def setUp(self):
+        sharding.clear_directory()
+        self.email = email_on('shard1')
+        self.user = get_user_model().objects.create_user(self.email,
+                                                         'testpass')
+        self.client = APIClient()
+
+    def tearDown(self):
+        sharding.deactivate()
+
+    def sign_in(self):
+        res = self.client.post(TOKEN_URL, {'email': self.email,
+                                           'password': 'testpass'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        key = res.data['token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        return key
+
+    def test_user_created_on_shard(self):
+        """Test new users are stored on their shard with a directory
+        entry"""
+        User = get_user_model()
+        entry = UserShard.objects.get(pk=self.user.pk)
+
+        self.assertEqual(entry.shard, 'shard1')
+        self.assertEqual(entry.email, self.email)
+        self.assertTrue(User.objects.using('shard1').filter(
+            pk=self.user.pk).exists())
+        self.assertFalse(User.objects.using('default').filter(
+            pk=self.user.pk).exists())
+
+    def test_ids_unique_across_shards(self):
+        """Test users on different shards get different ids"""
+        other = get_user_model().objects.create_user(email_on('shard2'),
+                                                     'testpass')
+
+        self.assertEqual(UserShard.objects.get(pk=other.pk).shard, 'shard2')
+        self.assertNotEqual(other.pk, self.user.pk)
+
+    def test_superuser_on_default(self):
+        """Test staff is kept on the default database"""
+        admin = get_user_model().objects.create_superuser(
+            email_on('shard2'), 'testpass'
+        )
+
+        self.assertEqual(admin._state.db, 'default')
+        self.assertTrue(admin.is_superuser)
+
+    def test_email_unique_across_shards(self):
+        """Test signing up with an email taken on another shard fails"""
+        res = self.client.post(CREATE_USER_URL, {
+            'email': self.email, 'password': 'testpass', 'name': 'Test',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_token_requests_use_shard(self):
+        """Test data created with a token lands on the user's shard"""
+        key = self.sign_in()
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(key.startswith('{}.'.format(self.user.pk)))
+        self.assertTrue(Tag.objects.using('shard1').filter(
+            name='Vegan').exists())
+        self.assertFalse(Tag.objects.using('default').exists())
+
+    def test_signed_token_requests_use_shard(self):
+        """Test signed tokens find the user's shard"""
+        res = self.client.post(TOKEN_URL, {'email': self.email,
+                                           'password': 'testpass',
+                                           'signed': True})
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Bearer ' + res.data['access']
+        )
+        Tag.objects.using('shard1').create(user_id=self.user.pk,
+                                           name='Vegan')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data], ['Vegan'])
+
+    def test_jobs_run_on_shard(self):
+        """Test workers pick up the jobs queued on every shard"""
+        self.sign_in()
+        self.client.post(RECIPES_URL, {'title': 'Soup', 'time_minutes': 5,
+                                       'price': '1.00'})
+        self.client.post(EXPORT_URL)
+
+        job = tasks.run_next_job() or tasks.run_next_job() or \
+            tasks.run_next_job()
+
+        self.assertEqual(job._state.db, 'shard1')
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertIn('Soup', job.result)
+
+    def test_commands_cover_shards(self):
+        """Test the maintenance commands go through every shard"""
+        self.sign_in()
+        self.client.post(RECIPES_URL, {'title': 'Soup', 'time_minutes': 5,
+                                       'price': '1.00',
+                                       'ingredient_names': ['Kale']},
+                         format='json')
+        with sharding.use_shard('shard1'):
+            AuthToken.objects.update(expires=timezone.now() -
+                                     timedelta(days=1))
+            RecipeSignature.objects.all().delete()
+
+        call_command('purge_tokens', stdout=StringIO())
+        call_command('rebuild_similarity', stdout=StringIO())
+
+        with sharding.use_shard('shard1'):
+            self.assertFalse(AuthToken.objects.exists())
+            self.assertTrue(RecipeSignature.objects.exists())
+
+    @override_settings(QUERY_LOG_SLOW_MS=0)
+    def test_shard_queries_logged(self):
+        """Test the queries run on a shard are logged and explained there"""
+        self.sign_in()
+        Tag.objects.using('shard1').create(user_id=self.user.pk,
+                                           name='Vegan')
+        stats = patch.object(querylog, 'stats', querylog.QueryStats())
+        stats.start()
+        self.addCleanup(stats.stop)
+
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(TAGS_URL)
+
+        tag_queries = [line for line in logs.output
+                       if 'FROM "core_tag"' in line]
+        self.assertTrue(tag_queries)
+        self.assertNotIn('EXPLAIN failed', tag_queries[0])
+
+    def test_move_user(self):
+        """Test moving a user takes along their data and tokens"""
+        self.sign_in()
+        self.client.post(RECIPES_URL, {'title': 'Soup', 'time_minutes': 5,
+                                       'price': '1.00',
+                                       'tags': [], 'ingredients': []})
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        out = StringIO()
+        call_command('move_user', 'shard2', self.email, '--drain', '0',
+                     stdout=out)
+
+        self.assertIn('1 core.Recipe', out.getvalue())
+        self.assertEqual(UserShard.objects.get(pk=self.user.pk).shard,
+                         'shard2')
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        self.assertFalse(get_user_model().objects.using('shard1').exists())
+        self.assertTrue(Recipe.objects.using('shard2').filter(
+            title='Soup').exists())
+
+        sharding.clear_directory()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['title'] for recipe in res.data], ['Soup'])
+
+    def test_move_user_restarts_sync(self):
+        """Test sync cursors from before a move get a full sync, as the
+        versions of changes on the target don't follow the source's"""
+        self.sign_in()
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        sharding.move_user(self.user.pk, 'shard2')
+
+        sharding.clear_directory()
+        res = self.client.get(SYNC_URL, {'since': cursor})
+        self.assertTrue(res.data['full'])
+        self.assertEqual([tag['name'] for tag in res.data['tags']],
+                         ['Vegan'])
+        self.assertNotEqual(res.data['cursor'], cursor)
+
+        res = self.client.get(SYNC_URL, {'since': res.data['cursor']})
+        self.assertFalse(res.data['full'])
+
+    def test_move_user_keeps_ids_on_clash(self):
+        """Test the move is refused when ids are taken on the target"""
+        with sharding.use_shard('shard1'):
+            recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                           time_minutes=5, price='1.00')
+        other = get_user_model().objects.create_user(email_on('shard2'),
+                                                     'testpass')
+        with sharding.use_shard('shard2'):
+            Recipe.objects.create(pk=recipe.pk, user=other, title='Stew',
+                                  time_minutes=5, price='1.00')
+
+        with self.assertRaises(sharding.ShardingError):
+            sharding.move_user(self.user.pk, 'shard2')
+
+        self.assertEqual(UserShard.objects.get(pk=self.user.pk).shard,
+                         'shard1')
+        self.assertTrue(get_user_model().objects.using('shard1').get(
+            pk=self.user.pk).is_active)
+        self.assertFalse(get_user_model().objects.using('shard2').filter(
+            pk=self.user.pk).exists())
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+# modules a job worker doesn't need, which lean mode keeps it from loading
+WORKER_SKIPPED_MODULES = ['app.urls', 'core.admin', 'recipe.views',
+                          'user.views', 'job.views', 'batch.views']
+
+
+def run_python(code, lean=True):
+    """Run code after Django setup in a new interpreter and return its
+    output"""
+    env = dict(os.environ, DJANGO_LEAN_STARTUP='1' if lean else '0')
+    return subprocess.check_output(
+        [sys.executable, '-c', 'import django; django.setup(); ' + code],
+        env=env,
+        universal_newlines=True,
+    )
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_worker_boot_imports(self):
+        """Test that a job worker boots without the admin, the URLconf and
+        the views. Import time itself varies too much between machines to
+        be tested, the startup_profile command reports it"""
+        code = ('import sys; from core import tasks; tasks.autodiscover(); '
+                'print(" ".join(sorted(sys.modules)))')
+
+        loaded = run_python(code).split()
+
+        self.assertIn('recipe.tasks', loaded)
+        for module in WORKER_SKIPPED_MODULES:
+            self.assertNotIn(module, loaded)
+
+    def test_lean_startup_defers_admin(self):
+        """Test that lean startup doesn't load the admin modules"""
+        code = 'import sys; print("core.admin" in sys.modules)'
+
+        self.assertEqual(run_python(code, lean=False).strip(), 'True')
+        self.assertEqual(run_python(code, lean=True).strip(), 'False')
+
+    def test_lean_startup_urls_load_admin(self):
+        """Test that the admin is still registered once the URLconf loads"""
+        code = ('import app.urls; from django.contrib import admin; '
+                'from core import models; '
+                'print(admin.site.is_registered(models.Recipe))')
+
+        self.assertEqual(run_python(code).strip(), 'True')
+
+    def test_startup_profile(self):
+        """Test that the profile reports the URLconf import time"""
+        out = StringIO()
+        call_command('startup_profile', stdout=out)
+
+        self.assertIn('app.urls', out.getvalue())
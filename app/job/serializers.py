@@ -0,0 +1,23 @@
+import json
+
+from rest_framework import serializers
+
+from core.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serialize a background job"""
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at',
+                  )
+        read_only_fields = fields
+
+    def get_result(self, obj):
+        """Return the decoded result of a finished job"""
+        if not obj.result:
+            return None
+        return json.loads(obj.result)
@@ -0,0 +1,222 @@
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import tasks
+from core.models import Job, Recipe
+
+
+JOBS_URL = reverse('job:job-list')
+JOB_STATS_URL = reverse('job:job-stats')
+EXPORT_URL = reverse('recipe:recipe-export')
+IMPORT_URL = reverse('recipe:recipe-import-recipes')
+ME_URL = reverse('user:me')
+
+
+def detail_url(job_id):
+    """Return the job detail url"""
+    return reverse('job:job-detail', args=[job_id])
+
+
+class PublicJobsAPITests(TestCase):
+    """Test unauthenticated job API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = self.client.get(JOBS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateJobsAPITests(TestCase):
+    """Test authenticated job API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_jobs_limited_to_user(self):
+        """Test that users only see their own jobs"""
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        tasks.enqueue('recipe.export', user=user2)
+        job = tasks.enqueue('recipe.export', user=self.user)
+
+        response = self.client.get(JOBS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], job.id)
+
+    def test_export_recipes(self):
+        """Test that an export is queued and returns the recipes once run"""
+        Recipe.objects.create(user=self.user, title='Toast',
+                              time_minutes=2, price=1.00)
+
+        response = self.client.post(EXPORT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.STATUS_QUEUED)
+
+        tasks.run_next_job()
+        response = self.client.get(detail_url(response.data['id']))
+
+        self.assertEqual(response.data['status'], Job.STATUS_DONE)
+        self.assertEqual(len(response.data['result']), 1)
+        self.assertEqual(response.data['result'][0]['title'], 'Toast')
+
+    def test_import_recipes(self):
+        """Test that imported recipes are created by the worker"""
+        payload = [
+            {'title': 'Toast', 'time_minutes': 2, 'price': '1.00',
+             'tags': [], 'ingredients': []},
+            {'title': 'Tea', 'time_minutes': 3, 'price': '0.50',
+             'tags': [], 'ingredients': []},
+        ]
+        response = self.client.post(IMPORT_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Recipe.objects.exists())
+
+        job = tasks.run_next_job()
+
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def test_failed_job_records_error(self):
+        """Test that an invalid import fails without creating recipes"""
+        payload = [{'title': 'Toast'}]
+        self.client.post(IMPORT_URL, payload, format='json')
+
+        job = tasks.run_next_job()
+
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('Invalid payload', job.error)
+        self.assertIn('time_minutes', job.error)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_job_hides_traceback(self):
+        """Test that unexpected errors are logged, not shown to the user"""
+        job = tasks.enqueue('recipe.export', user=self.user)
+
+        with patch('recipe.tasks.Recipe.objects.filter',
+                   side_effect=RuntimeError('secret detail')), \
+                self.assertLogs('core.tasks', 'ERROR') as logs:
+            tasks.run_next_job()
+
+        self.assertIn('secret detail', logs.output[0])
+        response = self.client.get(detail_url(job.id))
+        self.assertEqual(response.data['status'], Job.STATUS_FAILED)
+        self.assertEqual(response.data['error'], 'Internal error')
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_stale_jobs_requeued(self):
+        """Test that jobs whose worker died are queued again, until they
+        were attempted too often"""
+        started = timezone.now() - timedelta(hours=10)
+        expired = timezone.now() - timedelta(minutes=1)
+        stale = tasks.enqueue('recipe.export', user=self.user)
+        exhausted = tasks.enqueue('recipe.export', user=self.user)
+        running = tasks.enqueue('recipe.export', user=self.user)
+        Job.objects.filter(pk__in=[stale.pk, exhausted.pk]).update(
+            status=Job.STATUS_RUNNING, started_at=started,
+            lease_expires=expired, attempts=1,
+        )
+        Job.objects.filter(pk=exhausted.pk).update(attempts=2)
+        # long running, but its worker keeps renewing the lease
+        Job.objects.filter(pk=running.pk).update(
+            status=Job.STATUS_RUNNING, started_at=started,
+            lease_expires=timezone.now() + timedelta(minutes=1),
+        )
+
+        self.assertEqual(tasks.requeue_stale_jobs(), (1, 1))
+
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[stale.pk], Job.STATUS_QUEUED)
+        self.assertEqual(statuses[exhausted.pk], Job.STATUS_FAILED)
+        self.assertEqual(statuses[running.pk], Job.STATUS_RUNNING)
+
+    def test_result_of_lost_attempt_dropped(self):
+        """Test a worker whose job was taken over doesn't overwrite it"""
+        tasks.enqueue('recipe.export', user=self.user)
+        job = tasks.claim_next_job()
+        # the lease ran out and another worker claimed the job
+        Job.objects.filter(pk=job.pk).update(attempts=job.attempts + 1)
+
+        with self.assertLogs('core.tasks', 'WARNING'):
+            tasks.run_job(job)
+
+        self.assertFalse(tasks.renew_lease(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+        self.assertEqual(job.result, '')
+
+    def test_delete_user(self):
+        """Test that deleting the user deactivates it and queues deletion"""
+        response = self.client.delete(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        job = tasks.run_next_job()
+
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+
+    def test_job_stats(self):
+        """Test that stats report queue depth and throughput"""
+        tasks.enqueue('recipe.export', user=self.user)
+        tasks.enqueue('recipe.export', user=self.user)
+        tasks.run_next_job()
+
+        response = self.client.get(JOB_STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'][Job.STATUS_QUEUED], 1)
+        self.assertEqual(response.data['status'][Job.STATUS_DONE], 1)
+        self.assertEqual(response.data['finished_last_hour'], 1)
+        self.assertIsNotNone(response.data['avg_duration_seconds'])
+
+
+@override_settings(JOB_HEARTBEAT=timedelta(milliseconds=20))
+class JobLeaseTests(TransactionTestCase):
+    """Test the lease of running jobs, renewed by a thread of its own that
+    needs to see the committed job"""
+
+    def test_lease_renewed_while_running(self):
+        """Test the lease of a job is pushed back for as long as it runs"""
+        leases = []
+
+        def slow(job):
+            leases.append(Job.objects.get(pk=job.pk).lease_expires)
+            time.sleep(0.2)
+            leases.append(Job.objects.get(pk=job.pk).lease_expires)
+            return {}
+
+        with patch.dict(tasks._registry, {'test.slow': slow}):
+            tasks.enqueue('test.slow')
+            job = tasks.run_next_job()
+
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertGreater(leases[1], leases[0])
+        self.assertEqual(tasks.requeue_stale_jobs(), (0, 0))
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F
+from django.utils import timezone
+
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication
+from core.models import Job
+from job import serializers
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Check the status of background jobs"""
+    serializer_class = serializers.JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+
+    def get_queryset(self):
+        """Return the jobs of the authenticated user. Staff see all jobs"""
+        queryset = self.queryset
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset.order_by('-id')
+
+    @action(detail=False)
+    def stats(self, request):
+        """Return queue depth and throughput of the visible jobs"""
+        queryset = self.get_queryset().order_by()
+        by_status = dict(
+            queryset.values_list('status').annotate(count=Count('id'))
+        )
+
+        since = timezone.now() - timedelta(hours=1)
+        finished = queryset.filter(finished_at__gte=since).aggregate(
+            count=Count('id'),
+            avg_duration=Avg(ExpressionWrapper(
+                F('finished_at') - F('started_at'),
+                output_field=DurationField(),
+            )),
+        )
+        avg_duration = finished['avg_duration']
+
+        return Response({
+            'status': {
+                status: by_status.get(status, 0)
+                for status, _ in Job.STATUS_CHOICES
+            },
+            'finished_last_hour': finished['count'],
+            'per_minute': round(finished['count'] / 60, 2),
+            'avg_duration_seconds': (
+                avg_duration.total_seconds() if avg_duration else None
+            ),
+        })
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest
+from rest_framework import exceptions
+from rest_framework.renderers import BaseRenderer
+
+from core import events, sharding
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication
+from core.models import Change
+
+
+# Clients open the stream with an EventSource and call the sync endpoint
+# with their cursor whenever a `changes` event arrives, including the one
+# sent right after connecting, which covers anything missed while they
+# were disconnected
+RETRY_MS = 5000
+
+
+def format_event(event=None, data=None, comment=None, retry=None):
+    """Return a server-sent event as bytes"""
+    lines = []
+    if comment is not None:
+        lines.append(': ' + comment)
+    if retry is not None:
+        lines.append('retry: {}'.format(retry))
+    if event is not None:
+        lines.append('event: ' + event)
+        lines.append('data: ' + json.dumps(data or {}))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+CHANGES = format_event('changes')
+KEEPALIVE = format_event(comment='keepalive')
+# sent when the credentials of a stream stop being valid, the stream ends
+# with it and reconnecting fails until the client has new ones
+UNAUTHENTICATED = {'detail': 'Invalid or missing credentials.'}
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renders the errors of the events endpoint as an `error` event"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
+
+
+def poll(request, alias=None):
+    """Yield the events of the stream of the request's user by polling the
+    Change log every EVENTS_POLL_SECONDS. Holds a thread for the whole
+    stream, so it ends after EVENTS_MAX_SECONDS and the client reconnects.
+    Only used when the application isn't served through the event loop of
+    EventStream"""
+    user_id = request.user.pk
+    deadline = time.monotonic() + settings.EVENTS_MAX_SECONDS
+    recheck = time.monotonic() + settings.EVENTS_KEEPALIVE_SECONDS
+    with sharding.use_shard(alias):
+        horizon = Change.objects.current_horizon(user_id)
+    # changes from the horizon on are read again by the next poll, these
+    # were announced already
+    seen = set()
+    yield format_event(retry=RETRY_MS) + CHANGES
+
+    quiet = 0
+    while time.monotonic() < deadline:
+        time.sleep(settings.EVENTS_POLL_SECONDS)
+        if time.monotonic() >= recheck:
+            recheck = time.monotonic() + settings.EVENTS_KEEPALIVE_SECONDS
+            with sharding.use_shard(alias):
+                authenticated = authenticated_user(request,
+                                                   request.authenticators)
+            if authenticated != user_id:
+                yield format_event('error', UNAUTHENTICATED)
+                return
+
+        with sharding.use_shard(alias):
+            changes, horizon = Change.objects.since(user_id, horizon)
+        versions = {(change.kind, change.object_id, change.version)
+                    for change in changes}
+        announce = versions - seen
+        seen = {key for key in versions if key[2] >= horizon}
+        if announce:
+            quiet = 0
+            yield CHANGES
+            continue
+
+        quiet += settings.EVENTS_POLL_SECONDS
+        if quiet >= settings.EVENTS_KEEPALIVE_SECONDS:
+            quiet = 0
+            yield KEEPALIVE
+
+
+def authenticated_user(request, authenticators):
+    """Return the id of the user the request authenticates as with one of
+    `authenticators` or None"""
+    try:
+        for authentication in authenticators:
+            result = authentication.authenticate(request)
+            if result is not None:
+                return result[0].pk
+    except exceptions.AuthenticationFailed:
+        pass
+    return None
+
+
+def authenticate(headers):
+    """Return the id of the user the ASGI headers authenticate or None"""
+    request = HttpRequest()
+    for name, value in headers:
+        name = name.decode('latin1').upper().replace('-', '_')
+        request.META['HTTP_' + name] = value.decode('latin1')
+
+    try:
+        return authenticated_user(request, (ExpiringTokenAuthentication(),
+                                            SignedTokenAuthentication()))
+    finally:
+        sharding.deactivate()
+        connections.close_all()
+
+
+class EventStream:
+    """ASGI application serving the change events of `path` from the event
+    loop and passing everything else on to `application`.
+
+    A stream waits on a queue of the process wide events.hub, which the
+    LISTEN connections fill from the notifications of every process, so
+    idle streams hold no thread or database connection. The database is
+    only used to authenticate the stream, which is done again every
+    EVENTS_KEEPALIVE_SECONDS so that streams end once their token expires
+    or is revoked"""
+
+    def __init__(self, application, path):
+        self.application = application
+        self.path = path
+        self.listeners = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == self.path and \
+                scope['method'] == 'GET':
+            await self.stream(scope, receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    async def stream(self, scope, receive, send):
+        loop = asyncio.get_event_loop()
+        user_id = await loop.run_in_executor(
+            None, authenticate, scope.get('headers', [])
+        )
+        if user_id is None:
+            await send({
+                'type': 'http.response.start',
+                'status': 401,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'www-authenticate', b'Token')],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': json.dumps(UNAUTHENTICATED).encode(),
+            })
+            return
+
+        if self.listeners is None:
+            self.listeners = events.start_listeners(events.hub)
+
+        recheck = loop.time() + settings.EVENTS_KEEPALIVE_SECONDS
+        queue = events.hub.subscribe(user_id)
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'),
+                            (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')],
+            })
+            await self.send_body(send, format_event(retry=RETRY_MS) + CHANGES)
+
+            while not disconnect.done():
+                changed = asyncio.ensure_future(queue.get())
+                await asyncio.wait(
+                    {changed, disconnect},
+                    timeout=settings.EVENTS_KEEPALIVE_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnect.done():
+                    changed.cancel()
+                    break
+
+                if loop.time() >= recheck:
+                    recheck = loop.time() + settings.EVENTS_KEEPALIVE_SECONDS
+                    authenticated = await loop.run_in_executor(
+                        None, authenticate, scope.get('headers', [])
+                    )
+                    if authenticated != user_id:
+                        changed.cancel()
+                        await send({
+                            'type': 'http.response.body',
+                            'body': format_event('error', UNAUTHENTICATED),
+                        })
+                        break
+
+                if changed.done():
+                    await self.send_body(send, CHANGES)
+                else:
+                    changed.cancel()
+                    await self.send_body(send, KEEPALIVE)
+        finally:
+            disconnect.cancel()
+            events.hub.unsubscribe(user_id, queue)
+
+    async def wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def send_body(self, send, body):
+        await send({'type': 'http.response.body', 'body': body,
+                    'more_body': True})
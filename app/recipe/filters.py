@@ -0,0 +1,21 @@
+from rest_framework.filters import BaseFilterBackend
+
+from recipe import serializers
+
+
+class RecipeRangeFilter(BaseFilterBackend):
+    """Filters recipes by ranges of their time and price, e.g.
+    ?time_minutes__lte=30 or ?price__range=5,10. Both columns lead an
+    index together with the user, so the filters stay cheap for users with
+    many recipes"""
+
+    def filter_queryset(self, request, queryset, view):
+        # the ranges select what is listed, not what a detail URL finds
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+
+        serializer = serializers.RecipeFilterSerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        return queryset.filter(**serializer.validated_data)
@@ -0,0 +1,195 @@
+import heapq
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+
+from core import sharding
+from core.models import Change, Recipe
+
+
+class IngredientIndex:
+    """Inverted index from each ingredient of a user to the recipes that
+    use it. The recipes of an ingredient are a bitset held in a Python int,
+    where bit i stands for the recipe at position i, so combining the
+    recipes of many ingredients is a handful of big integer operations.
+
+    The index follows the user's recipe changes in the Change log. Each
+    update only reloads the ingredients of the recipes that changed since
+    the last one"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.applied = set()
+        # recipe id to bit position and back, positions of deleted recipes
+        # are reused
+        self.positions = {}
+        self.recipe_ids = []
+        self.free = []
+        self.ingredients = {}
+        self.bitsets = {}
+        self.alive = 0
+
+    def update(self):
+        """Build the index or catch up with the recipes changed since"""
+        if self.cursor is None:
+            # read the cursor first, changes made while loading are
+            # simply applied again by the next update
+            self.cursor = Change.objects.current_horizon(self.user_id)
+            self.load(Recipe.objects.filter(user_id=self.user_id))
+            return
+
+        changes, self.cursor = Change.objects.since(
+            self.user_id, self.cursor, kind=Change.KIND_RECIPE,
+        )
+        # changes from the horizon on are read again by the next update,
+        # the ones applied already are skipped
+        versions = {(change.object_id, change.version) for change in changes}
+        applied, self.applied = self.applied, {
+            key for key in versions if key[1] >= self.cursor
+        }
+        recipe_ids = {recipe_id for recipe_id, _ in versions - applied}
+        if not recipe_ids:
+            return
+
+        for recipe_id in recipe_ids & self.positions.keys():
+            self.remove(recipe_id)
+        self.load(Recipe.objects.filter(user_id=self.user_id,
+                                        id__in=recipe_ids))
+
+    def load(self, recipes):
+        """Add the recipes of the queryset with their ingredients"""
+        ingredients = {recipe_id: set()
+                       for recipe_id in recipes.values_list('id', flat=True)}
+        rows = Recipe.ingredients.through.objects.filter(
+            recipe__in=recipes.values('id')
+        ).values_list('recipe_id', 'ingredient_id').iterator()
+        for recipe_id, ingredient_id in rows:
+            ingredients[recipe_id].add(ingredient_id)
+
+        for recipe_id, ingredient_ids in ingredients.items():
+            self.add(recipe_id, ingredient_ids)
+
+    def add(self, recipe_id, ingredient_ids):
+        if self.free:
+            position = self.free.pop()
+            self.recipe_ids[position] = recipe_id
+        else:
+            position = len(self.recipe_ids)
+            self.recipe_ids.append(recipe_id)
+        self.positions[recipe_id] = position
+        # tuples take a fraction of the memory of sets
+        self.ingredients[recipe_id] = tuple(ingredient_ids)
+
+        bit = 1 << position
+        self.alive |= bit
+        for ingredient_id in ingredient_ids:
+            self.bitsets[ingredient_id] = \
+                self.bitsets.get(ingredient_id, 0) | bit
+
+    def remove(self, recipe_id):
+        position = self.positions.pop(recipe_id)
+        self.free.append(position)
+
+        mask = ~(1 << position)
+        self.alive &= mask
+        for ingredient_id in self.ingredients.pop(recipe_id):
+            bits = self.bitsets[ingredient_id] & mask
+            if bits:
+                self.bitsets[ingredient_id] = bits
+            else:
+                del self.bitsets[ingredient_id]
+
+    def match(self, ingredient_ids, max_missing=0, limit=20):
+        """Return (recipe id, missing ingredient ids) of the recipes that
+        use some of the ingredients and need at most `max_missing` others.
+        Recipes missing fewer ingredients come first, then the ones using
+        more of the given ingredients"""
+        pantry = set(ingredient_ids)
+        uses = 0
+        # at_least[n] holds the recipes missing n or more ingredients
+        at_least = [self.alive] + [0] * (max_missing + 1)
+        for ingredient_id, bits in self.bitsets.items():
+            if ingredient_id in pantry:
+                uses |= bits
+                continue
+            for n in range(max_missing + 1, 0, -1):
+                at_least[n] |= at_least[n - 1] & bits
+
+        candidates = []
+        for missing in range(max_missing + 1):
+            bits = at_least[missing] & ~at_least[missing + 1] & uses
+            for position in _set_bits(bits):
+                recipe_id = self.recipe_ids[position]
+                candidates.append((
+                    missing, -len(self.ingredients[recipe_id]), -recipe_id
+                ))
+
+        return [
+            (-recipe_id, sorted(ingredient_id for ingredient_id
+                                in self.ingredients[-recipe_id]
+                                if ingredient_id not in pantry))
+            for _, _, recipe_id in heapq.nsmallest(limit, candidates)
+        ]
+
+
+def _set_bits(bits):
+    """Return the positions of the set bits of an int"""
+    digits = bin(bits)[:1:-1]
+    positions = []
+    position = digits.find('1')
+    while position != -1:
+        positions.append(position)
+        position = digits.find('1', position + 1)
+    return positions
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(user):
+    """Return the user's index, keeping the indexes of the
+    MATCH_INDEX_MAX_USERS most recently active users in memory. The Change
+    log cursor is only meaningful within one shard, so users that moved to
+    another one get a new index"""
+    key = (user.pk, sharding.current())
+    with _indexes_lock:
+        index = _indexes.pop(key, None) or IngredientIndex(user.pk)
+        _indexes[key] = index
+        while len(_indexes) > settings.MATCH_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def clear_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def match(user, ingredients, missing=0, limit=20):
+    """Rank the user's recipes by how well the ingredients cover them, see
+    IngredientIndex.match"""
+    index = get_index(user)
+    with index.lock:
+        index.update()
+        return index.match(ingredients, missing, limit)
+
+
+def match_sql(user, ingredients, missing=0, limit=20):
+    """Same ranking as match() with a GROUP BY over the ingredients of all
+    of the user's recipes. Returns (recipe id, number of missing
+    ingredients), for comparison in tests and benchmarks"""
+    recipes = Recipe.objects.filter(user=user).annotate(
+        need=Count('ingredients'),
+        have=Count('ingredients', filter=Q(ingredients__in=ingredients)),
+    ).annotate(
+        missing=F('need') - F('have'),
+    ).filter(
+        have__gt=0, missing__lte=missing,
+    ).order_by('missing', '-need', '-id')
+
+    return list(recipes.values_list('id', 'missing')[:limit])
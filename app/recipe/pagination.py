@@ -0,0 +1,104 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Pages through a list in the order of the view's OrderingFilter by
+    continuing after the last object of the previous page, with the id
+    breaking ties. Unlike OFFSET, the rows of earlier pages are never
+    read. Orderings with a (user, field, id) index, time_minutes and price
+    for recipes, make every page a range scan of it however deep into the
+    list it is. Others, like title, sort the user's rows for every page.
+
+    Lists are only paginated when asked for with ?page_size= or ?cursor=,
+    so clients that expect the whole list keep getting it"""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and \
+                self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        # the ordering the OrderingFilter applied
+        self.ordering = (queryset.query.order_by or ['-id'])[0]
+        self.field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        if self.field == 'id':
+            queryset = queryset.order_by(self.ordering)
+        else:
+            queryset = queryset.order_by(self.ordering,
+                                         '-id' if descending else 'id')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            value, last_id = cursor
+            after = 'lt' if descending else 'gt'
+            if self.field == 'id':
+                queryset = queryset.filter(**{'id__' + after: last_id})
+            else:
+                queryset = queryset.filter(
+                    Q(**{self.field + '__' + after: value}) |
+                    Q(**{self.field: value, 'id__' + after: last_id})
+                )
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering, value, last_id = cursor
+            # a cursor only continues the ordering it was made for
+            if ordering != self.ordering:
+                raise ValueError(ordering)
+            # values that don't fit the field would fail in the database
+            value = model._meta.get_field(self.field).to_python(value)
+            last_id = model._meta.pk.to_python(last_id)
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        cursor = [self.ordering, str(value), obj.id]
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param,
+                                  self.page_size)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
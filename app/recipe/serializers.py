@@ -1,5 +1,70 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from core import media
 from core.models import Tag, Ingredient, Recipe
+from recipe import similarity
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """List of primary keys that is validated with one query instead of one
+    query per key"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for item in data:
+            try:
+                pks.append(pk_field.to_python(item))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(item).__name__)
+
+        objects = queryset.in_bulk(set(pks))
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+
+        return [objects[pk] for pk in dict.fromkeys(pks)]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field that uses BulkManyRelatedField with many=True"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class OwnedRelatedFieldsMixin:
+    """Limits the related fields named in `owned_fields` to the objects of
+    the user in the context, given as 'user' or as the request's user.
+    Without one they accept nothing"""
+    owned_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        user = self.context.get('user')
+        if user is None and 'request' in self.context:
+            user = self.context['request'].user
+        # anonymous users have no pk and get nothing
+        user_id = getattr(user, 'pk', None)
+        for name in self.owned_fields:
+            child = fields[name].child_relation
+            child.queryset = child.queryset.filter(user_id=user_id)
+        return fields
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -20,20 +85,200 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', )
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(OwnedRelatedFieldsMixin,
+                       serializers.ModelSerializer):
     """Serialize a recipe"""
-    ingredients = serializers.PrimaryKeyRelatedField(
+    owned_fields = ('ingredients', 'tags')
+    ingredients = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all(),
+        required=False,
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
+        required=False,
+    )
+    # names of tags and ingredients to add to the recipe. Names the user
+    # doesn't have yet are created, which saves a request for each of them
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False,
+    )
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False,
     )
 
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes',
-                  'price', 'link',
+                  'price', 'link', 'ingredient_names', 'tag_names', 'image',
                   )
+        # images are uploaded with RecipeImageSerializer
+        read_only_fields = ('id', 'image')
+
+    def _pop_related(self, validated_data, user_id):
+        """Remove the tags and ingredients from the validated data. Returns
+        the ids given for each field, which replace the current ones, and
+        the ids of the objects given by name, which are added to them"""
+        replace, add = {}, {}
+        for field, names_field, model in (
+            ('ingredients', 'ingredient_names', Ingredient),
+            ('tags', 'tag_names', Tag),
+        ):
+            if field in validated_data:
+                replace[field] = [
+                    obj.pk for obj in validated_data.pop(field)
+                ]
+
+            names = validated_data.pop(names_field, None)
+            if names:
+                add[field] = [
+                    obj.pk for obj in
+                    model.objects.get_or_create_names(user_id, names)
+                ]
+
+        return replace, add
+
+    def _save_related(self, recipe, replace, add, created):
+        """Update the tags and ingredients of the recipe with at most one
+        DELETE and one INSERT for each of them"""
+        for field in ('ingredients', 'tags'):
+            if field in replace:
+                recipe.replace_related(
+                    field, replace[field] + add.get(field, [])
+                )
+            elif field in add:
+                # a new recipe has nothing linked yet
+                recipe.add_related(field, add[field],
+                                   current=set() if created else None)
+
+    def create(self, validated_data):
+        """Create a recipe, creating the tags and ingredients given by name
+        in the same transaction. Its signature is computed once at the
+        end"""
+        with transaction.atomic(using=Recipe.objects.db), \
+                similarity.deferred_updates():
+            replace, add = self._pop_related(validated_data,
+                                             validated_data['user'].pk)
+            recipe = super().create(validated_data)
+            self._save_related(recipe, replace, add, created=True)
+
+        return recipe
+
+    def update(self, instance, validated_data):
+        """Update a recipe, creating the tags and ingredients given by name
+        in the same transaction. Its signature is computed once at the
+        end"""
+        with transaction.atomic(using=Recipe.objects.db), \
+                similarity.deferred_updates():
+            replace, add = self._pop_related(validated_data,
+                                             instance.user_id)
+            recipe = super().update(instance, validated_data)
+            self._save_related(recipe, replace, add, created=False)
+
+        return recipe
+
+
+class RecipeTagsSerializer(OwnedRelatedFieldsMixin,
+                           serializers.Serializer):
+    """Tags to add to or remove from a recipe"""
+    owned_fields = ('tags', )
+    tags = BulkPrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+
+
+class RecipeIngredientsSerializer(OwnedRelatedFieldsMixin,
+                                  serializers.Serializer):
+    """Ingredients to add to or remove from a recipe"""
+    owned_fields = ('ingredients', )
+    ingredients = BulkPrimaryKeyRelatedField(
+        many=True,
+        queryset=Ingredient.objects.all(),
+    )
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serializer for the range filters of the recipe list, named after
+    the lookups they apply"""
+    time_minutes__lte = serializers.IntegerField(required=False)
+    time_minutes__gte = serializers.IntegerField(required=False)
+    # both ends of the range separated by a comma, e.g. ?price__range=5,10
+    time_minutes__range = serializers.RegexField(r'^\d+,\d+$',
+                                                 required=False)
+    price__lte = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                          required=False)
+    price__gte = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                          required=False)
+    price__range = serializers.RegexField(r'^\d+(\.\d+)?,\d+(\.\d+)?$',
+                                          required=False)
+
+    def validate_time_minutes__range(self, value):
+        return [int(end) for end in value.split(',')]
+
+    def validate_price__range(self, value):
+        field = serializers.DecimalField(max_digits=5, decimal_places=2)
+        return [field.to_internal_value(end) for end in value.split(',')]
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Serializer for uploading the image of a recipe"""
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'image', 'thumbnails')
         read_only_fields = ('id', )
+        extra_kwargs = {'image': {'required': True, 'allow_null': False}}
+
+    def get_thumbnails(self, recipe):
+        if not recipe.image:
+            return {}
+        return media.thumbnail_urls(recipe.image.name)
+
+    def validate_image(self, image):
+        if image.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            raise serializers.ValidationError(
+                'Images can be at most {} bytes'.format(
+                    settings.RECIPE_IMAGE_MAX_BYTES
+                )
+            )
+        if image.image.format not in media.FORMATS:
+            raise serializers.ValidationError(
+                'Images must be one of {}'.format(', '.join(media.FORMATS))
+            )
+        return image
+
+    def update(self, instance, validated_data):
+        instance.image.name = media.store_image(validated_data['image'])
+        instance.save(update_fields=['image'])
+        return instance
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the recipe match endpoint"""
+    # comma separated ingredient ids, e.g. ?ingredients=1,2,3
+    ingredients = serializers.RegexField(r'^\d+(,\d+)*$')
+    missing = serializers.IntegerField(min_value=0, max_value=5, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+    def validate_ingredients(self, value):
+        return [int(ingredient_id) for ingredient_id in value.split(',')]
+
+
+class ShoppingListQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the shopping list endpoint"""
+    # comma separated recipe ids, e.g. ?recipes=1,2,3
+    recipes = serializers.RegexField(r'^\d+(,\d+)*$')
+
+    def validate_recipes(self, value):
+        recipe_ids = [int(recipe_id) for recipe_id in value.split(',')]
+        if len(recipe_ids) > settings.SHOPPING_LIST_MAX_RECIPES:
+            raise serializers.ValidationError(
+                'At most {} recipes are allowed'.format(
+                    settings.SHOPPING_LIST_MAX_RECIPES
+                )
+            )
+        return recipe_ids
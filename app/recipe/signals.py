@@ -0,0 +1,42 @@
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+from recipe import similarity
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_signatures(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recompute the signatures of the recipes whose tags or ingredients
+    changed, see similarity.deferred_updates"""
+    if reverse and action == 'pre_clear':
+        # the recipes losing the tag or ingredient are unknown afterwards
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        # saves of recipes change both relations, often in several steps
+        if not reverse:
+            similarity.update_recipes_later([instance.pk], instance.user_id)
+        elif action == 'post_clear':
+            similarity.update_recipes_later(instance._cleared_recipe_ids)
+        else:
+            similarity.update_recipes_later(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_unlinked_recipes(sender, instance, **kwargs):
+    """Remember the recipes that lose a tag or ingredient being deleted"""
+    instance._unlinked_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_unlinked_recipes(sender, instance, **kwargs):
+    """Recompute the signatures of the recipes that lost the tag or
+    ingredient"""
+    similarity.update_recipes(getattr(instance, '_unlinked_recipe_ids', []))
@@ -0,0 +1,167 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from core.models import Recipe, RecipeBucket, RecipeSignature
+
+
+# 16 bands of 4 rows make recipes sharing about half of their tags and
+# ingredients likely to share a bucket
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# the seed is fixed so that stored signatures stay comparable, changing
+# any of these requires running the rebuild_similarity command
+_random = np.random.RandomState(1234)
+# multiply-shift hashing, h(x) = ((a * x + b) mod 2**64) >> 32 with odd a
+_A = _random.randint(0, 2 ** 63, NUM_HASHES, dtype=np.uint64) \
+    * np.uint64(2) + np.uint64(1)
+_B = _random.randint(0, 2 ** 63, NUM_HASHES, dtype=np.uint64)
+_BAND_A = _random.randint(0, 2 ** 63, ROWS, dtype=np.uint64) \
+    * np.uint64(2) + np.uint64(1)
+_BAND_SALT = np.arange(BANDS, dtype=np.uint64) \
+    * np.uint64(0x9E3779B97F4A7C15)
+
+
+def signature(tokens):
+    """Return the MinHash signature of a set of integer tokens"""
+    tokens = np.array(list(tokens), dtype=np.uint64)
+    hashes = (tokens[:, np.newaxis] * _A + _B) >> np.uint64(32)
+    return hashes.min(axis=0).astype(np.uint32)
+
+
+def buckets(signature):
+    """Return the LSH bucket of each band of a signature"""
+    bands = signature.reshape(BANDS, ROWS).astype(np.uint64)
+    hashes = (bands * _BAND_A).sum(axis=1) ^ _BAND_SALT
+    # BigIntegerField holds signed 64 bit integers
+    return (hashes >> np.uint64(1)).astype(np.int64).tolist()
+
+
+def update_recipes(recipe_ids, users=None):
+    """Recompute the signatures and buckets of the recipes. The owners of
+    the ones missing from `users`, which maps ids to owners, are looked up"""
+    recipe_ids = set(recipe_ids)
+    users = dict(users or {})
+    unknown = recipe_ids - users.keys()
+    if unknown:
+        users.update(Recipe.objects.filter(
+            pk__in=unknown
+        ).values_list('id', 'user_id'))
+    if recipe_ids:
+        _update(users, recipe_ids)
+
+
+# ids of the recipes to update at the end of the outermost
+# deferred_updates() block of each thread mapped to their owners where
+# known, None outside of a block
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_updates():
+    """Recompute the signatures of the recipes changed inside the block
+    once at its end, rather than on each change of their tags and
+    ingredients. Nested blocks leave it to the outermost one, and nothing
+    is recomputed when the block raises"""
+    if getattr(_deferred, 'users', None) is not None:
+        yield
+        return
+
+    _deferred.users = {}
+    try:
+        yield
+        users = _deferred.users
+    finally:
+        _deferred.users = None
+    update_recipes(users.keys(), {
+        recipe_id: user_id for recipe_id, user_id in users.items()
+        if user_id is not None
+    })
+
+
+def update_recipes_later(recipe_ids, user_id=None):
+    """Recompute the signatures of the recipes, owned by `user_id` if it
+    is given, at the end of the current deferred_updates() block or right
+    away outside of one"""
+    users = {recipe_id: user_id for recipe_id in recipe_ids}
+    pending = getattr(_deferred, 'users', None)
+    if pending is None:
+        update_recipes(recipe_ids, {} if user_id is None else users)
+        return
+
+    for recipe_id, user_id in users.items():
+        if pending.get(recipe_id) is None:
+            pending[recipe_id] = user_id
+
+
+def _update(users, recipe_ids):
+    """Store the signatures of the existing recipes in `users`, which maps
+    their ids to their owners, and drop the ones of `recipe_ids`. Tags and
+    ingredients are hashed as distinct tokens"""
+    ingredients = Recipe.ingredients.through.objects.filter(
+        recipe_id__in=users
+    ).annotate(token=F('ingredient_id') * 2).values_list('recipe_id', 'token')
+    tags = Recipe.tags.through.objects.filter(
+        recipe_id__in=users
+    ).annotate(token=F('tag_id') * 2 + 1).values_list('recipe_id', 'token')
+    tokens = {}
+    for recipe_id, token in ingredients.union(tags, all=True):
+        tokens.setdefault(recipe_id, []).append(token)
+
+    signatures = []
+    recipe_buckets = []
+    for recipe_id, recipe_tokens in tokens.items():
+        recipe_signature = signature(recipe_tokens)
+        signatures.append(RecipeSignature(
+            recipe_id=recipe_id, signature=recipe_signature.tobytes(),
+        ))
+        recipe_buckets.extend(
+            RecipeBucket(user_id=users[recipe_id], recipe_id=recipe_id,
+                         bucket=bucket)
+            for bucket in buckets(recipe_signature)
+        )
+
+    # recipes are mostly updated from within the transaction of their save
+    with transaction.atomic(using=Recipe.objects.db, savepoint=False):
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.bulk_create(signatures)
+        RecipeBucket.objects.bulk_create(recipe_buckets)
+
+
+def similar(recipe, limit=10):
+    """Return (recipe id, similarity) of the user's recipes with the most
+    tags and ingredients in common with the recipe, most similar first.
+    Only recipes sharing an LSH bucket are scored, by the share of equal
+    signature values which estimates their Jaccard similarity"""
+    own = RecipeSignature.objects.filter(recipe=recipe).values_list(
+        'signature', flat=True
+    ).first()
+    if own is None:
+        return []
+
+    candidates = list(RecipeSignature.objects.filter(
+        recipe__in=RecipeBucket.objects.filter(
+            user_id=recipe.user_id,
+            bucket__in=RecipeBucket.objects.filter(
+                recipe=recipe
+            ).values('bucket'),
+        ).values('recipe_id'),
+    ).exclude(recipe=recipe).order_by('-recipe_id').values_list(
+        'recipe_id', 'signature'
+    ))
+    if not candidates:
+        return []
+
+    recipe_ids, signatures = zip(*candidates)
+    matrix = np.frombuffer(b''.join(signatures), dtype=np.uint32).reshape(
+        len(recipe_ids), NUM_HASHES
+    )
+    scores = (matrix == np.frombuffer(own, dtype=np.uint32)).mean(axis=1)
+    best = np.argsort(-scores, kind='stable')[:limit]
+    return [(recipe_ids[i], float(scores[i])) for i in best]
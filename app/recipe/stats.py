@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Max, Min, Sum
+
+from core.models import Tag, Ingredient, Recipe
+
+
+PERCENTILES = (50, 90)
+CENTS = Decimal('0.01')
+
+
+def _price(value):
+    """Format a price aggregate the way the recipe serializer does"""
+    if value is None:
+        return None
+    return str(Decimal(value).quantize(CENTS))
+
+
+def _percentiles(recipes, field, count):
+    """Return the nearest rank percentiles of a field. Each one is a single
+    indexed ORDER BY ... OFFSET query, so the cost doesn't depend on how
+    the database would have to sort the whole column"""
+    values = {}
+    for percentile in PERCENTILES:
+        if not count:
+            values['p{}'.format(percentile)] = None
+            continue
+
+        rank = max(-(-percentile * count // 100), 1)
+        values['p{}'.format(percentile)] = recipes.order_by(
+            field
+        ).values_list(field, flat=True)[rank - 1]
+
+    return values
+
+
+def _usage(queryset, limit):
+    """Return the most used tags or ingredients of a user"""
+    return list(
+        queryset.annotate(
+            recipes=Count('recipe'),
+            total_price=Sum('recipe__price'),
+        ).filter(
+            recipes__gt=0,
+        ).order_by(
+            '-recipes', 'name',
+        ).values('id', 'name', 'recipes', 'total_price')[:limit]
+    )
+
+
+def recipe_stats(user, limit=10):
+    """Compute recipe statistics for a user in the database. The number of
+    queries is fixed, no matter how many recipes the user has"""
+    recipes = Recipe.objects.filter(user=user)
+    totals = recipes.aggregate(
+        count=Count('id'),
+        time_avg=Avg('time_minutes'),
+        time_min=Min('time_minutes'),
+        time_max=Max('time_minutes'),
+        price_avg=Avg('price'),
+        price_min=Min('price'),
+        price_max=Max('price'),
+        price_total=Sum('price'),
+    )
+    count = totals['count']
+
+    time_minutes = {
+        'avg': round(totals['time_avg'], 2) if count else None,
+        'min': totals['time_min'],
+        'max': totals['time_max'],
+    }
+    time_minutes.update(_percentiles(recipes, 'time_minutes', count))
+
+    price = {
+        'avg': _price(totals['price_avg']),
+        'min': _price(totals['price_min']),
+        'max': _price(totals['price_max']),
+        'total': _price(totals['price_total']),
+    }
+    price.update({
+        key: _price(value)
+        for key, value in _percentiles(recipes, 'price', count).items()
+    })
+
+    usage = {}
+    for key, model in (('tags', Tag), ('ingredients', Ingredient)):
+        usage[key] = _usage(model.objects.filter(user=user), limit)
+        for row in usage[key]:
+            row['total_price'] = _price(row['total_price'])
+
+    return {
+        'recipes': count,
+        'time_minutes': time_minutes,
+        'price': price,
+        'tags': usage['tags'],
+        'ingredients': usage['ingredients'],
+    }
@@ -0,0 +1,86 @@
+import re
+
+from core import sharding
+from core.models import Change, Tag, Ingredient, Recipe
+from recipe import serializers
+
+
+# the related objects serialized with each object
+PREFETCH = {Recipe: ('tags', 'ingredients')}
+
+SYNCED = (
+    ('tags', Change.KIND_TAG, Tag, serializers.TagSerializer),
+    ('ingredients', Change.KIND_INGREDIENT, Ingredient,
+     serializers.IngredientSerializer),
+    ('recipes', Change.KIND_RECIPE, Recipe, serializers.RecipeSerializer),
+)
+
+
+# cursors hold the move epoch of the user, see core.sharding, and the
+# horizon of the Change log, see core.models.ChangeManager
+CURSOR = re.compile(r'^v(\d+)\.(\d+)$')
+# cursors handed out before were Change ids or horizons without an epoch
+LEGACY_CURSOR = re.compile(r'^v?\d+$')
+
+
+def format_cursor(epoch, horizon):
+    return 'v{}.{}'.format(epoch, horizon)
+
+
+def parse_cursor(cursor):
+    """Return the epoch and horizon of a cursor, or None for a cursor that
+    can't be continued, which gets a full sync. Raises ValueError for
+    anything that isn't a cursor"""
+    match = CURSOR.match(cursor)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    if LEGACY_CURSOR.match(cursor):
+        return None
+    raise ValueError('Invalid cursor')
+
+
+def _snapshot(user, epoch):
+    """Return every synced object of the user"""
+    # read the cursor before the objects so that nothing changed in between
+    # can be missed. Such changes are sent again by the next sync
+    horizon = Change.objects.current_horizon(user.pk)
+    data = {'cursor': format_cursor(epoch, horizon), 'full': True,
+            'deleted': {}}
+    for key, _, model, serializer_class in SYNCED:
+        objects = model.objects.filter(user=user).order_by('id') \
+            .prefetch_related(*PREFETCH.get(model, ()))
+        data[key] = serializer_class(objects, many=True).data
+        data['deleted'][key] = []
+
+    return data
+
+
+def sync(user, cursor=None):
+    """Return the objects of the user that were created, updated or deleted
+    since a parsed cursor, or all of them without one. Objects that changed
+    around the time of the last sync can be sent again, which clients
+    handle like any other update. Versions of changes only compare within
+    one stay of the user on a shard, so clients start over after a move"""
+    epoch = sharding.epoch_for_user(user.pk)
+    if cursor is None or cursor[0] != epoch:
+        return _snapshot(user, epoch)
+
+    changes, horizon = Change.objects.since(user.pk, cursor[1])
+    data = {
+        'cursor': format_cursor(epoch, horizon),
+        'full': False,
+        'deleted': {},
+    }
+    for key, kind, model, serializer_class in SYNCED:
+        ids = {change.object_id for change in changes if change.kind == kind}
+        objects = []
+        if ids:
+            objects = list(
+                model.objects.filter(user=user, id__in=ids).order_by('id')
+                .prefetch_related(*PREFETCH.get(model, ()))
+            )
+        data[key] = serializer_class(objects, many=True).data
+        # objects removed after their change was recorded count as deleted
+        data['deleted'][key] = sorted(ids - {obj.id for obj in objects})
+
+    return data
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from core import media
+from core.models import Recipe
+from core.tasks import task
+from recipe import serializers, similarity
+
+
+@task('recipe.export')
+def export_recipes(job):
+    """Return every recipe of the job's user"""
+    recipes = Recipe.objects.filter(user=job.user).order_by('id')
+    return serializers.RecipeSerializer(recipes, many=True).data
+
+
+@task('recipe.import')
+def import_recipes(job, recipes):
+    """Create all of the given recipes for the job's user in one go"""
+    serializer = serializers.RecipeSerializer(
+        data=recipes, many=True, context={'user': job.user}
+    )
+    serializer.is_valid(raise_exception=True)
+
+    with transaction.atomic(using=Recipe.objects.db), \
+            similarity.deferred_updates():
+        created = serializer.save(user=job.user)
+
+    return {'created': [recipe.id for recipe in created]}
+
+
+@task('recipe.thumbnails')
+def make_thumbnails(job, recipe):
+    """Make the thumbnails of the image of one of the job user's recipes"""
+    image = Recipe.objects.filter(user=job.user, pk=recipe) \
+        .values_list('image', flat=True).first()
+    if not image:
+        return {'thumbnails': {}}
+
+    names = media.make_thumbnails(image, settings.RECIPE_THUMBNAIL_SIZES)
+    return {'thumbnails': {
+        str(size): default_storage.url(name) for size, name in names.items()
+    }}
@@ -0,0 +1,202 @@
+import asyncio
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+                        override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import events
+from core.models import AuthToken, Tag
+from recipe.events import EventStream
+
+
+EVENTS_URL = reverse('recipe:events')
+
+
+class PublicEventsAPITests(TestCase):
+    """Test unauthenticated events API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = APIClient().get(EVENTS_URL,
+                                   HTTP_ACCEPT='text/event-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn(b'event: error', response.content)
+
+
+@override_settings(EVENTS_POLL_SECONDS=0, EVENTS_KEEPALIVE_SECONDS=60)
+class PollingEventsAPITests(TestCase):
+    """Test the event stream served by polling the Change log"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_changes_announced(self):
+        """Test the stream asks to sync on connect and after changes"""
+        response = self.client.get(EVENTS_URL,
+                                   HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+
+        self.assertIn(b'event: changes\n', next(stream))
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.assertEqual(next(stream), b'event: changes\ndata: {}\n\n')
+
+    def test_other_users_ignored(self):
+        """Test changes of other users are not announced"""
+        other = get_user_model().objects.create_user('other@test.com',
+                                                     'testpass')
+        with override_settings(EVENTS_MAX_SECONDS=0.05):
+            response = self.client.get(EVENTS_URL)
+            Tag.objects.create(user=other, name='Vegan')
+            chunks = list(response.streaming_content)
+
+        self.assertEqual(len(chunks), 1)
+
+    @override_settings(EVENTS_KEEPALIVE_SECONDS=0)
+    def test_ends_when_token_revoked(self):
+        """Test the stream ends once its token stops being valid"""
+        key, _ = AuthToken.objects.rotate(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(key))
+        response = client.get(EVENTS_URL)
+        stream = iter(response.streaming_content)
+
+        self.assertIn(b'event: changes\n', next(stream))
+        self.assertEqual(next(stream), b': keepalive\n\n')
+        AuthToken.objects.filter(user=self.user).delete()
+        chunks = list(stream)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIn(b'event: error\n', chunks[0])
+
+
+class HubTests(SimpleTestCase):
+
+    def test_wakes_subscribers_of_user(self):
+        """Test only the streams of the user are woken, once"""
+        hub = events.Hub()
+        queue = hub.subscribe(1)
+        other = hub.subscribe(2)
+
+        hub.wake(1)
+        hub.wake(1)
+
+        self.assertEqual(queue.qsize(), 1)
+        self.assertTrue(other.empty())
+        hub.unsubscribe(1, queue)
+        hub.unsubscribe(2, other)
+        self.assertEqual(hub.queues, {})
+
+
+class EventStreamTests(TransactionTestCase):
+    """Test the event stream served from the event loop"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.key, _ = AuthToken.objects.rotate(self.user)
+
+    async def fallback(self, scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 204,
+                    'headers': []})
+        await send({'type': 'http.response.body'})
+
+    def run_stream(self, headers, until):
+        """Run a request to the stream until `until` returns True for the
+        sent messages, then disconnect. Returns the sent messages"""
+        application = EventStream(self.fallback, EVENTS_URL)
+        application.listeners = []
+        loop = asyncio.get_event_loop()
+        sent = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            if not sent:
+                return {'type': 'http.request', 'body': b''}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if until(sent):
+                disconnected.set()
+
+        scope = {'type': 'http', 'method': 'GET', 'path': EVENTS_URL,
+                 'headers': headers}
+        loop.run_until_complete(asyncio.wait_for(
+            application(scope, receive, send), timeout=5
+        ))
+        return sent
+
+    def test_notifications_pushed(self):
+        """Test the user's notifications reach the stream"""
+        def until(sent):
+            if len(sent) == 2:
+                # the stream is subscribed once it sent its first event
+                events.hub.publish(self.user.pk)
+            return len(sent) == 3
+
+        sent = self.run_stream(
+            [(b'authorization', 'Token {}'.format(self.key).encode())],
+            until,
+        )
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'event: changes', sent[1]['body'])
+        self.assertEqual(sent[2]['body'], b'event: changes\ndata: {}\n\n')
+        self.assertEqual(events.hub.queues, {})
+
+    @override_settings(EVENTS_KEEPALIVE_SECONDS=0.01)
+    def test_credentials_checked_again(self):
+        """Test the stream goes on while its token is valid and ends once
+        it is revoked"""
+        def until(sent):
+            if len(sent) == 4:
+                AuthToken.objects.filter(user=self.user).delete()
+            return False
+
+        sent = self.run_stream(
+            [(b'authorization', 'Token {}'.format(self.key).encode())],
+            until,
+        )
+
+        self.assertEqual(sent[2]['body'], b': keepalive\n\n')
+        self.assertEqual(sent[3]['body'], b': keepalive\n\n')
+        self.assertIn(b'event: error', sent[-1]['body'])
+        self.assertFalse(sent[-1].get('more_body'))
+        self.assertEqual(events.hub.queues, {})
+
+    def test_auth_required(self):
+        """Test streams need a valid token"""
+        sent = self.run_stream([(b'authorization', b'Token wrong')],
+                               lambda sent: False)
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_other_requests_passed_on(self):
+        """Test other paths are served by the wrapped application"""
+        application = EventStream(self.fallback, EVENTS_URL)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.get_event_loop().run_until_complete(application(
+            {'type': 'http', 'method': 'GET', 'path': '/api/recipe/tags/'},
+            None, send,
+        ))
+
+        self.assertEqual(sent[0]['status'], 204)
@@ -0,0 +1,157 @@
+import importlib
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import Resolver404, clear_url_caches, resolve, reverse
+
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import media, tasks
+from core.models import Job, Recipe
+
+
+def image_upload_url(recipe_id):
+    """Return the URL for uploading the image of a recipe"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def sample_image(size=(800, 600), format='JPEG'):
+    """Return an uploadable image file"""
+    image = io.BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(image, format)
+    image.name = 'image.' + media.FORMATS[format]
+    image.seek(0)
+    return image
+
+
+class RecipeImageAPITests(TestCase):
+    """Test uploading recipe images"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def upload(self, recipe, image):
+        return self.client.post(image_upload_url(recipe.id),
+                                {'image': image}, format='multipart')
+
+    def test_upload_image(self):
+        """Test the image is stored under the hash of its content"""
+        res = self.upload(self.recipe, sample_image())
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image.name.startswith(media.ORIGINALS))
+        self.assertTrue(self.recipe.image.name.endswith('.jpg'))
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+        self.assertIn(self.recipe.image.url, res.data['image'])
+        self.assertEqual(set(res.data['thumbnails']), {'128', '512'})
+
+    def test_same_image_stored_once(self):
+        """Test recipes with the same image share the stored file"""
+        other = sample_recipe(self.user, title='Stew')
+        self.upload(self.recipe, sample_image())
+        self.upload(other, sample_image())
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+
+    def test_thumbnails_made_by_job(self):
+        """Test the upload queues a job making every thumbnail size"""
+        self.upload(self.recipe, sample_image())
+        job = Job.objects.get(name='recipe.thumbnails')
+
+        tasks.run_job(job)
+
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.recipe.refresh_from_db()
+        for size in (128, 512):
+            name = media.thumbnail_name(self.recipe.image.name, size)
+            with default_storage.open(name) as f, Image.open(f) as thumb:
+                self.assertEqual(thumb.size, (size, size * 3 // 4))
+
+    def test_upload_invalid_image(self):
+        """Test uploading something that isn't an image fails"""
+        res = self.upload(self.recipe, io.BytesIO(b'notimage'))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=100)
+    def test_upload_too_large(self):
+        """Test images over the size limit are refused"""
+        res = self.upload(self.recipe, sample_image())
+
+        self.assertIn(res.status_code, (
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        ))
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_other_users_recipe(self):
+        """Test images can't be added to other users' recipes"""
+        other = get_user_model().objects.create_user('other@test.com',
+                                                     'testpass')
+        recipe = sample_recipe(other)
+
+        res = self.upload(recipe, sample_image())
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_images_cached(self):
+        """Test stored images are served with long lived cache headers"""
+        self.upload(self.recipe, sample_image())
+        self.recipe.refresh_from_db()
+
+        res = self.client.get(self.recipe.image.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('max-age=31536000', res['Cache-Control'])
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_images_not_served_without_setting(self):
+        """Test Django only serves stored images when SERVE_MEDIA is on"""
+        urls = importlib.import_module('app.urls')
+        try:
+            with override_settings(SERVE_MEDIA=False):
+                importlib.reload(urls)
+            clear_url_caches()
+            with self.assertRaises(Resolver404):
+                resolve('/media/recipes/image.jpg', urls)
+        finally:
+            importlib.reload(urls)
+            clear_url_caches()
+
+        self.assertEqual(resolve('/media/recipes/image.jpg', urls).func,
+                         media.serve)
@@ -82,3 +82,15 @@ class PrivateIngredientsAPITests(TestCase):
         response = self.client.post(INGREDIENTS_URL, payload)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_ingredient_existing_name(self):
+        """Test that creating an ingredient with an existing name returns
+        it"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        response = self.client.post(INGREDIENTS_URL, {'name': 'SALT'})
+
+        self.assertEqual(response.data['id'], ingredient.id)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 1
+        )
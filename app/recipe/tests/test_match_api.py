@@ -0,0 +1,143 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.benchmark import seed_user
+from core.models import Ingredient, Recipe
+from recipe import matching
+
+
+MATCH_URL = reverse('recipe:recipe-match')
+
+
+def sample_recipe(user, ingredients, **params):
+    """Create and return a sample recipe with the given ingredients"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.ingredients.set(ingredients)
+    return recipe
+
+
+class PublicMatchAPITests(TestCase):
+    """Test unauthenticated match API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = APIClient().get(MATCH_URL, {'ingredients': '1'})
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateMatchAPITests(TransactionTestCase):
+    """Test matching recipes against the ingredients at hand.
+
+    The index skips the changes it applied by their version, which is the
+    id of the writing transaction on Postgres, so the writes are committed
+    one by one"""
+
+    def setUp(self):
+        matching.clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        names = ['Eggs', 'Flour', 'Milk', 'Sugar', 'Salt']
+        self.eggs, self.flour, self.milk, self.sugar, self.salt = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in names
+        ]
+        self.pancakes = sample_recipe(
+            self.user, [self.eggs, self.flour, self.milk], title='Pancakes'
+        )
+        self.cake = sample_recipe(
+            self.user, [self.eggs, self.flour, self.milk, self.sugar],
+            title='Cake',
+        )
+        self.omelette = sample_recipe(self.user, [self.eggs, self.salt],
+                                      title='Omelette')
+
+    def match(self, ingredients, **params):
+        params['ingredients'] = ','.join(str(i.id) for i in ingredients)
+        response = self.client.get(MATCH_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['recipe']['title'], item['missing'])
+                for item in response.data]
+
+    def test_full_matches(self):
+        """Test only recipes with all ingredients at hand are returned"""
+        self.assertEqual(
+            self.match([self.eggs, self.flour, self.milk]),
+            [('Pancakes', [])]
+        )
+
+    def test_missing_ingredients(self):
+        """Test recipes missing a few ingredients are ranked after"""
+        self.assertEqual(
+            self.match([self.eggs, self.flour, self.milk], missing=1),
+            [('Pancakes', []), ('Cake', [self.sugar.id]),
+             ('Omelette', [self.salt.id])]
+        )
+
+    def test_index_follows_changes(self):
+        """Test recipe changes are picked up by the next match"""
+        self.match([self.eggs, self.salt])
+        self.omelette.ingredients.remove(self.salt)
+        self.pancakes.delete()
+        sample_recipe(self.user, [self.salt], title='Salted water')
+
+        self.assertEqual(
+            self.match([self.eggs, self.flour, self.milk, self.salt]),
+            [('Salted water', []), ('Omelette', [])]
+        )
+
+    def test_other_users_recipes_ignored(self):
+        """Test only the user's recipes are matched"""
+        other = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        sample_recipe(other, [self.eggs, self.salt])
+
+        self.assertEqual(self.match([self.eggs, self.salt]),
+                         [('Omelette', [])])
+
+    def test_deleted_recipes_skipped(self):
+        """Test recipes deleted after the index was read are left out"""
+        matches = [(self.pancakes.id, []), (self.cake.id, [self.sugar.id])]
+        self.cake.delete()
+
+        with patch('recipe.matching.match', return_value=matches):
+            self.assertEqual(self.match([self.eggs]), [('Pancakes', [])])
+
+    def test_invalid_ingredients(self):
+        """Test the ingredients must be a list of ids"""
+        response = self.client.get(MATCH_URL, {'ingredients': 'eggs'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_same_ranking_as_sql(self):
+        """Test the index ranks like the SQL query"""
+        user = seed_user(200, ingredients=30, per_recipe=4)
+        pantry = Ingredient.objects.filter(user=user).order_by('id') \
+            .values_list('id', flat=True)[:12]
+
+        for missing in range(3):
+            self.assertEqual(
+                [(recipe_id, len(ids)) for recipe_id, ids in
+                 matching.match(user, pantry, missing, limit=50)],
+                matching.match_sql(user, pantry, missing, limit=50),
+            )
@@ -1,17 +1,27 @@
+import base64
+import json
+
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe
+from core.models import Tag, Ingredient, Recipe
 
 from recipe.serializers import RecipeSerializer
 
 RECIPES_URL = reverse('recipe:recipe-list')
 
 
+def detail_url(recipe_id):
+    """Return the recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
 def sample_recipe(user, **params):
     """Create and return a sample recipe"""
     defaults = {
@@ -78,3 +88,234 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data, serializer.data)
+
+    def test_create_recipe_with_names(self):
+        """Test creating a recipe with tag and ingredient names"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {
+            'title': 'Avocado toast',
+            'time_minutes': 5,
+            'price': '4.00',
+            'tag_names': ['vegan', 'Breakfast', 'breakfast'],
+            'ingredient_names': ['Avocado', 'Bread'],
+        }
+
+        response = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Breakfast', 'Vegan'],
+        )
+        self.assertIn(vegan.id, response.data['tags'])
+        self.assertEqual(recipe.ingredients.count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_create_recipe_with_names_query_count(self):
+        """Test that the number of queries doesn't depend on the number of
+        names"""
+        def create(count):
+            payload = {
+                'title': 'Salad',
+                'time_minutes': 5,
+                'price': '4.00',
+                'tag_names': ['tag {} {}'.format(count, i)
+                              for i in range(count)],
+                'ingredient_names': ['ingredient {} {}'.format(count, i)
+                                     for i in range(count)],
+            }
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(RECIPES_URL, payload,
+                                            format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(context)
+
+        self.assertEqual(create(2), create(20))
+
+    def test_partial_update_recipe(self):
+        """Test updating the tags of a recipe with PATCH"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        new_tag = Tag.objects.create(user=self.user, name='Curry')
+
+        response = self.client.patch(detail_url(recipe.id),
+                                     {'title': 'Chicken tikka',
+                                      'tags': [new_tag.id]},
+                                     format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Chicken tikka')
+        self.assertEqual(list(recipe.tags.all()), [new_tag])
+
+    def test_update_recipe_ingredients_query_count(self):
+        """Test that updating the ingredients takes the same number of
+        queries no matter how many are changed"""
+        recipe = sample_recipe(user=self.user)
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=str(i))
+            for i in range(50)
+        ]
+
+        def update(count):
+            payload = {'ingredients': [i.id for i in ingredients[:count]]}
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.patch(detail_url(recipe.id), payload,
+                                             format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context)
+
+        update(1)
+        small = update(5)
+        large = update(50)
+
+        self.assertEqual(small, large)
+        self.assertEqual(recipe.ingredients.count(), 50)
+
+    def test_update_recipe_invalid_tag(self):
+        """Test that unknown tags are rejected"""
+        recipe = sample_recipe(user=self.user)
+
+        response = self.client.patch(detail_url(recipe.id),
+                                     {'tags': [12345]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_tags_rejected(self):
+        """Test that tags and ingredients of other users can't be linked"""
+        other = get_user_model().objects.create_user('other@test.com',
+                                                     'testpass')
+        tag = Tag.objects.create(user=other, name='Vegan')
+        salt = Ingredient.objects.create(user=other, name='Salt')
+        recipe = sample_recipe(user=self.user)
+
+        responses = [
+            self.client.patch(detail_url(recipe.id), {'tags': [tag.id]},
+                              format='json'),
+            self.client.post(reverse('recipe:recipe-tags', args=[recipe.id]),
+                             {'tags': [tag.id]}, format='json'),
+            self.client.post(
+                reverse('recipe:recipe-ingredients', args=[recipe.id]),
+                {'ingredients': [salt.id]}, format='json',
+            ),
+        ]
+
+        for response in responses:
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(recipe.tags.exists())
+        self.assertFalse(recipe.ingredients.exists())
+
+    def test_add_and_remove_tags(self):
+        """Test adding tags to and removing tags from a recipe"""
+        recipe = sample_recipe(user=self.user)
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        recipe.tags.add(vegan)
+        url = reverse('recipe:recipe-tags', args=[recipe.id])
+
+        response = self.client.post(url, {'tags': [vegan.id, dessert.id]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['tags']),
+                         sorted([vegan.id, dessert.id]))
+
+        response = self.client.delete(url, {'tags': [vegan.id]},
+                                      format='json')
+
+        self.assertEqual(response.data['tags'], [dessert.id])
+
+    def test_add_ingredients(self):
+        """Test adding ingredients to a recipe"""
+        recipe = sample_recipe(user=self.user)
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        url = reverse('recipe:recipe-ingredients', args=[recipe.id])
+
+        response = self.client.post(url, {'ingredients': [salt.id]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.ingredients.all()), [salt])
+
+    def test_order_recipes(self):
+        """Test ordering recipes by a whitelisted field"""
+        slow = sample_recipe(user=self.user, time_minutes=60)
+        quick = sample_recipe(user=self.user, time_minutes=10)
+
+        response = self.client.get(RECIPES_URL, {'ordering': 'time_minutes'})
+
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [quick.id, slow.id])
+
+    def test_filter_recipes_by_range(self):
+        """Test filtering recipes by time and price ranges"""
+        quick = sample_recipe(user=self.user, time_minutes=20, price='4.50')
+        sample_recipe(user=self.user, time_minutes=20, price='12.00')
+        sample_recipe(user=self.user, time_minutes=45, price='4.00')
+
+        response = self.client.get(RECIPES_URL, {
+            'time_minutes__lte': 30, 'price__range': '4,5',
+        })
+
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [quick.id])
+
+    def test_filter_recipes_invalid(self):
+        """Test invalid range filters are rejected"""
+        response = self.client.get(RECIPES_URL, {'price__range': '4'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_range_filters_only_for_list(self):
+        """Test the range filters don't hide recipes from other actions"""
+        recipe = sample_recipe(user=self.user, price='5.00')
+
+        response = self.client.get(detail_url(recipe.id),
+                                   {'price__lte': '1.00'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_keyset_pagination(self):
+        """Test paging through recipes with equal values in the ordering"""
+        recipes = [sample_recipe(user=self.user, price=price)
+                   for price in ('3.00', '1.00', '3.00', '2.00', '3.00')]
+        expected = [recipe.id for recipe in sorted(
+            recipes, key=lambda recipe: (-float(recipe.price), -recipe.id)
+        )]
+
+        seen = []
+        url = RECIPES_URL + '?ordering=-price&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, expected)
+
+    def test_keyset_pagination_invalid_cursor(self):
+        """Test a cursor of another ordering is rejected"""
+        sample_recipe(user=self.user)
+        sample_recipe(user=self.user)
+        response = self.client.get(RECIPES_URL, {'page_size': 1})
+        cursor = response.data['next'].split('cursor=')[1]
+
+        response = self.client.get(RECIPES_URL, {'cursor': cursor,
+                                                 'ordering': 'price'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_keyset_pagination_invalid_value(self):
+        """Test a cursor with a value that doesn't fit the field is
+        rejected"""
+        sample_recipe(user=self.user)
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(['-price', 'cheap', 1]).encode()
+        ).decode()
+
+        response = self.client.get(RECIPES_URL, {'cursor': cursor,
+                                                 'ordering': '-price'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,128 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe
+
+
+SHOPPING_LIST_URL = reverse('recipe:shopping-list')
+
+
+def sample_recipe(user, ingredients=(), **params):
+    """Create and return a sample recipe with the given ingredients"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class PublicShoppingListAPITests(TestCase):
+    """Test unauthenticated shopping list API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = APIClient().get(SHOPPING_LIST_URL, {'recipes': '1'})
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateShoppingListAPITests(TransactionTestCase):
+    """Test authenticated shopping list API access.
+
+    Lists are only cached once the transactions that wrote the recipes
+    have ended, so these tests commit their writes"""
+
+    def setUp(self):
+        # ids are reused once a test's rows are gone, lists cached by earlier
+        # tests would be found again
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.kale = Ingredient.objects.create(user=self.user, name='Kale')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+    def shopping_list(self, *recipes):
+        response = self.client.get(SHOPPING_LIST_URL, {
+            'recipes': ','.join(str(recipe.id) for recipe in recipes),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_ingredients_combined(self):
+        """Test the ingredients of the recipes are counted once each"""
+        salad = sample_recipe(self.user, [self.kale, self.salt])
+        soup = sample_recipe(self.user, [self.salt], title='Soup')
+        sample_recipe(self.user, [self.kale], title='Not picked')
+
+        empty = sample_recipe(self.user, title='Nothing to buy')
+
+        data = self.shopping_list(salad, soup, empty)
+
+        self.assertEqual(data['recipes'], sorted([salad.id, soup.id,
+                                                  empty.id]))
+        self.assertEqual(data['ingredients'], [
+            {'id': self.kale.id, 'name': 'Kale', 'recipes': 1},
+            {'id': self.salt.id, 'name': 'Salt', 'recipes': 2},
+        ])
+
+    def test_other_users_recipes_ignored(self):
+        """Test recipes of other users and missing ones are left out"""
+        other = get_user_model().objects.create_user('other@test.com',
+                                                     'testpass')
+        pepper = Ingredient.objects.create(user=other, name='Pepper')
+        recipe = sample_recipe(other, [pepper])
+        own = sample_recipe(self.user, [self.kale])
+
+        response = self.client.get(SHOPPING_LIST_URL, {
+            'recipes': '{},{},{}'.format(recipe.id, own.id, own.id + 1000),
+        })
+
+        self.assertEqual(response.data['recipes'], [own.id])
+        self.assertEqual(response.data['ingredients'], [
+            {'id': self.kale.id, 'name': 'Kale', 'recipes': 1},
+        ])
+
+    def test_cached_until_changed(self):
+        """Test lists are cached until the user changes their recipes"""
+        recipes = [sample_recipe(self.user, [self.kale], title=str(i))
+                   for i in range(20)]
+        self.shopping_list(*recipes)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.shopping_list(*recipes)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data['ingredients'][0]['recipes'], 20)
+
+        recipes[0].ingredients.add(self.salt)
+        data = self.shopping_list(*recipes)
+        self.assertEqual(data['ingredients'][1],
+                         {'id': self.salt.id, 'name': 'Salt', 'recipes': 1})
+
+    def test_invalid_recipes(self):
+        """Test the recipes must be a list of ids"""
+        response = self.client.get(SHOPPING_LIST_URL, {'recipes': '1,a'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SHOPPING_LIST_MAX_RECIPES=2)
+    def test_too_many_recipes(self):
+        """Test lists of too many recipes are refused"""
+        response = self.client.get(SHOPPING_LIST_URL, {'recipes': '1,2,3'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,169 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe, RecipeBucket, \
+                        RecipeSignature
+from recipe import similarity
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return the recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Return the similar recipes URL of a recipe"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_recipe(user, ingredients, tags=(), **params):
+    """Create and return a sample recipe with the given ingredients"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.ingredients.set(ingredients)
+    recipe.tags.set(tags)
+    return recipe
+
+
+class SimilarityTests(TestCase):
+
+    def test_signature_estimates_jaccard(self):
+        """Test equal signature values estimate the Jaccard similarity"""
+        first = similarity.signature(range(0, 100))
+        second = similarity.signature(range(50, 150))
+
+        self.assertEqual(len(first), similarity.NUM_HASHES)
+        self.assertTrue((first == similarity.signature(range(100))).all())
+        self.assertAlmostEqual((first == second).mean(), 1 / 3, delta=0.15)
+
+
+class PrivateSimilarAPITests(TestCase):
+    """Test finding similar recipes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=str(i))
+            for i in range(20)
+        ]
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = sample_recipe(self.user, self.ingredients[:8],
+                                    [self.vegan], title='Curry')
+
+    def similar(self, recipe):
+        response = self.client.get(similar_url(recipe.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['recipe']['title'], item['similarity'])
+                for item in response.data]
+
+    def test_identical_recipe_found(self):
+        """Test a recipe with the same tags and ingredients is found"""
+        sample_recipe(self.user, self.ingredients[:8], [self.vegan],
+                      title='Other curry')
+        sample_recipe(self.user, self.ingredients[10:], title='Cake')
+
+        self.assertEqual(self.similar(self.recipe), [('Other curry', 1.0)])
+
+    def test_ranked_by_similarity(self):
+        """Test closer recipes come first"""
+        sample_recipe(self.user, self.ingredients[:6], [self.vegan],
+                      title='Close')
+        sample_recipe(self.user, self.ingredients[:8], [self.vegan],
+                      title='Same')
+
+        titles = [title for title, _ in self.similar(self.recipe)]
+
+        self.assertEqual(titles[0], 'Same')
+
+    def test_signature_follows_changes(self):
+        """Test edits update the recipe's signature"""
+        other = sample_recipe(self.user, self.ingredients[10:],
+                              title='Cake')
+        other.ingredients.set(self.ingredients[:8])
+        other.tags.add(self.vegan)
+
+        self.assertEqual(self.similar(self.recipe), [('Cake', 1.0)])
+
+        self.ingredients[0].delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.similar(self.recipe), [('Cake', 1.0)])
+
+    def test_signature_computed_once_per_save(self):
+        """Test a save changing both relations in several steps computes
+        the signature once"""
+        response = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 10, 'price': '2.00',
+            'tags': [self.vegan.id], 'tag_names': ['Quick'],
+            'ingredient_names': ['Kale', 'Leek'],
+        }, format='json')
+        recipe = Recipe.objects.get(pk=response.data['id'])
+
+        with patch('recipe.similarity._update',
+                   wraps=similarity._update) as update:
+            self.client.patch(detail_url(recipe.id), {
+                'tags': [], 'tag_names': ['Hearty'],
+                'ingredients': [self.ingredients[0].id],
+                'ingredient_names': ['Leek'],
+            }, format='json')
+
+        self.assertEqual(update.call_count, 1)
+        self.assertTrue(
+            RecipeSignature.objects.filter(recipe=recipe).exists()
+        )
+
+    def test_deleted_recipes_skipped(self):
+        """Test recipes deleted after their buckets were read are left
+        out"""
+        same = sample_recipe(self.user, self.ingredients[:8], [self.vegan],
+                             title='Same')
+        gone = sample_recipe(self.user, self.ingredients[:8], title='Gone')
+        matches = [(same.id, 1.0), (gone.id, 0.9)]
+        gone.delete()
+
+        with patch('recipe.similarity.similar', return_value=matches):
+            self.assertEqual(self.similar(self.recipe), [('Same', 1.0)])
+
+    def test_other_users_recipes_ignored(self):
+        """Test only the user's own recipes are suggested"""
+        other = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        sample_recipe(other, self.ingredients[:8], [self.vegan])
+
+        self.assertEqual(self.similar(self.recipe), [])
+
+    def test_rebuild_command(self):
+        """Test the rebuild command restores the signatures"""
+        sample_recipe(self.user, self.ingredients[:8], [self.vegan],
+                      title='Other curry')
+        RecipeSignature.objects.all().delete()
+        RecipeBucket.objects.all().delete()
+
+        call_command('rebuild_similarity', '--chunk-size', '1',
+                     stdout=StringIO())
+
+        self.assertEqual(self.similar(self.recipe), [('Other curry', 1.0)])
@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+STATS_URL = reverse('recipe:stats')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicStatsAPITests(TestCase):
+    """Test unauthenticated stats API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatsAPITests(TestCase):
+    """Test authenticated stats API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_stats_empty(self):
+        """Test stats of a user without recipes"""
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recipes'], 0)
+        self.assertIsNone(response.data['time_minutes']['p50'])
+        self.assertIsNone(response.data['price']['total'])
+        self.assertEqual(response.data['tags'], [])
+
+    def test_stats(self):
+        """Test that aggregates only cover the user's recipes"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='Unused')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        for minutes, price in ((10, 2), (20, 4), (30, 6), (40, 8)):
+            recipe = sample_recipe(self.user, time_minutes=minutes,
+                                   price=price)
+            recipe.tags.add(vegan)
+            recipe.ingredients.add(salt)
+        recipe.tags.add(dessert)
+        other = get_user_model().objects.create_user('o@test.com', 'pass')
+        sample_recipe(other, time_minutes=500, price=100)
+
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.data['recipes'], 4)
+        self.assertEqual(response.data['time_minutes']['avg'], 25)
+        self.assertEqual(response.data['time_minutes']['max'], 40)
+        self.assertEqual(response.data['time_minutes']['p50'], 20)
+        self.assertEqual(response.data['time_minutes']['p90'], 40)
+        self.assertEqual(response.data['price']['total'], '20.00')
+        self.assertEqual(response.data['price']['avg'], '5.00')
+        self.assertEqual(
+            [(tag['name'], tag['recipes'], tag['total_price'])
+             for tag in response.data['tags']],
+            [('Vegan', 4, '20.00'), ('Dessert', 1, '8.00')],
+        )
+        self.assertEqual(response.data['ingredients'][0]['recipes'], 4)
+
+    def test_stats_query_count_fixed(self):
+        """Test that the number of queries doesn't grow with the recipes"""
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(STATS_URL)
+            return len(context)
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        sample_recipe(self.user).tags.add(tag)
+        small = count_queries()
+        for i in range(10):
+            recipe = sample_recipe(self.user)
+            recipe.tags.add(Tag.objects.create(user=self.user, name=str(i)))
+
+        self.assertEqual(count_queries(), small)
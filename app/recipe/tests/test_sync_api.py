@@ -0,0 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Change, Tag, Ingredient, Recipe
+from recipe.sync import parse_cursor
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Kale and Quinoa',
+        'time_minutes': 15,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncAPITests(TestCase):
+    """Test unauthenticated sync API access"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        response = self.client.get(SYNC_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncAPITests(TransactionTestCase):
+    """Test authenticated sync API access.
+
+    Changes are versioned by the id of their transaction on Postgres, so
+    the writes of these tests have to commit one by one like they do in
+    production rather than share the transaction of a TestCase"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def sync(self, since=None):
+        """Sync and return the response data"""
+        params = {} if since is None else {'since': since}
+        response = self.client.get(SYNC_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_full_sync(self):
+        """Test that the first sync returns all of the user's objects"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        sample_recipe(self.user)
+        other = get_user_model().objects.create_user('o@test.com', 'pass')
+        Tag.objects.create(user=other, name='Fruity')
+
+        data = self.sync()
+
+        self.assertTrue(data['full'])
+        self.assertEqual([tag['name'] for tag in data['tags']], ['Vegan'])
+        self.assertEqual(len(data['recipes']), 1)
+        self.assertEqual(parse_cursor(data['cursor'])[0], 0)
+        self.assertGreater(parse_cursor(data['cursor'])[1], 0)
+
+    def test_delta_sync(self):
+        """Test that only objects changed since the cursor are returned"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = sample_recipe(self.user)
+        cursor = self.sync()['cursor']
+
+        pepper = Ingredient.objects.create(user=self.user, name='Pepper')
+        recipe.ingredients.add(pepper)
+        salt_id = salt.id
+        salt.delete()
+
+        data = self.sync(cursor)
+
+        self.assertFalse(data['full'])
+        self.assertEqual(data['tags'], [])
+        self.assertEqual([i['name'] for i in data['ingredients']],
+                         ['Pepper'])
+        self.assertEqual(data['deleted']['ingredients'], [salt_id])
+        self.assertEqual(data['recipes'][0]['ingredients'], [pepper.id])
+        self.assertGreater(parse_cursor(data['cursor']),
+                           parse_cursor(cursor))
+
+    def test_deleted_recipe_tombstone(self):
+        """Test that deleted recipes are reported"""
+        recipe = sample_recipe(self.user)
+        cursor = self.sync()['cursor']
+        recipe_id = recipe.id
+        recipe.delete()
+
+        data = self.sync(cursor)
+
+        self.assertEqual(data['recipes'], [])
+        self.assertEqual(data['deleted']['recipes'], [recipe_id])
+
+    def test_sync_without_changes(self):
+        """Test that a sync without changes is a single query"""
+        sample_recipe(self.user)
+        cursor = self.sync()['cursor']
+        other = get_user_model().objects.create_user('o@test.com', 'pass')
+        sample_recipe(other)
+
+        with CaptureQueriesContext(connection) as context:
+            data = self.sync(cursor)
+
+        self.assertEqual(len(context), 1)
+        self.assertEqual(data['cursor'], cursor)
+        self.assertEqual(data['recipes'], [])
+
+    def test_invalid_cursor(self):
+        """Test that the cursor must be one a sync returned"""
+        response = self.client.get(SYNC_URL, {'since': 'abc'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_legacy_cursor_full_sync(self):
+        """Test that cursors of the change ids used before get everything"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        data = self.sync('1000')
+
+        self.assertTrue(data['full'])
+        self.assertTrue(self.sync('v1000')['full'])
+        self.assertEqual([tag['name'] for tag in data['tags']], ['Vegan'])
+
+    def test_changes_reread_from_horizon(self):
+        """Test that a sync repeats the changes a transaction still running
+        could commit before, instead of skipping past them"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        cursor = self.sync()['cursor']
+        Change.objects.filter(kind=Change.KIND_TAG, object_id=tag.id).update(
+            version=parse_cursor(cursor)[1]
+        )
+
+        data = self.sync(cursor)
+
+        self.assertEqual([t['name'] for t in data['tags']], ['Vegan'])
+
+    def test_change_updated_in_place(self):
+        """Test that every object keeps one change row"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        changes = Change.objects.filter(kind=Change.KIND_TAG,
+                                        object_id=tag.id)
+        version = changes.get().version
+
+        tag.name = 'Vegetarian'
+        tag.save()
+
+        self.assertGreater(changes.get().version, version)
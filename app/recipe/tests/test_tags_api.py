@@ -5,7 +5,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Tag, Recipe
 
 from recipe.serializers import TagSerializer
 
@@ -83,3 +83,40 @@ class PrivateTagsAPITests(TestCase):
         response = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_tag_existing_name(self):
+        """Test that creating a tag with an existing name returns it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.post(TAGS_URL, {'name': 'vegan'})
+
+        self.assertEqual(response.data['id'], tag.id)
+        self.assertEqual(response.data['name'], 'Vegan')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_filter_assigned_only(self):
+        """Test listing only the tags used by a recipe"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Unused')
+        recipe = Recipe.objects.create(user=self.user, title='Salad',
+                                       time_minutes=5, price='1.00')
+        recipe.tags.add(vegan)
+
+        response = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual([tag['id'] for tag in response.data], [vegan.id])
+
+    def test_order_by_popularity(self):
+        """Test listing the most used tags first"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        for title in ('Salad', 'Soup'):
+            recipe = Recipe.objects.create(user=self.user, title=title,
+                                           time_minutes=5, price='1.00')
+            recipe.tags.add(quick)
+        recipe.tags.add(vegan)
+
+        response = self.client.get(TAGS_URL, {'ordering': '-recipe_count'})
+
+        self.assertEqual([tag['id'] for tag in response.data],
+                         [quick.id, vegan.id])
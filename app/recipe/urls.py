@@ -23,4 +23,9 @@ urlpatterns = [
     # now all urls generated will be included in url patterns for the recipe
     # app
     path('', include(router.urls)),
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    path('shopping-list/', views.ShoppingListView.as_view(),
+         name='shopping-list'),
+    path('sync/', views.RecipeSyncView.as_view(), name='sync'),
+    path('events/', views.RecipeEventsView.as_view(), name='events'),
 ]
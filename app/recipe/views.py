@@ -1,28 +1,60 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
 # DRF feature that allows us to pull in certain parts of a view setter
-from rest_framework import viewsets, mixins
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 # This class will authenticate all incoming requests
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core import media, sharding, tasks
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from core.profiling import ProfiledViewMixin
+from job.serializers import JobSerializer
+from recipe import events, matching, serializers, similarity
+from recipe.filters import RecipeRangeFilter
+from recipe.pagination import KeysetPagination
+from recipe.shopping import shopping_list
+from recipe.stats import recipe_stats
+from recipe.sync import parse_cursor, sync
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ProfiledViewMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication, )
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
     permission_classes = (IsAuthenticated, )
+    # ?ordering=-recipe_count lists the most used first, off an index of
+    # the maintained counts
+    filter_backends = (OrderingFilter, )
+    ordering_fields = ('name', 'recipe_count')
 
     def get_queryset(self):
-        """Return objects for the currently authenticated user only"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        """Return objects for the currently authenticated user only,
+        optionally only those used by a recipe"""
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.request.query_params.get('assigned_only') in ('1', 'true'):
+            queryset = queryset.filter(recipe_count__gt=0)
+        return queryset.order_by('-name')
 
     def perform_create(self, serializer):
-        """Create a new object"""
-        serializer.save(user=self.request.user)
+        """Create a new object, or use the user's existing object with the
+        same name so no duplicates are created"""
+        manager = self.queryset.model.objects
+        serializer.instance, _ = manager.get_or_create_by_name(
+            self.request.user.pk, serializer.validated_data['name'],
+        )
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -37,13 +69,219 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     """Manage recipes in database"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication, )
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
     permission_classes = (IsAuthenticated, )
+    filter_backends = (RecipeRangeFilter, OrderingFilter)
+    # price and time lead indexes with the user, see core.models.Recipe
+    ordering_fields = ('id', 'title', 'price', 'time_minutes')
+    ordering = ('-id', )
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user"""
-        return self.queryset.filter(user=self.request.user)
+        return self.queryset.filter(user=self.request.user).prefetch_related(
+            'tags', 'ingredients'
+        )
+
+    def perform_create(self, serializer):
+        """Create a new recipe"""
+        serializer.save(user=self.request.user)
+
+    def _change_related(self, request, field, serializer_class):
+        """Add the posted tags or ingredients to the recipe or remove the
+        ones given in a DELETE request"""
+        recipe = self.get_object()
+        serializer = serializer_class(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = [obj.pk for obj in serializer.validated_data[field]]
+
+        if request.method == 'DELETE':
+            recipe.remove_related(field, ids)
+        else:
+            recipe.add_related(field, ids)
+
+        return Response(self.get_serializer(recipe).data)
+
+    @action(detail=True, methods=['post', 'delete'])
+    def tags(self, request, pk=None):
+        """Add tags to or remove tags from a recipe"""
+        return self._change_related(request, 'tags',
+                                    serializers.RecipeTagsSerializer)
+
+    @action(detail=True, methods=['post', 'delete'])
+    def ingredients(self, request, pk=None):
+        """Add ingredients to or remove ingredients from a recipe"""
+        return self._change_related(request, 'ingredients',
+                                    serializers.RecipeIngredientsSerializer)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Return the recipes with the most tags and ingredients in common
+        with this one"""
+        matches = similarity.similar(self.get_object())
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in matches]
+        )
+
+        # recipes deleted since their buckets were read are left out
+        return Response([
+            {
+                'recipe': self.get_serializer(recipes[recipe_id]).data,
+                'similarity': round(score, 3),
+            }
+            for recipe_id, score in matches
+            if recipe_id in recipes
+        ])
+
+    @action(detail=False, methods=['get'])
+    def match(self, request):
+        """Rank the recipes that can be made with the given ingredients,
+        or with at most `missing` more"""
+        serializer = serializers.RecipeMatchQuerySerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        matches = matching.match(request.user, **serializer.validated_data)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in matches]
+        )
+
+        # recipes deleted since the index was read are left out
+        return Response([
+            {
+                'recipe': self.get_serializer(recipes[recipe_id]).data,
+                'missing': missing,
+            }
+            for recipe_id, missing in matches
+            if recipe_id in recipes
+        ])
+
+    @action(detail=True, methods=['post'], url_path='upload-image',
+            parser_classes=(MultiPartParser, ))
+    def upload_image(self, request, pk=None):
+        """Store the image of a recipe and queue making its thumbnails"""
+        # the upload is written to a temporary file as it arrives and
+        # hashed on the way, so it is never held in memory or read twice
+        request.upload_handlers = [media.HashingUploadHandler(request)]
+        recipe = self.get_object()
+
+        # a rough check that saves receiving uploads that are far too big
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length > 2 * settings.RECIPE_IMAGE_MAX_BYTES:
+            return Response(
+                {'detail': 'Images can be at most {} bytes'.format(
+                    settings.RECIPE_IMAGE_MAX_BYTES
+                )},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        serializer = serializers.RecipeImageSerializer(
+            recipe, data=request.data,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        tasks.enqueue('recipe.thumbnails', user=request.user,
+                      recipe=recipe.pk)
+
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def export(self, request):
+        """Queue an export of all of the user's recipes"""
+        job = tasks.enqueue('recipe.export', user=request.user)
+        return Response(JobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_recipes(self, request):
+        """Queue the creation of a list of recipes"""
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of recipes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        job = tasks.enqueue('recipe.import', user=request.user,
+                            recipes=request.data)
+        return Response(JobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class RecipeStatsView(ProfiledViewMixin, APIView):
+    """Aggregated statistics over the recipes of the authenticated user"""
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """Return recipe statistics computed by the database"""
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+        except ValueError:
+            return Response({'limit': 'Must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(recipe_stats(request.user, limit=max(limit, 0)))
+
+
+class ShoppingListView(ProfiledViewMixin, APIView):
+    """Combined ingredients of a selection of the authenticated user's
+    recipes"""
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """Return the ingredients of the recipes given by `recipes` with
+        how many of them use each one"""
+        serializer = serializers.ShoppingListQuerySerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+
+        return Response(shopping_list(
+            request.user, serializer.validated_data['recipes']
+        ))
+
+
+class RecipeSyncView(ProfiledViewMixin, APIView):
+    """Changes to the tags, ingredients and recipes of the authenticated user
+    for clients that keep an offline copy"""
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """Return what changed since the `since` cursor"""
+        since = request.query_params.get('since')
+        try:
+            cursor = parse_cursor(since) if since else None
+        except ValueError:
+            return Response({'since': 'Must be a cursor of an earlier sync'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(sync(request.user, cursor))
+
+
+class RecipeEventsView(ProfiledViewMixin, APIView):
+    """Server-sent events telling the authenticated user's clients to sync.
+    Served from the event loop by recipe.events.EventStream under ASGI,
+    this view polls the Change log for other servers"""
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated, )
+    renderer_classes = (JSONRenderer, events.EventStreamRenderer)
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            events.poll(request, sharding.current()),
+            content_type=events.EventStreamRenderer.media_type,
+        )
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -2,6 +2,9 @@ from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from core import sharding
+from core.models import UserShard
+
 
 class UserSerializer(serializers.ModelSerializer):
     """serializer for the users object"""
@@ -20,6 +23,22 @@ class UserSerializer(serializers.ModelSerializer):
         # This will add extra parameters to the password CharField field
         extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
 
+    def validate_email(self, value):
+        """With sharding, other shards may hold a user with the email, so
+        the directory is checked as well"""
+        if not sharding.enabled():
+            return value
+
+        entries = UserShard.objects.filter(email=value)
+        if self.instance is not None:
+            entries = entries.exclude(pk=self.instance.pk)
+        if entries.exists():
+            raise serializers.ValidationError(
+                _('user with this email address already exists.'),
+                code='unique'
+            )
+        return value
+
     def create(self, validated_data):
         """Create a new user with encrypted password and return it"""
         return get_user_model().objects.create_user(**validated_data)
@@ -32,10 +51,13 @@ class UserSerializer(serializers.ModelSerializer):
         # after we remove the password, we can call the parent class .update
         # method.
         user = super().update(instance, validated_data)
+        if 'email' in validated_data:
+            sharding.rename(user)
 
         if password:
             user.set_password(password)
             user.save()
+            user.revoke_signed_tokens()
 
         return user
 
@@ -47,6 +69,8 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    # issue signed access and refresh tokens instead of a token key
+    signed = serializers.BooleanField(default=False)
 
     def validate(self, attrs):
         """Validate and authenticate the user"""
@@ -67,3 +91,8 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for exchanging a refresh token"""
+    refresh = serializers.CharField()
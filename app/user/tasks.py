@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+
+from core import deletion
+from core.tasks import task
+
+
+@task('user.delete')
+def delete_user(job, user_id):
+    """Delete a user together with all of their recipes, tags and
+    ingredients"""
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        return {'deleted': {}}
+
+    return {'deleted': deletion.delete_user(user)}
@@ -88,6 +88,32 @@ class PublicUsersAPITests(TestCase):
         self.assertIn('token', response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_create_token_rotates_token(self):
+        """Test that signing in again replaces the previous token"""
+        payload = {'email': 'ari@test.com', 'password': 'testpass'}
+        create_user(**payload)
+        first = self.client.post(TOKEN_URL, payload).data['token']
+        second = self.client.post(TOKEN_URL, payload).data['token']
+
+        self.assertNotEqual(first, second)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + first)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + second)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_create_signed_tokens(self):
+        """Test that signed access and refresh tokens can be requested"""
+        payload = {'email': 'ari@test.com', 'password': 'testpass'}
+        create_user(**payload)
+        response = self.client.post(TOKEN_URL, dict(payload, signed=True))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertIn('refresh', response.data)
+        self.assertNotIn('token', response.data)
+
     def test_create_token_invalid_credentials(self):
         """Test that token is not created if invalid credentials are given"""
         create_user(email='test@test.com', password='testpass')
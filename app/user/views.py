@@ -1,10 +1,19 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
-from user.serializers import UserSerializer, AuthTokenSerializer
 
+from core import tasks
+from core.authentication import ExpiringTokenAuthentication, \
+                                SignedTokenAuthentication, \
+                                issue_signed_tokens, refresh_signed_tokens
+from core.models import AuthToken
+from core.profiling import ProfiledViewMixin
+from user.serializers import UserSerializer, AuthTokenSerializer, \
+                             RefreshTokenSerializer
 
-class CreateUserView(generics.CreateAPIView):
+
+class CreateUserView(ProfiledViewMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     # this class will handle all of the incoming requests. It will both
     # validate and serialize the request data into Python objects
@@ -13,24 +22,70 @@ class CreateUserView(generics.CreateAPIView):
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(ProfiledViewMixin, ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """Issue a new token, which replaces the user's previous one, or
+        signed access and refresh tokens when `signed` is set"""
+        serializer = self.serializer_class(data=request.data,
+                                           context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        if serializer.validated_data['signed']:
+            return Response(issue_signed_tokens(user))
+
+        key, token = AuthToken.objects.rotate(user)
+        return Response({'token': key, 'expires': token.expires})
+
+
+class RefreshTokenView(ProfiledViewMixin, generics.GenericAPIView):
+    """Exchange a refresh token for new signed tokens"""
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = ()
+    permission_classes = ()
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+    def get_authenticate_header(self, request):
+        # answer invalid refresh tokens with 401 instead of 403
+        return SignedTokenAuthentication.keyword
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(
+            refresh_signed_tokens(serializer.validated_data['refresh'])
+        )
+
+
+class ManageUserView(ProfiledViewMixin,
+                     generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
     # this is where the authentication happens. This class will take care of
     # getting the authenicated user by using the incoming request object.
     # this will create self.request which will contain the user.
     # self.request.user
-    authentication_classes = (authentication.TokenAuthentication, )
+    authentication_classes = (ExpiringTokenAuthentication,
+                              SignedTokenAuthentication)
     # this defines the level of access that the user will have
     permission_classes = (permissions.IsAuthenticated, )
 
     # overriding base class method to just return the user
     def get_object(self):
         """Retrieve the authenticated user object"""
-        return self.request.user
+        user = self.request.user
+        # signed tokens only carry some of the fields, load the rest at once
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
+
+    def perform_destroy(self, instance):
+        """Deactivate the user right away and leave deleting their data to
+        a background job"""
+        instance.is_active = False
+        instance.save(update_fields=['is_active'])
+        instance.revoke_signed_tokens()
+        tasks.enqueue('user.delete', user=instance, user_id=instance.id)